@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import WeatherSearch
+from .models import Observation, WeatherSearch
 
 
 @admin.register(WeatherSearch)
@@ -9,13 +9,26 @@ class WeatherSearchAdmin(admin.ModelAdmin):
         'city',
         'country',
         'user',
-        'condition_main',
-        'temperature_c',
-        'humidity',
-        'wind_speed_kph',
+        'observation',
         'searched_at',
         'is_deleted_by_user',
     )
-    list_filter = ('condition_main', 'is_deleted_by_user', 'searched_at')
+    list_filter = ('observation__condition_main', 'is_deleted_by_user', 'searched_at')
+    list_select_related = ('user', 'observation')
     search_fields = ('city', 'country', 'user__username', 'user__email')
 
+
+@admin.register(Observation)
+class ObservationAdmin(admin.ModelAdmin):
+    list_display = (
+        'city',
+        'country',
+        'observed_at',
+        'fetched_at',
+        'condition_main',
+        'temperature_c',
+        'humidity',
+        'wind_speed_kph',
+    )
+    list_filter = ('condition_main', 'observed_at')
+    search_fields = ('city', 'country')
@@ -0,0 +1,380 @@
+"""Batch evaluation of weather alerts.
+
+Alerts are grouped by location and, per location, each numeric rule keeps its
+thresholds in a sorted array. One observation then selects every triggered
+alert of a rule with a single bisect instead of comparing alert by alert, and
+severe conditions are matched once per observation rather than once per alert.
+
+The same arrays give each location's margin: how far its readings are from
+the nearest threshold. `check_interval` turns the margin into how long the
+location can go unchecked.
+"""
+from __future__ import annotations
+
+import re
+import time
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Protocol
+
+from .models import AlertPreference
+
+# OWM condition codes (https://openweathermap.org/weather-conditions):
+# 2xx thunderstorm, 6xx snow, 7xx atmosphere (mist, haze, dust, fog, sand, ash,
+# squall, tornado). As with the keyword fallback, sleet (611-613) and smoke
+# (711) are not treated as severe.
+SEVERE_CONDITION_RANGES = ((200, 299), (600, 602), (615, 622), (701, 701), (721, 781))
+
+# Rain and drizzle often precede thunderstorms: locations with condition
+# alerts are checked more often while it rains.
+UNSETTLED_CONDITION_RANGES = ((300, 599),)
+
+# Distance from a threshold, per rule field, that counts as one unit of margin.
+MARGIN_SCALES = {
+    'temperature_threshold': 3.0,
+    'low_temperature_threshold': 3.0,
+    'humidity_threshold': 10.0,
+    'wind_speed_threshold': 10.0,
+}
+
+# Fallback for observations without a condition code.
+SEVERE_CONDITION_PATTERN = re.compile(
+    r"thunderstorm|snow|mist|fog|haze|dust|sand|ash|squall|tornado",
+    re.IGNORECASE,
+)
+
+
+class ObservationLike(Protocol):
+    temperature_c: object
+    humidity: object
+    wind_speed_kph: object
+    condition_id: int | None
+    condition_main: str
+    condition_description: str
+
+
+def is_severe_condition(condition_id: int | None, description: str = "") -> bool:
+    """True for OWM thunderstorm/snow/atmosphere codes, or a matching description."""
+    if condition_id:
+        return any(low <= condition_id <= high for low, high in SEVERE_CONDITION_RANGES)
+    return bool(description and SEVERE_CONDITION_PATTERN.search(description))
+
+
+def is_unsettled_condition(condition_id: int | None) -> bool:
+    return bool(condition_id) and any(low <= condition_id <= high for low, high in UNSETTLED_CONDITION_RANGES)
+
+
+def location_query(city: str, country: str = "") -> str:
+    """The weather query for a location: 'City' or 'City,Country'."""
+    city = (city or "").strip()
+    if city and country:
+        return f"{city},{country.strip()}"
+    return city
+
+
+def alert_location_key(alert: AlertPreference) -> str:
+    """The weather query for an alert: 'City' or 'City,Country'."""
+    return location_query(alert.city, alert.country)
+
+
+def _as_float(value) -> float | None:
+    return None if value is None else float(value)
+
+
+def _format_number(value: float) -> str:
+    return f"{value:g}"
+
+
+def observation_readings(observation: ObservationLike) -> dict[str, float | None]:
+    """An observation's readings keyed by the threshold field they are compared with."""
+    return {
+        'temperature_threshold': _as_float(observation.temperature_c),
+        'low_temperature_threshold': _as_float(observation.temperature_c),
+        'humidity_threshold': _as_float(observation.humidity),
+        'wind_speed_threshold': _as_float(observation.wind_speed_kph),
+    }
+
+
+def check_interval(
+    margin: float | None,
+    min_interval: float,
+    max_interval: float,
+    previous_margin: float | None = None,
+    elapsed: float | None = None,
+) -> float:
+    """Seconds until a location with ``margin`` should be checked again.
+
+    Each unit of margin doubles the interval, from ``min_interval`` up to
+    ``max_interval``. If the margin shrank since the previous check,
+    ``elapsed`` seconds ago, the next check comes before the threshold could
+    be reached at that rate. No margin (nothing to measure) waits the maximum.
+    """
+    if margin is None:
+        return max_interval
+    interval = min_interval * 2 ** min(margin, 16)
+    if previous_margin is not None and elapsed and margin < previous_margin:
+        time_to_threshold = margin * elapsed / (previous_margin - margin)
+        interval = min(interval, time_to_threshold / 2)
+    return max(min_interval, min(interval, max_interval))
+
+
+class ThresholdRule:
+    """Alerts sorted by one numeric threshold.
+
+    ``above`` rules trigger when the reading is at or above the threshold,
+    the others when it is at or below it.
+    """
+
+    def __init__(self, field: str, above: bool, message: str, unit: str):
+        self.field = field
+        self.above = above
+        self.message = message
+        self.unit = unit
+        self.values: list[float] = []
+        self.labels: list[str] = []
+        self.positions: list[int] = []
+        self._pending: list[tuple[float, int]] = []
+
+    def add(self, position: int, value) -> None:
+        if value is not None:
+            self._pending.append((float(value), position))
+
+    def freeze(self) -> None:
+        self._pending.sort()
+        self.values = [value for value, _ in self._pending]
+        self.labels = [_format_number(value) + self.unit for value in self.values]
+        self.positions = [position for _, position in self._pending]
+        self._pending = []
+
+    def distance(self, reading: float | None) -> float | None:
+        """How far ``reading`` is from triggering any alert of the rule; 0 if it triggers one."""
+        if reading is None or not self.values:
+            return None
+        if self.above:
+            return max(0.0, self.values[0] - reading)
+        return max(0.0, reading - self.values[-1])
+
+    def triggered(self, reading: float | None) -> tuple[list[str], list[int]]:
+        """Formatted thresholds and alert positions of every alert the reading triggers."""
+        if reading is None or not self.values:
+            return [], []
+        if self.above:
+            end = bisect_right(self.values, reading)
+            return self.labels[:end], self.positions[:end]
+        start = bisect_left(self.values, reading)
+        return self.labels[start:], self.positions[start:]
+
+
+class LocationRules:
+    """All alert rules for one location."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.alerts: list[AlertPreference] = []
+        self.condition_positions: list[int] = []
+        self.rules = (
+            ThresholdRule('temperature_threshold', True, "Temperature {reading}C reached threshold ", "C"),
+            ThresholdRule('low_temperature_threshold', False, "Temperature {reading}C dropped to threshold ", "C"),
+            ThresholdRule('humidity_threshold', True, "Humidity {reading}% reached threshold ", "%"),
+            ThresholdRule('wind_speed_threshold', True, "Wind speed {reading} km/h reached threshold ", " km/h"),
+        )
+
+    def add(self, alert: AlertPreference) -> None:
+        position = len(self.alerts)
+        self.alerts.append(alert)
+        for rule in self.rules:
+            rule.add(position, getattr(alert, rule.field))
+        if alert.condition_alerts:
+            self.condition_positions.append(position)
+
+    def freeze(self) -> None:
+        for rule in self.rules:
+            rule.freeze()
+
+    def evaluate(self, observation: ObservationLike) -> list[tuple[AlertPreference, str]]:
+        """Return ``(alert, reason)`` for every triggered alert, in insertion order."""
+        condition_desc = observation.condition_description or observation.condition_main or ""
+        severe = is_severe_condition(observation.condition_id, condition_desc)
+        return self.evaluate_readings(observation_readings(observation), severe, f"Severe weather condition: {condition_desc}")
+
+    def margin(self, readings: dict[str, float | None], severe: bool, unsettled: bool = False) -> float | None:
+        """Distance, in MARGIN_SCALES units, from the nearest alert trigger; None if unmeasurable."""
+        if self.condition_positions:
+            if severe:
+                return 0.0
+            if unsettled:
+                return 1.0
+        margins = [
+            distance / MARGIN_SCALES[rule.field]
+            for rule in self.rules
+            if (distance := rule.distance(readings[rule.field])) is not None
+        ]
+        return min(margins, default=None)
+
+    def observation_margin(self, observation: ObservationLike) -> float | None:
+        condition_desc = observation.condition_description or observation.condition_main or ""
+        return self.margin(
+            observation_readings(observation),
+            is_severe_condition(observation.condition_id, condition_desc),
+            is_unsettled_condition(observation.condition_id),
+        )
+
+    def evaluate_readings(
+        self,
+        readings: dict[str, float | None],
+        severe: bool,
+        severe_reason: str,
+        prefix: str = "",
+    ) -> list[tuple[AlertPreference, str]]:
+        """Evaluate precomputed readings, keyed by threshold field name."""
+        reasons: dict[int, list[str]] = {}
+        for rule in self.rules:
+            reading = readings[rule.field]
+            labels, positions = rule.triggered(reading)
+            if not positions:
+                continue
+            head = prefix + rule.message.format(reading=_format_number(reading))
+            for label, position in zip(labels, positions):
+                if position in reasons:
+                    reasons[position].append(head + label)
+                else:
+                    reasons[position] = [head + label]
+
+        if self.condition_positions and severe:
+            reason = prefix + severe_reason
+            for position in self.condition_positions:
+                reasons.setdefault(position, []).append(reason)
+
+        alerts = self.alerts
+        return [(alerts[position], " | ".join(reasons[position])) for position in sorted(reasons)]
+
+
+def summarize_forecast(series: list[dict], hours: int, now: float | None = None) -> dict | None:
+    """Extremes of a parsed forecast series over the next ``hours`` hours.
+
+    Returns None when no forecast slot falls inside the horizon.
+    """
+    now = time.time() if now is None else now
+    horizon = now + hours * 3600
+    slots = [slot for slot in series if now - 3 * 3600 < slot['dt'] <= horizon]
+    if not slots:
+        return None
+
+    def extreme(pick, field):
+        values = [slot for slot in slots if slot[field] is not None]
+        return pick(values, key=lambda slot: slot[field]) if values else None
+
+    hottest = extreme(max, 'temp')
+    coldest = extreme(min, 'temp')
+    most_humid = extreme(max, 'humidity')
+    windiest = extreme(max, 'wind_speed_kph')
+    severe = next(
+        (slot for slot in slots if is_severe_condition(slot['condition_id'], slot['description'])),
+        None,
+    )
+    return {
+        'readings': {
+            'temperature_threshold': hottest and hottest['temp'],
+            'low_temperature_threshold': coldest and coldest['temp'],
+            'humidity_threshold': most_humid and most_humid['humidity'],
+            'wind_speed_threshold': windiest and windiest['wind_speed_kph'],
+        },
+        'severe': severe,
+    }
+
+
+class AlertIndex:
+    """Active alerts grouped by location, ready to evaluate against observations.
+
+    Alerts with ``forecast_hours`` are additionally indexed per horizon so a
+    location's forecast is summarized once per horizon, not once per alert.
+    """
+
+    def __init__(self, alerts: Iterable[AlertPreference]):
+        self.locations: dict[str, LocationRules] = {}
+        self.forecast_locations: dict[str, dict[int, LocationRules]] = {}
+        for alert in alerts:
+            self.add(alert)
+        self.freeze()
+
+    def add(self, alert: AlertPreference) -> None:
+        query = alert_location_key(alert)
+        if not alert.is_active or not query:
+            return
+        key = query.lower()
+        if key not in self.locations:
+            self.locations[key] = LocationRules(query)
+        self.locations[key].add(alert)
+        if alert.forecast_hours:
+            horizons = self.forecast_locations.setdefault(key, {})
+            if alert.forecast_hours not in horizons:
+                horizons[alert.forecast_hours] = LocationRules(query)
+            horizons[alert.forecast_hours].add(alert)
+
+    def freeze(self) -> None:
+        for rules in self.locations.values():
+            rules.freeze()
+        for horizons in self.forecast_locations.values():
+            for rules in horizons.values():
+                rules.freeze()
+
+    def forecast_queries(self) -> list[str]:
+        """Weather queries whose forecast is needed by at least one alert."""
+        return [self.locations[key].query for key in self.forecast_locations]
+
+    def evaluate_forecast(self, query: str, series: list[dict], now: float | None = None) -> list[tuple[AlertPreference, str]]:
+        """Evaluate forecast-horizon alerts of a location against its parsed forecast series."""
+        triggered: list[tuple[AlertPreference, str]] = []
+        for hours, rules in self.forecast_locations.get(query.lower(), {}).items():
+            summary = summarize_forecast(series, hours, now)
+            if summary is None:
+                continue
+            severe = summary['severe']
+            severe_reason = f"{severe['description']} expected" if severe else ""
+            triggered.extend(rules.evaluate_readings(
+                summary['readings'],
+                severe is not None,
+                severe_reason,
+                prefix=f"Forecast (next {hours}h): ",
+            ))
+        return triggered
+
+    def forecast_slots_added(self, query: str, series: list[dict], since: float, now: float | None = None) -> bool:
+        """True if a forecast slot entered one of the location's horizons between ``since`` and ``now``.
+
+        The horizons move forward with time, so a forecast already evaluated
+        can still bring new slots into range without being reissued.
+        """
+        now = time.time() if now is None else now
+        for hours in self.forecast_locations.get(query.lower(), {}):
+            start = max(since + hours * 3600, now - 3 * 3600)
+            end = now + hours * 3600
+            if any(start < slot['dt'] <= end for slot in series):
+                return True
+        return False
+
+    def forecast_margin(self, query: str, series: list[dict], now: float | None = None) -> float | None:
+        """Smallest margin of a location's forecast-horizon alerts against its forecast."""
+        margins = []
+        for hours, rules in self.forecast_locations.get(query.lower(), {}).items():
+            summary = summarize_forecast(series, hours, now)
+            if summary is not None:
+                margins.append(rules.margin(summary['readings'], summary['severe'] is not None))
+        return min((margin for margin in margins if margin is not None), default=None)
+
+    def queries(self) -> list[str]:
+        """Weather queries to fetch, one per location."""
+        return [rules.query for rules in self.locations.values()]
+
+    def evaluate(self, query: str, observation: ObservationLike) -> list[tuple[AlertPreference, str]]:
+        rules = self.locations.get(query.lower())
+        if rules is None:
+            return []
+        return rules.evaluate(observation)
+
+    def evaluate_all(self, observations: dict[str, ObservationLike | None]) -> list[tuple[AlertPreference, str]]:
+        """Evaluate every location with an observation in ``observations`` (keyed by query)."""
+        triggered: list[tuple[AlertPreference, str]] = []
+        for query, observation in observations.items():
+            if observation is not None:
+                triggered.extend(self.evaluate(query, observation))
+        return triggered
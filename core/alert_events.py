@@ -0,0 +1,132 @@
+"""Evaluate alerts as soon as a new observation is stored.
+
+`store_observation` sends `observation_stored` for every observation with a
+new upstream `dt`, whatever fetched it: a dashboard search, a saved location,
+the live feed or the cache warmer. The alerts of that location, found through
+a cached location -> alert ids index, are then evaluated on a background
+worker, so searches feed alerting and the cron only has to sweep locations
+nobody has looked at recently.
+
+The workers are not daemon threads: when the process exits (the end of a
+management command, a recycled server worker) evaluations already queued run
+to completion rather than stopping between recording a trigger and
+delivering it. Short-lived commands can `drain` them explicitly.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .alert_engine import location_query
+from .models import AlertPreference, Observation
+
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_KEY = 'alerts:location_index'
+INDEX_TTL = 300
+
+_suppressed: ContextVar[bool] = ContextVar('alert_events_suppressed', default=False)
+
+_pool = ThreadPoolExecutor(max_workers=settings.ALERT_EVENTS_WORKERS, thread_name_prefix='alert-event')
+_pending: set[Future] = set()
+_pending_lock = threading.Lock()
+
+
+@contextmanager
+def suppressed():
+    """Don't send observations stored in the block to alert evaluation.
+
+    Used by an alert run around its own fetches, which it evaluates itself.
+    """
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def location_index() -> dict[str, list[int]]:
+    """Active alert ids keyed by lowercased location query."""
+    index = cache.get(INDEX_CACHE_KEY)
+    if index is None:
+        index = {}
+        for pk, city, country in AlertPreference.objects.filter(is_active=True).values_list('pk', 'city', 'country'):
+            query = location_query(city, country)
+            if query:
+                index.setdefault(query.lower(), []).append(pk)
+        cache.set(INDEX_CACHE_KEY, index, INDEX_TTL)
+    return index
+
+
+def invalidate_index() -> None:
+    cache.delete(INDEX_CACHE_KEY)
+
+
+def observation_queries(observation: Observation) -> list[str]:
+    """Lowercased location queries an observation answers.
+
+    'city' and 'city,cc' by the provider's name, plus the query it was
+    fetched with when that differs (an alias or another spelling).
+    """
+    queries = [observation.city_key]
+    if observation.country:
+        queries.append(f"{observation.city_key},{observation.country.lower()}")
+    if observation.query_key and observation.query_key not in queries:
+        queries.append(observation.query_key)
+    return queries
+
+
+def evaluate(observation: Observation, alert_ids: list[int]) -> None:
+    """Run alert processing for one location against ``observation``.
+
+    Skipped if another run (the cron, or another event) is processing the
+    location already.
+    """
+    from .alert_runner import AlertRun
+
+    alerts = AlertPreference.objects.filter(pk__in=alert_ids, is_active=True).select_related('user')
+    observations = dict.fromkeys(observation_queries(observation), observation)
+    AlertRun(write=logger.info).run(alerts=alerts, observations=observations, pending=False)
+
+
+def on_observation_stored(observation: Observation) -> None:
+    """Start evaluating the observation's alerts in the background, if it has any."""
+    if not settings.ALERT_EVENTS_ENABLED or _suppressed.get():
+        return
+    index = location_index()
+    alert_ids = [pk for query in observation_queries(observation) for pk in index.get(query, ())]
+    if not alert_ids:
+        return
+
+    def target():
+        try:
+            evaluate(observation, alert_ids)
+        except Exception:
+            logger.exception("Alert evaluation for %s failed", observation.city)
+        finally:
+            connections.close_all()
+
+    future = _pool.submit(target)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_finished)
+
+
+def _finished(future: Future) -> None:
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def drain(timeout: float | None = None) -> bool:
+    """Wait for the evaluations started so far; False if some were still running at ``timeout``."""
+    with _pending_lock:
+        pending = list(_pending)
+    _done, not_done = wait(pending, timeout)
+    return not not_done
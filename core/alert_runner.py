@@ -0,0 +1,416 @@
+"""One pass of alert processing: check, evaluate, record and deliver.
+
+`manage.py process_alerts` runs it over every due location; `alert_events`
+runs it for a single location as soon as a new observation is stored.
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timedelta
+from typing import Callable
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.utils import timezone as dj_timezone
+
+from . import alert_events, metrics
+from .alert_engine import AlertIndex, LocationRules, alert_location_key, check_interval
+from .models import AlertHistory, AlertPreference, AlertSchedule, Observation, UserSetting
+from .views import fetch_observation, get_forecast_series, send_alert_digest_email, send_alert_email
+
+
+# Minimum time between two digest emails to the same user, per delivery mode.
+DIGEST_INTERVALS = {
+    'run': timedelta(0),
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+}
+
+
+# Locations due this soon are checked now, so cron jitter cannot push a check
+# back by a whole tick.
+SCHEDULE_SLACK = timedelta(seconds=60)
+
+# A run holds a lock on each location it evaluates until its triggers are
+# delivered, so the cron and alert_events never process one location at the
+# same time. The TTL only matters if the process dies holding it.
+LOCATION_LOCK_TTL = 300
+
+
+def alerts_changed(rules: LocationRules, schedule: AlertSchedule | None) -> bool:
+    """True if the location has not been checked yet or one of its alerts changed since."""
+    if schedule is None or schedule.last_checked_at is None:
+        return True
+    return any(alert.updated_at > schedule.last_checked_at for alert in rules.alerts)
+
+
+def location_due(rules: LocationRules, schedule: AlertSchedule | None, now: datetime) -> bool:
+    """True if the location's scheduled check has come, or one of its alerts changed since the last one."""
+    if alerts_changed(rules, schedule):
+        return True
+    return schedule.next_check_at <= now + SCHEDULE_SLACK
+
+
+def digest_due(user_setting: UserSetting, now: datetime) -> bool:
+    """True if the user's pending triggers should be emailed now."""
+    interval = DIGEST_INTERVALS.get(user_setting.alert_delivery, timedelta(0))
+    last_sent = user_setting.last_digest_sent_at
+    return last_sent is None or now - last_sent >= interval
+
+
+def location_lock_key(key: str) -> str:
+    # Hashed: queries contain spaces and commas, which memcached rejects, and
+    # sanitizing them could make two locations share a lock.
+    return f"alerts:evaluating:{hashlib.md5(key.encode()).hexdigest()}"
+
+
+class AlertRun:
+    def __init__(self, write: Callable[[str], None] | None = None):
+        self.write = write or (lambda message: None)
+        self.held: list[str] = []
+
+    def claim_location(self, key: str) -> bool:
+        """Lock the location for this run; False if another run is processing it."""
+        if key in self.held:
+            return True
+        if not cache.add(location_lock_key(key), 1, LOCATION_LOCK_TTL):
+            return False
+        self.held.append(key)
+        return True
+
+    def release_locations(self) -> None:
+        cache.delete_many([location_lock_key(key) for key in self.held])
+        self.held.clear()
+
+    def run(
+        self,
+        alerts: QuerySet[AlertPreference] | None = None,
+        observations: dict[str, Observation] | None = None,
+        pending: bool = True,
+    ) -> None:
+        """Evaluate ``alerts`` (default: every active alert) and deliver what triggers.
+
+        ``observations``, keyed by lowercased location query, are evaluated
+        as given instead of checking and fetching scheduled locations.
+        ``pending`` also sends what earlier runs left undelivered: alert
+        emails that failed and every digest email that is due. Locations
+        another run is processing are left to it.
+        """
+        try:
+            self.process(alerts, observations, pending)
+        finally:
+            self.release_locations()
+
+    def process(self, alerts, observations, pending) -> None:
+        """`run`, with the locations it claims still held when it returns."""
+        if alerts is None:
+            alerts = AlertPreference.objects.filter(is_active=True).select_related('user')
+        if not alerts.exists():
+            self.write("No active alerts.")
+            return
+
+        allowed_usernames = {u.strip() for u in django_settings.ALERT_ALLOWED_USERNAMES if u.strip()}
+        allowed_emails = {e.strip().lower() for e in django_settings.ALERT_ALLOWED_EMAILS if e.strip()}
+        restrict_alerts = bool(allowed_usernames or allowed_emails)
+
+        email_configured = bool(
+            django_settings.EMAIL_HOST
+            and django_settings.EMAIL_HOST_USER
+            and django_settings.EMAIL_HOST_PASSWORD
+        )
+        if not email_configured:
+            self.write(
+                "Email is not configured. Set EMAIL_HOST_USER and EMAIL_HOST_PASSWORD to send Gmail alerts."
+            )
+
+        user_settings_cache: dict[int, UserSetting] = {}
+        processed = 0
+        triggered = 0
+        errors = 0
+        skipped = 0
+
+        def user_setting(user) -> UserSetting:
+            if user.id not in user_settings_cache:
+                user_settings_cache[user.id] = UserSetting.objects.get_or_create(user=user)[0]
+            return user_settings_cache[user.id]
+
+        def receives_alerts(user) -> bool:
+            if not user.is_active:
+                return False
+            if restrict_alerts:
+                email = (user.email or "").strip().lower()
+                if (user.username not in allowed_usernames) and (email not in allowed_emails):
+                    return False
+            return user_setting(user).enable_all_alerts
+
+        eligible: list[AlertPreference] = []
+        for alert in alerts:
+            if not receives_alerts(alert.user):
+                skipped += 1
+                continue
+
+            if not alert_location_key(alert):
+                skipped += 1
+                continue
+            eligible.append(alert)
+
+        index = AlertIndex(eligible)
+        now = dj_timezone.now()
+        schedules = {
+            schedule.location_key: schedule
+            for schedule in AlertSchedule.objects.filter(location_key__in=list(index.locations))
+        }
+        if observations is None:
+            due = [
+                query_city for query_city in index.queries()
+                if location_due(index.locations[query_city.lower()], schedules.get(query_city.lower()), now)
+            ]
+        else:
+            due = [query_city for query_city in index.queries() if query_city.lower() in observations]
+        claimed = [query_city for query_city in due if self.claim_location(query_city.lower())]
+        if len(claimed) < len(due):
+            self.write(f"Skipped {len(due) - len(claimed)} location(s) being processed by another run.")
+        due = claimed
+        deferred = len(index.locations) - len(due)
+
+        weather_cache: dict[str, Observation | None] = {}
+        for query_city in due:
+            if observations is None:
+                with alert_events.suppressed():
+                    observation, error = fetch_observation(query_city)
+            else:
+                observation, error = observations[query_city.lower()], None
+            if error:
+                errors += 1
+            weather_cache[query_city.lower()] = observation
+            location_alerts = len(index.locations[query_city.lower()].alerts)
+            if observation:
+                processed += location_alerts
+            else:
+                skipped += location_alerts
+
+        # Alerts were already evaluated against an observation with the same
+        # upstream timestamp: evaluating it again would only repeat triggers.
+        # Where alerts were added or edited since, only those can trigger.
+        repeated = {
+            key for key, observation in weather_cache.items()
+            if observation is not None
+            and (schedule := schedules.get(key)) is not None
+            and schedule.last_checked_at is not None
+            and schedule.last_observed_at == observation.observed_at
+        }
+        unchanged = {key for key in repeated if not alerts_changed(index.locations[key], schedules[key])}
+        triggered_reasons: dict[int, tuple[AlertPreference, list[str]]] = {}
+        for alert, reason in index.evaluate_all({
+            key: observation for key, observation in weather_cache.items() if key not in unchanged
+        }):
+            key = alert_location_key(alert).lower()
+            if key in repeated and alert.updated_at <= schedules[key].last_checked_at:
+                continue
+            triggered_reasons[alert.id] = (alert, [reason])
+
+        margins: dict[str, float | None] = {
+            key: index.locations[key].observation_margin(observation) if observation else None
+            for key, observation in weather_cache.items()
+        }
+        failed = {key for key, observation in weather_cache.items() if observation is None}
+
+        # Each forecast is fetched and parsed at most once per run (and cached
+        # between runs), however many alerts reference the location.
+        # The parsed series is cached per issuance, keyed by its first slot. The
+        # same first slot means the same forecast was evaluated last time, but
+        # the horizons have moved since, so it is evaluated again if a slot
+        # entered one of them.
+        forecast_issues: dict[str, int] = {}
+        forecast_checked: dict[str, datetime] = {}
+        for query_city in index.forecast_queries():
+            key = query_city.lower()
+            if key not in weather_cache:
+                continue
+            series, error = get_forecast_series(query_city)
+            if error:
+                errors += 1
+                failed.add(key)
+                continue
+            forecast_issues[key] = series[0]['dt'] if series else None
+            forecast_checked[key] = now
+            schedule = schedules.get(key)
+            if (
+                schedule is None
+                or schedule.last_forecast_dt != forecast_issues[key]
+                or schedule.last_forecast_checked_at is None
+                or alerts_changed(index.locations[key], schedule)
+                or index.forecast_slots_added(
+                    query_city, series, schedule.last_forecast_checked_at.timestamp(), now.timestamp()
+                )
+            ):
+                for alert, reason in index.evaluate_forecast(query_city, series, now.timestamp()):
+                    triggered_reasons.setdefault(alert.id, (alert, []))[1].append(reason)
+            forecast_margin = index.forecast_margin(query_city, series, now.timestamp())
+            if forecast_margin is not None:
+                margins[key] = forecast_margin if margins[key] is None else min(margins[key], forecast_margin)
+
+        emails_resent = 0
+        if pending and email_configured:
+            emails_resent, resend_errors = self.resend_emails(receives_alerts)
+            errors += resend_errors
+
+        for alert, reasons in triggered_reasons.values():
+            reason = " | ".join(reasons)
+            user = alert.user
+            city = alert.city.strip()
+            query_city = alert_location_key(alert)
+            observation = weather_cache.get(query_city.lower())
+            temp = observation.temperature_c if observation else None
+            condition_desc = (observation.condition_description or observation.condition_main or "") if observation else ""
+
+            deliverable = alert.email_alerts and email_configured and bool((user.email or "").strip())
+            if alert.email_alerts and not deliverable:
+                errors += 1
+            digest = deliverable and user_setting(user).alert_delivery != 'immediate'
+
+            with metrics.ALERT_DB_WRITE_LATENCY.time():
+                alert.last_triggered = dj_timezone.now()
+                alert.save(update_fields=['last_triggered'])
+                history = AlertHistory.objects.create(
+                    alert=alert,
+                    temperature=temp if temp is not None else 0,
+                    condition=condition_desc[:120],
+                    reason=reason,
+                    email_sent=False,
+                    email_pending=deliverable and not digest,
+                    digest_pending=digest,
+                )
+            triggered += 1
+            metrics.ALERTS_TRIGGERED.inc()
+
+            if deliverable and not digest:
+                sent, _note = send_alert_email(
+                    user,
+                    query_city,
+                    temp if temp is not None else 0,
+                    condition_desc,
+                    reason,
+                )
+                if sent:
+                    history.email_sent = True
+                    history.email_pending = False
+                    history.save(update_fields=['email_sent', 'email_pending'])
+                else:
+                    errors += 1
+
+            self.write(f"Alert triggered for {user.username} in {city}: {reason}")
+
+        # Only once every trigger is recorded and delivered: a run cut short
+        # before this point evaluates the same observations again next time.
+        self.reschedule(margins, failed, schedules, weather_cache, forecast_issues, forecast_checked, now)
+
+        digests_sent = 0
+        if pending and email_configured:
+            digests_sent, digest_errors = self.send_digests(user_setting, receives_alerts)
+            errors += digest_errors
+
+        self.write(
+            f"Processed {processed} alerts. Triggered {triggered}. Digests sent {digests_sent}. "
+            f"Emails resent {emails_resent}. "
+            f"Skipped {skipped}. Errors {errors}. Checked {len(due)} locations "
+            f"({len(unchanged)} unchanged), deferred {deferred}."
+        )
+
+    def reschedule(self, margins, failed, schedules, observations, forecast_issues, forecast_checked, now) -> None:
+        """Store each checked location's next check time; failed checks are retried next run."""
+        min_interval = django_settings.ALERT_CHECK_MIN_INTERVAL
+        max_interval = django_settings.ALERT_CHECK_MAX_INTERVAL
+        rows = []
+        for key, margin in margins.items():
+            previous = schedules.get(key)
+            if key in failed:
+                interval = min_interval
+            elif previous and previous.last_checked_at:
+                interval = check_interval(
+                    margin, min_interval, max_interval,
+                    previous.last_margin, (now - previous.last_checked_at).total_seconds(),
+                )
+            else:
+                interval = check_interval(margin, min_interval, max_interval)
+            rows.append(AlertSchedule(
+                location_key=key,
+                next_check_at=now + timedelta(seconds=interval),
+                last_checked_at=now,
+                last_margin=margin,
+                last_observed_at=(
+                    observations[key].observed_at if observations.get(key)
+                    else previous.last_observed_at if previous else None
+                ),
+                last_forecast_dt=forecast_issues.get(key, previous.last_forecast_dt if previous else None),
+                last_forecast_checked_at=forecast_checked.get(
+                    key, previous.last_forecast_checked_at if previous else None
+                ),
+            ))
+        AlertSchedule.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['location_key'],
+            update_fields=[
+                'next_check_at', 'last_checked_at', 'last_margin', 'last_observed_at', 'last_forecast_dt',
+                'last_forecast_checked_at',
+            ],
+        )
+
+    def resend_emails(self, receives_alerts) -> tuple[int, int]:
+        """Send the immediate alert emails that failed, or whose run ended before sending them.
+
+        Returns (emails sent, failed sends). Failed emails stay pending and
+        are retried on the next run.
+        """
+        sent_count = failed = 0
+        for entry in AlertHistory.objects.filter(email_pending=True).select_related('alert__user').order_by('triggered_at'):
+            alert = entry.alert
+            user = alert.user
+            if not self.claim_location(alert_location_key(alert).lower()):
+                # The run that recorded it may still be sending it.
+                continue
+            if not alert.email_alerts or not receives_alerts(user) or not (user.email or "").strip():
+                AlertHistory.objects.filter(pk=entry.pk).update(email_pending=False)
+                continue
+            sent, _note = send_alert_email(user, alert_location_key(alert), entry.temperature, entry.condition, entry.reason)
+            if not sent:
+                failed += 1
+                continue
+            AlertHistory.objects.filter(pk=entry.pk).update(email_sent=True, email_pending=False)
+            sent_count += 1
+            self.write(f"Resent alert email to {user.username} for {alert.city.strip()}")
+        return sent_count, failed
+
+    def send_digests(self, user_setting, receives_alerts) -> tuple[int, int]:
+        """Email each user whose digest window has elapsed everything pending for them.
+
+        Returns (digests sent, failed sends). Failed digests stay pending and
+        are retried on the next run.
+        """
+        pending: dict[int, list[AlertHistory]] = {}
+        for entry in AlertHistory.objects.filter(digest_pending=True).select_related('alert__user').order_by('triggered_at'):
+            pending.setdefault(entry.alert.user_id, []).append(entry)
+
+        now = dj_timezone.now()
+        sent_count = failed = 0
+        for entries in pending.values():
+            user = entries[0].alert.user
+            ids = [entry.pk for entry in entries]
+            if not receives_alerts(user) or not (user.email or "").strip():
+                AlertHistory.objects.filter(pk__in=ids).update(digest_pending=False)
+                continue
+            setting = user_setting(user)
+            if not digest_due(setting, now):
+                continue
+            sent, _note = send_alert_digest_email(user, entries)
+            if not sent:
+                failed += 1
+                continue
+            AlertHistory.objects.filter(pk__in=ids).update(email_sent=True, digest_pending=False)
+            setting.last_digest_sent_at = now
+            setting.save(update_fields=['last_digest_sent_at'])
+            sent_count += 1
+            self.write(f"Sent digest of {len(entries)} alert(s) to {user.username}")
+        return sent_count, failed
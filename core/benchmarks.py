@@ -0,0 +1,306 @@
+"""Seed data, local fakes and timing helpers for `manage.py benchmark`.
+
+The weather API and SMTP are replaced by in-process fakes with configurable
+latency so runs are reproducible offline and comparable between commits;
+`FakeProvider` does the same for the weather provider interface, with a
+latency distribution instead of a fixed delay.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as dj_timezone
+
+from .models import AlertPreference, Observation, SavedLocation, UserSetting, WeatherSearch
+from .providers import WeatherProvider
+
+BENCH_CITIES = [f"Benchcity{i}" for i in range(200)]
+
+# Benchmarks run against a private in-memory cache, never the shared one.
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+# Latency (seconds) applied by the fakes; set by the benchmark command.
+FAKE_LATENCY = {'weather': 0.0, 'forecast': 0.0, 'smtp': 0.0}
+
+
+class FakeResponse:
+    def __init__(self, data: dict, status_code: int = 200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self) -> dict:
+        return self._data
+
+
+def fake_current_payload(city: str, rng: random.Random) -> dict:
+    return {
+        'coord': {'lat': 14.6, 'lon': 121.0},
+        'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}],
+        'main': {'temp': round(rng.uniform(10, 38), 2), 'feels_like': 30.0, 'pressure': 1010, 'humidity': 70},
+        'wind': {'speed': 3.0},
+        'dt': int(time.time()) // 600 * 600,
+        'sys': {'country': 'XX'},
+        'name': city,
+    }
+
+
+def fake_forecast_payload(city: str, rng: random.Random) -> dict:
+    start = int(time.time()) // 10800 * 10800 + 10800
+    return {
+        'city': {'name': city, 'country': 'XX', 'timezone': 0, 'coord': {'lat': 14.6, 'lon': 121.0}},
+        'list': [
+            {
+                'dt': start + i * 10800,
+                'main': {'temp': round(rng.uniform(10, 38), 2), 'feels_like': 30.0, 'humidity': 60},
+                'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}],
+                'wind': {'speed': 2.0},
+            }
+            for i in range(40)
+        ],
+    }
+
+
+def fake_one_call_payload(city: str, rng: random.Random) -> dict:
+    now = int(time.time())
+    hour = now // 3600 * 3600
+    day = now // 86400 * 86400 + 43200
+    condition = [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}]
+    return {
+        'lat': 14.6,
+        'lon': 121.0,
+        'name': city,
+        'country': 'XX',
+        'timezone_offset': 0,
+        'current': {
+            'dt': now // 600 * 600, 'temp': round(rng.uniform(10, 38), 2), 'feels_like': 30.0,
+            'pressure': 1010, 'humidity': 70, 'uvi': 5.0, 'wind_speed': 3.0, 'weather': condition,
+        },
+        'hourly': [
+            {
+                'dt': hour + i * 3600, 'temp': round(rng.uniform(10, 38), 2), 'feels_like': 30.0,
+                'pressure': 1008, 'humidity': 60, 'uvi': 4.0, 'wind_speed': 2.0, 'weather': condition, 'pop': 0.1,
+            }
+            for i in range(48)
+        ],
+        'daily': [
+            {
+                'dt': day + i * 86400,
+                'temp': {part: round(rng.uniform(10, 38), 2) for part in ('morn', 'day', 'eve', 'night', 'min', 'max')},
+                'feels_like': {part: 30.0 for part in ('morn', 'day', 'eve', 'night')},
+                'pressure': 1008, 'humidity': 60, 'uvi': 6.0, 'wind_speed': 2.0, 'weather': condition, 'pop': 0.1,
+            }
+            for i in range(8)
+        ],
+    }
+
+
+def fake_weather_response(url: str, params: dict | None) -> tuple[str, FakeResponse]:
+    """(kind, response) for an OpenWeatherMap `weather`, `forecast`, geocoding or One Call request."""
+    city = (params or {}).get('q', 'Benchcity0').split(',')[0].strip().title()
+    rng = random.Random(city)
+    if url.endswith('/direct'):
+        return 'weather', FakeResponse([{'name': city, 'country': 'XX', 'lat': 14.6, 'lon': 121.0}])
+    if url.endswith('/onecall'):
+        # Coordinate-based: the provider names the payload after the geocoded city.
+        return 'forecast', FakeResponse(fake_one_call_payload(city, rng))
+    if url.endswith('/forecast'):
+        return 'forecast', FakeResponse(fake_forecast_payload(city, rng))
+    return 'weather', FakeResponse(fake_current_payload(city, rng))
+
+
+def fake_weather_get(url, params=None, timeout=None, **kwargs):
+    """Stand-in for `requests.get` against the OpenWeatherMap endpoints."""
+    kind, response = fake_weather_response(url, params)
+    time.sleep(FAKE_LATENCY[kind])
+    return response
+
+
+async def fake_async_weather_get(client, url, params=None, **kwargs):
+    """Stand-in for `httpx.AsyncClient.get` used by the async weather client."""
+    kind, response = fake_weather_response(url, params)
+    await asyncio.sleep(FAKE_LATENCY[kind])
+    return response
+
+
+@contextmanager
+def patch_weather_api():
+    with mock.patch('requests.get', side_effect=fake_weather_get), \
+            mock.patch('httpx.AsyncClient.get', new=fake_async_weather_get):
+        yield
+
+
+class LatencyDistribution:
+    """Log-normal latency around ``median`` seconds, plus a slow tail.
+
+    A fraction ``tail_rate`` of requests takes ``tail`` seconds longer, the
+    way a few upstream responses stall behind a slow backend or a retransmit.
+    """
+
+    def __init__(self, median: float = 0.08, sigma: float = 0.25, tail_rate: float = 0.0, tail: float = 1.0):
+        self.median = median
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail = tail
+
+    @classmethod
+    def parse(cls, spec: str) -> LatencyDistribution:
+        """Parse 'MEDIAN_MS[,TAIL_RATE,TAIL_MS]', e.g. '80,0.05,1500'."""
+        parts = [float(part) for part in spec.split(',')]
+        if len(parts) > 3:
+            raise CommandError(f"Expected MEDIAN_MS[,TAIL_RATE,TAIL_MS], got {spec!r}")
+        median_ms, tail_rate, tail_ms = (parts + [0.0, 1000.0][len(parts) - 1:])[:3]
+        return cls(median=median_ms / 1000, tail_rate=tail_rate, tail=tail_ms / 1000)
+
+    def sample(self, rng: random.Random) -> float:
+        seconds = rng.lognormvariate(math.log(self.median), self.sigma) if self.median > 0 else 0.0
+        if rng.random() < self.tail_rate:
+            seconds += self.tail
+        return seconds
+
+
+# Latency of the fake providers by provider name; set by `bench_hedging`.
+FAKE_PROVIDER_LATENCY = {'fake': LatencyDistribution(), 'fake-secondary': LatencyDistribution()}
+
+
+class FakeProvider(WeatherProvider):
+    """Weather provider answering with generated payloads after a sampled latency.
+
+    Usable as WEATHER_PROVIDER/WEATHER_HEDGE_PROVIDER to run the app offline.
+    """
+    name = 'fake'
+    kinds = ('weather', 'forecast', 'onecall')
+
+    def __init__(self):
+        self.rng = random.Random(self.name)
+        self.calls = 0
+
+    def payload(self, kind: str, city: str) -> dict:
+        city = city.split(',')[0].strip().title()
+        if kind == 'forecast':
+            return fake_forecast_payload(city, random.Random(city))
+        if kind == 'onecall':
+            return fake_one_call_payload(city, random.Random(city))
+        return fake_current_payload(city, random.Random(city))
+
+    def get(self, kind, city):
+        self.calls += 1
+        time.sleep(FAKE_PROVIDER_LATENCY[self.name].sample(self.rng))
+        return 200, self.payload(kind, city)
+
+    async def aget(self, kind, city):
+        self.calls += 1
+        await asyncio.sleep(FAKE_PROVIDER_LATENCY[self.name].sample(self.rng))
+        return 200, self.payload(kind, city)
+
+
+class FakeSecondaryProvider(FakeProvider):
+    name = 'fake-secondary'
+
+
+class FakeSMTPBackend(BaseEmailBackend):
+    """Email backend that only sleeps for the configured SMTP latency."""
+
+    def send_messages(self, email_messages):
+        for _message in email_messages:
+            time.sleep(FAKE_LATENCY['smtp'])
+        return len(email_messages)
+
+
+def seed(users: int, searches_per_user: int, alerts_per_user: int, locations_per_user: int, seed_value: int = 0) -> list[User]:
+    """Create benchmark users with searches, alerts and saved locations."""
+    rng = random.Random(seed_value)
+    password = make_password('benchmark')
+    User.objects.bulk_create([
+        User(username=f"bench{i}", email=f"bench{i}@example.com", password=password)
+        for i in range(users)
+    ], batch_size=1000)
+    created = list(User.objects.filter(username__startswith='bench').order_by('id'))
+    UserSetting.objects.bulk_create([UserSetting(user=user) for user in created])
+
+    stale = dj_timezone.now() - timedelta(days=1)
+    observations = Observation.objects.bulk_create([
+        Observation(
+            city=city,
+            city_key=city.lower(),
+            country='XX',
+            observed_at=stale,
+            fetched_at=stale,
+            temperature_c=round(rng.uniform(10, 38), 2),
+            humidity=70,
+            wind_speed_kph=10,
+            condition_id=800,
+            condition_main='Clear',
+            condition_description='clear sky',
+            icon_code='01d',
+        )
+        for city in BENCH_CITIES
+    ])
+
+    searches, alerts, locations = [], [], []
+    for user in created:
+        for _ in range(searches_per_user):
+            observation = rng.choice(observations)
+            searches.append(WeatherSearch(user=user, city=observation.city, country='XX', observation=observation))
+        for city in rng.sample(BENCH_CITIES, alerts_per_user):
+            alerts.append(AlertPreference(
+                user=user,
+                city=city,
+                temperature_threshold=round(rng.uniform(25, 40), 1),
+                email_alerts=True,
+            ))
+        for city in rng.sample(BENCH_CITIES, locations_per_user):
+            locations.append(SavedLocation(user=user, city=city, country='XX'))
+    WeatherSearch.objects.bulk_create(searches, batch_size=1000)
+    AlertPreference.objects.bulk_create(alerts, batch_size=1000)
+    SavedLocation.objects.bulk_create(locations, batch_size=1000)
+    return created
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name: str, size: int, call, iterations: int) -> dict:
+    """Run ``call`` repeatedly and summarize latency, throughput and queries."""
+    durations: list[float] = []
+    queries: list[int] = []
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            call(i)
+            durations.append(time.perf_counter() - started)
+        queries.append(len(captured.captured_queries))
+    total = sum(durations)
+    return {
+        'scenario': name,
+        'size': size,
+        'iterations': iterations,
+        'throughput_per_s': round(iterations / total, 2) if total else None,
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'mean_ms': round(statistics.mean(durations) * 1000, 2),
+        'queries_mean': round(statistics.mean(queries), 1),
+        'queries_max': max(queries),
+    }
@@ -0,0 +1,243 @@
+"""Compact cache encoding for weather payloads.
+
+OWM payloads are verbose: a 5-day forecast is 40 nested dicts repeating the
+same keys, condition descriptions and fields the app never reads. Before a
+payload goes to the shared cache it is trimmed to the fields used by the
+observation store, the forecast views and the alert series, and its time
+series (the forecast list, One Call `hourly`) is stored column by column as
+little-endian struct-packed integers, with conditions deduplicated into a
+table. The rest is compact JSON. The result is zlib-compressed when that
+makes it smaller.
+
+Encoding is lossy only in precision: temperatures, wind speeds and UV to
+0.01, pressure and humidity to whole units, precipitation chance to 1%.
+"""
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+
+from django.conf import settings
+
+MAGIC = b'W'
+VERSION = 1
+COMPRESSED = 0x01
+COLUMNAR = 0x02
+
+# (field, struct code, scale) of each series column.
+SERIES_COLUMNS = (
+    ('dt', 'i', 1),
+    ('temp', 'h', 100),
+    ('feels_like', 'h', 100),
+    ('humidity', 'B', 1),
+    ('pressure', 'H', 1),
+    ('wind_speed', 'H', 100),
+    ('pop', 'B', 100),
+    ('uvi', 'H', 100),
+    ('condition', 'B', 1),
+)
+# Stored in place of None.
+MISSING = {'i': -2 ** 31, 'h': -2 ** 15, 'B': 0xFF, 'H': 0xFFFF}
+CONDITION_FIELDS = ('id', 'main', 'description', 'icon')
+
+
+def payload_kind(payload: dict) -> str:
+    if 'list' in payload:
+        return 'forecast'
+    if 'current' in payload or 'hourly' in payload:
+        return 'onecall'
+    return 'weather'
+
+
+def trim_condition(weather: list | None) -> dict:
+    condition = (weather or [{}])[0]
+    return {field: condition[field] for field in CONDITION_FIELDS if field in condition}
+
+
+def trim_current(payload: dict) -> dict:
+    main = payload.get('main', {})
+    coord = payload.get('coord', {})
+    return {
+        'coord': {'lat': coord.get('lat'), 'lon': coord.get('lon')},
+        'weather': [trim_condition(payload.get('weather'))],
+        'main': {field: main.get(field) for field in ('temp', 'feels_like', 'pressure', 'humidity')},
+        'wind': {'speed': payload.get('wind', {}).get('speed')},
+        'dt': payload.get('dt'),
+        'sys': {'country': payload.get('sys', {}).get('country', '')},
+        'timezone': payload.get('timezone', 0),
+        'name': payload.get('name', ''),
+    }
+
+
+def forecast_row(entry: dict) -> dict:
+    main = entry.get('main', {})
+    return {
+        'dt': entry.get('dt'),
+        'temp': main.get('temp'),
+        'feels_like': main.get('feels_like'),
+        'humidity': main.get('humidity'),
+        'pressure': main.get('pressure'),
+        'wind_speed': entry.get('wind', {}).get('speed'),
+        'pop': entry.get('pop'),
+        'uvi': None,
+        'condition': trim_condition(entry.get('weather')),
+    }
+
+
+def forecast_entry(row: dict) -> dict:
+    return {
+        'dt': row['dt'],
+        'main': {field: row[field] for field in ('temp', 'feels_like', 'humidity', 'pressure')},
+        'weather': [row['condition']],
+        'wind': {'speed': row['wind_speed']},
+        'pop': row['pop'] or 0,
+    }
+
+
+def hourly_row(entry: dict) -> dict:
+    row = {field: entry.get(field) for field, _code, _scale in SERIES_COLUMNS}
+    row['condition'] = trim_condition(entry.get('weather'))
+    return row
+
+
+def hourly_entry(row: dict) -> dict:
+    """Reshapes ``row`` (freshly decoded, so not shared) in place."""
+    row['weather'] = [row.pop('condition')]
+    row['pop'] = row['pop'] or 0
+    return row
+
+
+def trim_daily(day: dict) -> dict:
+    return {
+        'dt': day.get('dt'),
+        'temp': {part: value for part, value in (day.get('temp') or {}).items() if part in ('morn', 'day', 'eve', 'min', 'max')},
+        'feels_like': {part: value for part, value in (day.get('feels_like') or {}).items() if part in ('morn', 'day', 'eve')},
+        'pressure': day.get('pressure'),
+        'humidity': day.get('humidity'),
+        'uvi': day.get('uvi'),
+        'wind_speed': day.get('wind_speed'),
+        'weather': [trim_condition(day.get('weather'))],
+        'pop': day.get('pop', 0),
+    }
+
+
+def split(payload: dict) -> tuple[str, dict, list[dict]]:
+    """(kind, trimmed payload without its series, series rows)."""
+    kind = payload_kind(payload)
+    if kind == 'weather':
+        return kind, trim_current(payload), []
+    if kind == 'forecast':
+        city = payload.get('city', {})
+        coord = city.get('coord', {})
+        meta = {'city': {
+            'name': city.get('name', ''),
+            'country': city.get('country', ''),
+            'timezone': city.get('timezone', 0),
+            'coord': {'lat': coord.get('lat'), 'lon': coord.get('lon')},
+        }}
+        return kind, meta, [forecast_row(entry) for entry in payload.get('list', []) if entry.get('dt')]
+    current = payload.get('current', {})
+    meta = {field: payload.get(field) for field in ('lat', 'lon', 'name', 'country', 'timezone_offset')}
+    meta['current'] = {**{field: current.get(field) for field in ('dt', 'temp', 'feels_like', 'pressure', 'humidity', 'uvi', 'wind_speed')},
+                       'weather': [trim_condition(current.get('weather'))]}
+    meta['daily'] = [trim_daily(day) for day in payload.get('daily', [])]
+    if payload.get('alerts'):
+        meta['alerts'] = payload['alerts']
+    return kind, meta, [hourly_row(entry) for entry in payload.get('hourly', []) if entry.get('dt')]
+
+
+def join(kind: str, meta: dict, rows: list[dict]) -> dict:
+    if kind == 'forecast':
+        return {**meta, 'list': [forecast_entry(row) for row in rows]}
+    if kind == 'onecall':
+        return {**meta, 'hourly': [hourly_entry(row) for row in rows]}
+    return meta
+
+
+def pack_columns(rows: list[dict], conditions: list) -> bytes:
+    """The rows' columns, struct-packed; raises struct.error for out-of-range values."""
+    index = {condition: i for i, condition in enumerate(conditions)}
+    dt0 = rows[0]['dt'] if rows else 0
+    chunks = []
+    for field, code, scale in SERIES_COLUMNS:
+        if field == 'condition':
+            values = [index[tuple(row['condition'].get(f) for f in CONDITION_FIELDS)] for row in rows]
+        elif field == 'dt':
+            values = [row['dt'] - dt0 for row in rows]
+        else:
+            values = [MISSING[code] if row[field] is None else round(row[field] * scale) for row in rows]
+        chunks.append(struct.pack(f'<{len(rows)}{code}', *values))
+    return b''.join(chunks)
+
+
+def unpack_columns(data: bytes, count: int, dt0: int, conditions: list) -> list[dict]:
+    columns = []
+    offset = 0
+    for field, code, scale in SERIES_COLUMNS:
+        values = struct.unpack_from(f'<{count}{code}', data, offset)
+        offset += struct.calcsize(f'<{count}{code}')
+        if field == 'condition':
+            table = [
+                {f: value for f, value in zip(CONDITION_FIELDS, condition) if value is not None}
+                for condition in conditions
+            ]
+            values = [table[value] for value in values]
+        elif field == 'dt':
+            values = [dt0 + value for value in values]
+        else:
+            missing = MISSING[code]
+            values = [None if value == missing else value / scale if scale != 1 else value for value in values]
+        columns.append(values)
+    fields = [field for field, _code, _scale in SERIES_COLUMNS]
+    return [dict(zip(fields, row)) for row in zip(*columns)]
+
+
+def encode(payload: dict) -> bytes:
+    """Trim and pack an OWM `weather`, `forecast` or One Call payload."""
+    kind, meta, rows = split(payload)
+    conditions = list(dict.fromkeys(tuple(row['condition'].get(f) for f in CONDITION_FIELDS) for row in rows))
+    flags = 0
+    columns = b''
+    header = {'kind': kind, 'meta': meta}
+    if rows:
+        try:
+            columns = pack_columns(rows, conditions)
+            flags |= COLUMNAR
+            header.update(count=len(rows), dt0=rows[0]['dt'], conditions=conditions)
+        except (struct.error, TypeError):
+            header['rows'] = rows
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    body = struct.pack('<I', len(header_bytes)) + header_bytes + columns
+    level = settings.WEATHER_CACHE_COMPRESS_LEVEL
+    if level:
+        compressed = zlib.compress(body, level)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= COMPRESSED
+    return MAGIC + bytes((VERSION, flags)) + body
+
+
+def decode(data) -> dict | None:
+    """Inverse of `encode`. Anything else (payloads cached before encoding) is returned as is.
+
+    A truncated or corrupt entry decodes to None, so callers treat it as a miss.
+    """
+    if not isinstance(data, bytes) or data[:1] != MAGIC:
+        return data
+    if len(data) < 3 or data[1] != VERSION:
+        return None
+    flags = data[2]
+    body = data[3:]
+    try:
+        if flags & COMPRESSED:
+            body = zlib.decompress(body)
+        (header_length,) = struct.unpack_from('<I', body)
+        header = json.loads(body[4:4 + header_length])
+        if flags & COLUMNAR:
+            rows = unpack_columns(body[4 + header_length:], header['count'], header['dt0'], header['conditions'])
+        else:
+            rows = header.get('rows', [])
+        return join(header['kind'], header['meta'], rows)
+    except (zlib.error, struct.error, ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
@@ -0,0 +1,115 @@
+"""Database helpers: statement timeouts and read-replica routing.
+
+Views decorated with `use_replica` read from the `replica` alias, when one
+is configured and caught up; everything else, and every write, uses the
+primary.
+"""
+from __future__ import annotations
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DB_ALIAS = 'replica'
+LAG_CACHE_KEY = 'db:replica_lag'
+# Cached in place of the lag when the replica cannot be queried.
+UNREACHABLE = -1.0
+
+_read_alias: ContextVar[str | None] = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def statement_timeout(milliseconds: int, using: str = 'default'):
+    """Cancel queries in the block that run longer than ``milliseconds``.
+
+    PostgreSQL only (other backends run the block unchanged). The timeout is
+    set with SET LOCAL semantics inside a transaction, so it also works behind
+    PgBouncer in transaction pooling mode and never leaks to other queries.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or not milliseconds:
+        yield
+        return
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(milliseconds))])
+        yield
+
+
+def query_replica_lag() -> float | None:
+    """Seconds the replica's replayed data is behind the primary; None if unknown."""
+    connection = connections[REPLICA_DB_ALIAS]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # An idle replica has replayed everything it received, however old
+        # the last replayed transaction is.
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() "
+            "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag = cursor.fetchone()[0]
+    return None if lag is None else float(lag)
+
+
+def replica_lag() -> float | None:
+    """Replica lag in seconds, checked at most every REPLICA_LAG_CHECK_INTERVAL."""
+    lag = cache.get(LAG_CACHE_KEY)
+    if lag is None:
+        try:
+            lag = query_replica_lag()
+        except DatabaseError:
+            logger.warning("Replica lag check failed", exc_info=True)
+            lag = None
+        cache.set(LAG_CACHE_KEY, UNREACHABLE if lag is None else lag, settings.REPLICA_LAG_CHECK_INTERVAL)
+    return None if lag == UNREACHABLE else lag
+
+
+def replica_alias() -> str:
+    """The replica alias if it is configured and within REPLICA_MAX_LAG_SECONDS, else the primary."""
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        return DEFAULT_DB_ALIAS
+    lag = replica_lag()
+    if lag is None or lag > settings.REPLICA_MAX_LAG_SECONDS:
+        return DEFAULT_DB_ALIAS
+    return REPLICA_DB_ALIAS
+
+
+def read_alias() -> str:
+    """The alias reads in the current request go to."""
+    return _read_alias.get() or DEFAULT_DB_ALIAS
+
+
+def use_replica(view):
+    """Route the view's reads to the replica, chosen once per request."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        token = _read_alias.set(replica_alias())
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Objects read from the replica must still be saved to the primary.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db == REPLICA_DB_ALIAS else None
@@ -0,0 +1,143 @@
+"""Chunked, resumable deletion of users and their data.
+
+`user.delete()` makes Django's collector load every related row, and send
+delete signals for each one, before anything is deleted, all in a single
+transaction. Here each table is emptied in batches of primary keys with raw
+DELETEs, children before parents, one short transaction per batch. Progress
+is stored on a DeletionJob; an interrupted job is resumed by simply running
+it again, since every step deletes whatever rows remain.
+
+Deletions requested from the site run on a background worker. Like the alert
+event workers it is not a daemon thread, so a server worker that is recycled
+or shut down finishes the job it is running first; a job cut short anyway
+(the process killed outright) is left RUNNING, and the `cleanup_user --resume`
+cron picks it up once it has made no progress for DELETION_STALE_SECONDS.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AlertHistory, AlertPreference, DeletionJob, SavedLocation, UserSetting, WeatherSearch
+
+logger = logging.getLogger(__name__)
+
+# (progress name, model, lookup of the owning user id), in foreign key order.
+STEPS = (
+    ('alert history', AlertHistory, 'alert__user_id'),
+    ('alerts', AlertPreference, 'user_id'),
+    ('searches', WeatherSearch, 'user_id'),
+    ('saved locations', SavedLocation, 'user_id'),
+    ('settings', UserSetting, 'user_id'),
+)
+
+Progress = Callable[[DeletionJob, str, int], None]
+
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deletion-job')
+_pending: set[Future] = set()
+_pending_lock = threading.Lock()
+
+
+def delete_batch(model, lookup: str, user_id: int, batch_size: int) -> int:
+    """Delete up to ``batch_size`` of the user's rows of ``model``; return how many went."""
+    ids = list(model.objects.filter(**{lookup: user_id}).order_by().values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({placeholders})", ids)
+        return cursor.rowcount
+
+
+def start_deletion(user) -> DeletionJob:
+    """Deactivate ``user`` and return their unfinished deletion job, creating one if needed."""
+    if user.is_active:
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+    job = DeletionJob.objects.filter(user_id=user.pk).exclude(status=DeletionJob.DONE).first()
+    return job or DeletionJob.objects.create(user_id=user.pk, username=user.username)
+
+
+def resumable_jobs():
+    """Jobs that are pending, failed, or running without progress for DELETION_STALE_SECONDS."""
+    stale = timezone.now() - timedelta(seconds=settings.DELETION_STALE_SECONDS)
+    return DeletionJob.objects.filter(
+        Q(status__in=[DeletionJob.PENDING, DeletionJob.FAILED])
+        | Q(status=DeletionJob.RUNNING, updated_at__lt=stale)
+    ).order_by('created_at')
+
+
+def claim(job: DeletionJob) -> bool:
+    """Mark ``job`` running unless another worker is already making progress on it."""
+    claimed = resumable_jobs().filter(pk=job.pk).update(
+        status=DeletionJob.RUNNING, error='', updated_at=timezone.now(),
+    )
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def run_job(job: DeletionJob, batch_size: int | None = None, progress: Progress | None = None) -> DeletionJob:
+    """Delete everything owned by the job's user, then the user. The job must be claimed."""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    try:
+        for name, model, lookup in STEPS:
+            job.step = name
+            while deleted := delete_batch(model, lookup, job.user_id, batch_size):
+                job.deleted[name] = job.deleted.get(name, 0) + deleted
+                job.save(update_fields=['step', 'deleted', 'updated_at'])
+                if progress:
+                    progress(job, name, deleted)
+        # Only relations outside STEPS (admin log, group memberships) are left for the collector.
+        get_user_model().objects.filter(pk=job.user_id).delete()
+    except Exception as exc:
+        job.status = DeletionJob.FAILED
+        job.error = str(exc)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+    job.status = DeletionJob.DONE
+    job.step = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'step', 'finished_at', 'updated_at'])
+    return job
+
+
+def run_in_background(job: DeletionJob) -> None:
+    """Run ``job`` on the deletion worker; `cleanup_user --resume` picks it up if the process dies."""
+    def target():
+        try:
+            if claim(job):
+                run_job(job)
+        except Exception:
+            logger.exception("Deletion job %s for user %s failed", job.pk, job.username)
+        finally:
+            connections.close_all()
+
+    future = _pool.submit(target)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_finished)
+
+
+def _finished(future: Future) -> None:
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def drain(timeout: float | None = None) -> bool:
+    """Wait for the deletions started so far; False if some were still running at ``timeout``."""
+    with _pending_lock:
+        pending = list(_pending)
+    _done, not_done = wait(pending, timeout)
+    return not not_done
@@ -53,11 +53,24 @@ class UserEditForm(forms.ModelForm):
 class AlertPreferenceForm(forms.ModelForm):
     class Meta:
         model = AlertPreference
-        fields = ("city", "country", "temperature_threshold", "condition_alerts", "email_alerts")
+        fields = (
+            "city",
+            "country",
+            "temperature_threshold",
+            "low_temperature_threshold",
+            "humidity_threshold",
+            "wind_speed_threshold",
+            "forecast_hours",
+            "condition_alerts",
+            "email_alerts",
+        )
         widgets = {
             "city": forms.TextInput(attrs={"placeholder": "City for alert"}),
             "country": forms.TextInput(attrs={"placeholder": "Country (optional)"}),
             "temperature_threshold": forms.NumberInput(attrs={"placeholder": "Temp threshold (deg C)"}),
+            "low_temperature_threshold": forms.NumberInput(attrs={"placeholder": "Low temp threshold (deg C)"}),
+            "humidity_threshold": forms.NumberInput(attrs={"placeholder": "Humidity threshold (%)"}),
+            "wind_speed_threshold": forms.NumberInput(attrs={"placeholder": "Wind threshold (km/h)"}),
         }
 
 
@@ -0,0 +1,78 @@
+"""Per-user versioned keys for template fragment caching.
+
+The dashboard pages cache their lists with ``{% cache %}`` keyed on the user's
+fragment version. Writes to a user's account, searches, alerts, saved
+locations or settings bump that version (see `core.signals`), which orphans all of the
+user's cached fragments at once; they then expire on their own.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+
+
+def version_key(user_id: int) -> str:
+    return f"fragments_version:{user_id}"
+
+
+def _initial_version() -> int:
+    # Time-based, so a version lost from the cache never restarts at a number
+    # whose fragments might still be cached.
+    return time.time_ns() // 1000
+
+
+def user_version(user_id: int) -> int:
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def auser_version(user_id: int) -> int:
+    key = version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_user_version(user_id: int) -> None:
+    """Invalidate every cached fragment of a user."""
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        cache.set(version_key(user_id), _initial_version(), timeout=None)
+
+
+def csrf_key(request) -> str:
+    """Digest of the CSRF secret, for fragments that embed `{% csrf_token %}`.
+
+    Such fragments are valid only for the browser whose secret they were
+    rendered with, so they are keyed per secret as well as per user.
+    """
+    get_token(request)
+    return hashlib.md5(request.META["CSRF_COOKIE"].encode()).hexdigest()
+
+
+def context(request, version: int) -> dict:
+    return {
+        'fragment_ttl': django_settings.FRAGMENT_CACHE_TTL,
+        'fragment_version': version,
+        'fragment_csrf': csrf_key(request),
+    }
+
+
+def fragment_context(request) -> dict:
+    """Template context for the per-user `{% cache %}` blocks."""
+    return context(request, user_version(request.user.id))
+
+
+async def afragment_context(request) -> dict:
+    return context(request, await auser_version(request.user.id))
@@ -0,0 +1,121 @@
+"""Responsive image variants and SVG minification for `collectstatic`.
+
+`core.storage.OptimizedStaticFilesStorage` calls into this module while
+post-processing: every raster image under ``img/`` gets resized AVIF, WebP and
+JPEG variants, and SVGs are minified in place, before the manifest storage
+hashes and compresses them. The variants of each image are recorded in an
+index file that the ``{% picture %}`` template tag reads to build
+``<picture>``/``srcset`` markup.
+"""
+from __future__ import annotations
+
+import io
+import json
+import logging
+import re
+from functools import lru_cache
+from pathlib import PurePosixPath
+
+from django.conf import settings as django_settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "images.json"
+RASTER_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# (mime type, Pillow format, file extension, save options); the browser uses
+# the first <source> it supports, so the smallest format goes first.
+FORMATS = (
+    ("image/avif", "AVIF", ".avif", {"quality": 50}),
+    ("image/webp", "WEBP", ".webp", {"quality": 72, "method": 6}),
+    ("image/jpeg", "JPEG", ".jpg", {"quality": 75, "optimize": True, "progressive": True}),
+)
+
+SVG_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+SVG_BETWEEN_TAGS = re.compile(r">\s+<")
+SVG_WHITESPACE = re.compile(r"\s{2,}")
+
+
+def is_raster(name: str) -> bool:
+    return name.startswith("img/") and PurePosixPath(name).suffix.lower() in RASTER_EXTENSIONS
+
+
+def is_svg(name: str) -> bool:
+    return name.startswith("img/") and name.lower().endswith(".svg")
+
+
+def minify_svg(source: str) -> str:
+    """Drop comments and insignificant whitespace from an SVG document."""
+    source = SVG_COMMENT.sub("", source)
+    source = SVG_BETWEEN_TAGS.sub("><", source)
+    return SVG_WHITESPACE.sub(" ", source).strip()
+
+
+def variant_widths(width: int) -> list[int]:
+    """Configured widths narrower than the original, plus the original width."""
+    return sorted({w for w in django_settings.IMAGE_VARIANT_WIDTHS if w < width} | {width})
+
+
+def variant_name(name: str, width: int, extension: str) -> str:
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}-{width}w{extension}"))
+
+
+def replace_file(storage, name: str, content: bytes) -> None:
+    if storage.exists(name):
+        storage.delete(name)
+    storage._save(name, ContentFile(content))
+
+
+def build_variants(storage, name: str) -> dict | None:
+    """Write resized variants of ``name`` into ``storage``; returns its index entry.
+
+    Returns None when Pillow (or one of its codecs) is unavailable, in which
+    case the image is served as committed.
+    """
+    try:
+        from PIL import Image, features
+    except ImportError:
+        logger.warning("Pillow is not installed; skipping image variants for %s", name)
+        return None
+
+    with storage.open(name) as handle:
+        image = Image.open(handle)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    entry = {"width": image.width, "height": image.height, "variants": {}}
+    for mime, pil_format, extension, options in FORMATS:
+        if pil_format != "JPEG" and not features.check(pil_format.lower()):
+            logger.warning("Pillow lacks %s support; skipping %s variants", pil_format, name)
+            continue
+        rows = []
+        for width in variant_widths(image.width):
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            if pil_format == "JPEG" and resized.mode == "RGBA":
+                resized = resized.convert("RGB")
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            target = variant_name(name, width, extension)
+            replace_file(storage, target, buffer.getvalue())
+            rows.append([target, width])
+        entry["variants"][mime] = rows
+    return entry
+
+
+def write_index(storage, index: dict) -> None:
+    replace_file(storage, INDEX_NAME, json.dumps(index, sort_keys=True).encode())
+
+
+@lru_cache(maxsize=None)
+def load_index() -> dict:
+    """Variant index written by the last `collectstatic`; empty in development."""
+    try:
+        with staticfiles_storage.open(INDEX_NAME) as handle:
+            return json.load(handle)
+    except (FileNotFoundError, OSError, ValueError):
+        return {}
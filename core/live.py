@@ -0,0 +1,107 @@
+"""In-process fan-out of observation updates to Server-Sent Events streams.
+
+Each event loop (one per uvicorn worker) has a `LiveHub`. Streams subscribe
+to the cities they display; the hub runs a single poll task per city, no
+matter how many streams want it, and pushes every new observation (a new OWM
+`dt`) to all of that city's subscriber queues. The poll task reads the shared
+observation store, which the weather client and cache warmer keep fresh, so
+open dashboards add no per-user weather API calls.
+
+Streams need an ASGI server. Under WSGI (runserver, gunicorn sync workers) a
+streaming response is buffered and holds a worker until it ends, so pages
+served there leave the stream out and poll the JSON API instead.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import weakref
+from typing import Awaitable, Callable
+
+from django.conf import settings as django_settings
+from django.core.handlers.asgi import ASGIRequest
+
+from .models import Observation
+
+logger = logging.getLogger(__name__)
+
+PollFunc = Callable[[str], Awaitable[Observation | None]]
+
+
+class CityFeed:
+    def __init__(self, query: str):
+        self.query = query
+        self.subscribers: set[asyncio.Queue] = set()
+        self.latest: Observation | None = None
+        self.task: asyncio.Task | None = None
+
+
+class LiveHub:
+    def __init__(self, poll: PollFunc, interval: float):
+        self.poll = poll
+        self.interval = interval
+        self.feeds: dict[str, CityFeed] = {}
+
+    def subscribe(self, queue: asyncio.Queue, queries: list[str]) -> None:
+        """Start receiving ``(query, observation)`` items for each query on ``queue``."""
+        for query in queries:
+            key = query.lower()
+            feed = self.feeds.get(key)
+            if feed is None:
+                feed = self.feeds[key] = CityFeed(query)
+                feed.task = asyncio.create_task(self._run(feed))
+            feed.subscribers.add(queue)
+            if feed.latest is not None:
+                queue.put_nowait((feed.query, feed.latest))
+
+    def unsubscribe(self, queue: asyncio.Queue, queries: list[str]) -> None:
+        """Stop delivering to ``queue``; a city's poll task ends with its last subscriber."""
+        for query in queries:
+            key = query.lower()
+            feed = self.feeds.get(key)
+            if feed is None:
+                continue
+            feed.subscribers.discard(queue)
+            if not feed.subscribers:
+                feed.task.cancel()
+                del self.feeds[key]
+
+    async def _run(self, feed: CityFeed) -> None:
+        while True:
+            try:
+                observation = await self.poll(feed.query)
+            except Exception:
+                logger.exception("Live poll failed for %s", feed.query)
+                observation = None
+            if observation is not None and (
+                feed.latest is None or observation.observed_at != feed.latest.observed_at
+            ):
+                feed.latest = observation
+                for queue in feed.subscribers:
+                    queue.put_nowait((feed.query, observation))
+            await asyncio.sleep(self.interval)
+
+
+def streaming_available(request) -> bool:
+    """Whether ``request`` is served over ASGI, where SSE responses are streamed."""
+    return isinstance(request, ASGIRequest)
+
+
+_hubs: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_hub(poll: PollFunc) -> LiveHub:
+    """The hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = LiveHub(poll, django_settings.LIVE_POLL_INTERVAL)
+    return hub
+
+
+def format_event(event: str, data: str, event_id: str | None = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
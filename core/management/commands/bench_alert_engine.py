@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import gc
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from core.alert_engine import AlertIndex, alert_location_key
+from core.models import AlertPreference
+from core.views import alert_should_trigger
+
+# (condition_id, main, description), weighted so most cities see ordinary weather
+CONDITIONS = (
+    (800, 'Clear', 'clear sky'),
+    (800, 'Clear', 'clear sky'),
+    (803, 'Clouds', 'broken clouds'),
+    (803, 'Clouds', 'broken clouds'),
+    (500, 'Rain', 'light rain'),
+    (500, 'Rain', 'light rain'),
+    (211, 'Thunderstorm', 'thunderstorm'),
+    (741, 'Fog', 'fog'),
+    (801, 'Clouds', 'few clouds'),
+    (804, 'Clouds', 'overcast clouds'),
+)
+
+
+def synthetic_alerts(count: int, cities: int, rng: random.Random) -> list[AlertPreference]:
+    """Unsaved alerts spread over `cities` locations with a mix of rule types."""
+    alerts = []
+    for i in range(count):
+        alerts.append(AlertPreference(
+            id=i + 1,
+            city=f"City{rng.randrange(cities)}",
+            temperature_threshold=round(rng.uniform(28, 42), 1) if rng.random() < 0.7 else None,
+            low_temperature_threshold=round(rng.uniform(-10, 5), 1) if rng.random() < 0.2 else None,
+            humidity_threshold=rng.randrange(80, 101) if rng.random() < 0.2 else None,
+            wind_speed_threshold=round(rng.uniform(40, 90), 1) if rng.random() < 0.2 else None,
+            condition_alerts=rng.random() < 0.6,
+            is_active=True,
+        ))
+    return alerts
+
+
+def synthetic_observations(cities: int, rng: random.Random) -> dict[str, SimpleNamespace]:
+    observations = {}
+    for i in range(cities):
+        condition_id, main, description = rng.choice(CONDITIONS)
+        observations[f"City{i}"] = SimpleNamespace(
+            temperature_c=round(rng.uniform(0, 36), 2),
+            humidity=rng.randrange(20, 101),
+            wind_speed_kph=round(rng.uniform(0, 50), 2),
+            condition_id=condition_id,
+            condition_main=main,
+            condition_description=description,
+        )
+    return observations
+
+
+def best_of(repeats: int, func):
+    """``(result, seconds)`` of the fastest of ``repeats`` calls.
+
+    The collector is run before and disabled during each call, so a timing
+    reflects the code under test and not a GC pass over the synthetic alerts.
+    """
+    best = None
+    for _ in range(repeats):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - started
+        finally:
+            gc.enable()
+        if best is None or seconds < best[1]:
+            best = (result, seconds)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-alert evaluation against the batch AlertIndex on synthetic alerts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alerts", type=int, default=100_000, help="Number of synthetic alerts")
+        parser.add_argument("--cities", type=int, default=500, help="Number of distinct cities")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed")
+        parser.add_argument("--repeats", type=int, default=5, help="Report the best of this many runs per phase")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        alerts = synthetic_alerts(options["alerts"], options["cities"], rng)
+        observations = synthetic_observations(options["cities"], rng)
+
+        def evaluate_per_alert():
+            triggered = set()
+            for alert in alerts:
+                obs = observations[alert_location_key(alert)]
+                should_trigger, _reason = alert_should_trigger(
+                    alert,
+                    obs.temperature_c,
+                    obs.condition_description,
+                    humidity=obs.humidity,
+                    wind_speed=obs.wind_speed_kph,
+                    condition_id=obs.condition_id,
+                )
+                if should_trigger:
+                    triggered.add(alert.id)
+            return triggered
+
+        repeats = options["repeats"]
+        per_alert, per_alert_seconds = best_of(repeats, evaluate_per_alert)
+        index, build_seconds = best_of(repeats, lambda: AlertIndex(alerts))
+        batch, evaluate_seconds = best_of(
+            repeats, lambda: {alert.id for alert, _reason in index.evaluate_all(observations)},
+        )
+
+        if batch != per_alert:
+            self.stderr.write(f"Mismatch: {len(per_alert ^ batch)} alerts differ between evaluators.")
+
+        self.stdout.write(
+            f"Alerts: {len(alerts)} across {len(observations)} cities, {len(batch)} triggered "
+            f"(best of {repeats}, GC disabled while timing)"
+        )
+        self.stdout.write(f"Per-alert evaluation: {per_alert_seconds * 1000:.1f} ms")
+        self.stdout.write(f"AlertIndex build: {build_seconds * 1000:.1f} ms")
+        self.stdout.write(f"AlertIndex evaluate: {evaluate_seconds * 1000:.1f} ms")
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+import pickle
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core import codec
+
+CONDITIONS = (
+    {'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'},
+    {'id': 803, 'main': 'Clouds', 'description': 'broken clouds', 'icon': '04d'},
+    {'id': 500, 'main': 'Rain', 'description': 'light rain', 'icon': '10n'},
+)
+
+
+def full_current(rng: random.Random, dt: int) -> dict:
+    """A current-weather payload with every field OWM sends."""
+    temp = round(rng.uniform(10, 38), 2)
+    return {
+        'coord': {'lon': 120.9822, 'lat': 14.6042},
+        'weather': [rng.choice(CONDITIONS)],
+        'base': 'stations',
+        'main': {
+            'temp': temp, 'feels_like': round(temp + 2.3, 2), 'temp_min': round(temp - 1, 2),
+            'temp_max': round(temp + 1, 2), 'pressure': 1009, 'humidity': rng.randrange(40, 100),
+            'sea_level': 1009, 'grnd_level': 1008,
+        },
+        'visibility': 10000,
+        'wind': {'speed': round(rng.uniform(0, 12), 2), 'deg': rng.randrange(360), 'gust': round(rng.uniform(0, 18), 2)},
+        'clouds': {'all': rng.randrange(100)},
+        'dt': dt,
+        'sys': {'type': 2, 'id': 2008256, 'country': 'PH', 'sunrise': dt - 20000, 'sunset': dt + 20000},
+        'timezone': 28800,
+        'id': 1701668,
+        'name': 'Manila',
+        'cod': 200,
+    }
+
+
+def full_forecast(rng: random.Random, dt: int) -> dict:
+    """A 5-day/3-hour forecast payload with every field OWM sends."""
+    start = dt // 10800 * 10800 + 10800
+    entries = []
+    for i in range(40):
+        slot = start + i * 10800
+        temp = round(rng.uniform(10, 38), 2)
+        entries.append({
+            'dt': slot,
+            'main': {
+                'temp': temp, 'feels_like': round(temp + 1.7, 2), 'temp_min': round(temp - 0.5, 2),
+                'temp_max': round(temp + 0.5, 2), 'pressure': 1008, 'sea_level': 1008, 'grnd_level': 1007,
+                'humidity': rng.randrange(40, 100), 'temp_kf': round(rng.uniform(-1, 1), 2),
+            },
+            'weather': [rng.choice(CONDITIONS)],
+            'clouds': {'all': rng.randrange(100)},
+            'wind': {'speed': round(rng.uniform(0, 12), 2), 'deg': rng.randrange(360), 'gust': round(rng.uniform(0, 18), 2)},
+            'visibility': 10000,
+            'pop': round(rng.random(), 2),
+            'rain': {'3h': round(rng.uniform(0, 3), 2)},
+            'sys': {'pod': 'd' if i % 8 < 4 else 'n'},
+            'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(slot)),
+        })
+    return {
+        'cod': '200', 'message': 0, 'cnt': 40, 'list': entries,
+        'city': {
+            'id': 1701668, 'name': 'Manila', 'coord': {'lat': 14.6042, 'lon': 120.9822}, 'country': 'PH',
+            'population': 1600000, 'timezone': 28800, 'sunrise': dt - 20000, 'sunset': dt + 20000,
+        },
+    }
+
+
+def full_one_call(rng: random.Random, dt: int) -> dict:
+    """A One Call 3.0 payload (without `minutely`) with every field OWM sends."""
+    def point(at: int) -> dict:
+        temp = round(rng.uniform(10, 38), 2)
+        return {
+            'dt': at, 'temp': temp, 'feels_like': round(temp + 1.9, 2), 'pressure': 1009,
+            'humidity': rng.randrange(40, 100), 'dew_point': round(temp - 6, 2), 'uvi': round(rng.uniform(0, 11), 2),
+            'clouds': rng.randrange(100), 'visibility': 10000, 'wind_speed': round(rng.uniform(0, 12), 2),
+            'wind_deg': rng.randrange(360), 'wind_gust': round(rng.uniform(0, 18), 2), 'weather': [rng.choice(CONDITIONS)],
+        }
+
+    hour = dt // 3600 * 3600
+    daily = []
+    for i in range(8):
+        at = hour // 86400 * 86400 + 14400 + i * 86400
+        temps = {part: round(rng.uniform(10, 38), 2) for part in ('day', 'min', 'max', 'night', 'eve', 'morn')}
+        daily.append({
+            'dt': at, 'sunrise': at - 20000, 'sunset': at + 20000, 'moonrise': at - 5000, 'moonset': at + 30000,
+            'moon_phase': 0.25, 'summary': 'Expect a day of partly cloudy with rain',
+            'temp': temps, 'feels_like': {part: temps[part] + 2 for part in ('day', 'night', 'eve', 'morn')},
+            'pressure': 1009, 'humidity': rng.randrange(40, 100), 'dew_point': 22.1,
+            'wind_speed': round(rng.uniform(0, 12), 2), 'wind_deg': rng.randrange(360), 'wind_gust': 9.8,
+            'weather': [rng.choice(CONDITIONS)], 'clouds': rng.randrange(100), 'pop': round(rng.random(), 2),
+            'rain': 1.2, 'uvi': round(rng.uniform(0, 11), 2),
+        })
+    current = point(dt)
+    current.update(sunrise=dt - 20000, sunset=dt + 20000)
+    return {
+        'lat': 14.6042, 'lon': 120.9822, 'timezone': 'Asia/Manila', 'timezone_offset': 28800,
+        'current': current,
+        'hourly': [{**point(hour + i * 3600), 'pop': round(rng.random(), 2)} for i in range(48)],
+        'daily': daily,
+        'name': 'Manila', 'country': 'PH',
+    }
+
+
+def per_call(function, payload, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function(payload)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+class Command(BaseCommand):
+    help = "Compare cached weather payload size and encode/decode time: pickled raw payloads vs core.codec."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000, help="Encode/decode repetitions per measurement")
+        parser.add_argument("--budget-mb", type=int, default=100, help="Cache memory budget for the cities-per-budget column")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        dt = int(time.time())
+        iterations = options["iterations"]
+        budget = options["budget_mb"] * 1024 * 1024
+        payloads = (
+            ('weather', full_current(rng, dt)),
+            ('forecast', full_forecast(rng, dt)),
+            ('onecall', full_one_call(rng, dt)),
+        )
+        self.stdout.write(
+            f"{'payload':<9} {'format':<16} {'bytes':>7} {'encode us':>10} {'decode us':>10} {'entries/' + str(options['budget_mb']) + 'MB':>14}"
+        )
+        for kind, payload in payloads:
+            pickled = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+            rows = [
+                ('raw json', len(json.dumps(payload, separators=(',', ':'))), None, None),
+                ('raw pickle', len(pickled),
+                 per_call(lambda p: pickle.dumps(p, pickle.HIGHEST_PROTOCOL), payload, iterations),
+                 per_call(pickle.loads, pickled, iterations)),
+            ]
+            for label, level in (('codec', 0), ('codec + zlib', 6)):
+                with override_settings(WEATHER_CACHE_COMPRESS_LEVEL=level):
+                    encoded = codec.encode(payload)
+                    rows.append((label, len(encoded), per_call(codec.encode, payload, iterations),
+                                 per_call(codec.decode, encoded, iterations)))
+            for label, size, encode_us, decode_us in rows:
+                encode_text = f"{encode_us:.1f}" if encode_us is not None else '-'
+                decode_text = f"{decode_us:.1f}" if decode_us is not None else '-'
+                self.stdout.write(
+                    f"{kind:<9} {label:<16} {size:>7} {encode_text:>10} {decode_text:>10} {budget // size:>14}"
+                )
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core import benchmarks, providers
+
+FAKE_PRIMARY = 'core.benchmarks.FakeProvider'
+FAKE_SECONDARY = 'core.benchmarks.FakeSecondaryProvider'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare upstream latency with and without hedged requests, against fake "
+        "providers with configurable latency distributions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per run")
+        parser.add_argument(
+            "--primary", default="80,0.05,1500",
+            help="Primary latency as MEDIAN_MS[,TAIL_RATE,TAIL_MS] (default: 80,0.05,1500)",
+        )
+        parser.add_argument(
+            "--secondary", default="",
+            help="Hedge to a second fake provider with this latency instead of the primary again",
+        )
+        parser.add_argument("--min-delay-ms", type=int, default=100, help="WEATHER_HEDGE_MIN_DELAY_MS")
+        parser.add_argument("--async", dest="use_async", action="store_true", help="Use the async client path")
+
+    def handle(self, *args, **options):
+        benchmarks.FAKE_PROVIDER_LATENCY['fake'] = benchmarks.LatencyDistribution.parse(options["primary"])
+        if options["secondary"]:
+            benchmarks.FAKE_PROVIDER_LATENCY['fake-secondary'] = benchmarks.LatencyDistribution.parse(options["secondary"])
+        hedge_path = FAKE_SECONDARY if options["secondary"] else ''
+
+        for label, hedging in (("no hedging", False), ("hedged", True)):
+            with override_settings(
+                WEATHER_PROVIDER=FAKE_PRIMARY,
+                WEATHER_HEDGE_PROVIDER=hedge_path,
+                WEATHER_HEDGE_ENABLED=hedging,
+                WEATHER_HEDGE_MIN_DELAY_MS=options["min_delay_ms"],
+                CACHES=benchmarks.BENCH_CACHES,
+            ):
+                providers.latencies.clear()
+                cache.clear()
+                primary = providers.load_provider(FAKE_PRIMARY)
+                secondary = providers.load_provider(FAKE_SECONDARY)
+                primary.calls = secondary.calls = 0
+                durations = self.run(options["requests"], options["use_async"])
+                upstream_calls = primary.calls + secondary.calls
+            hedges = upstream_calls - options["requests"]
+            self.stdout.write(
+                f"{label:>10}: p50 {self.ms(durations, 50)}  p95 {self.ms(durations, 95)}  "
+                f"p99 {self.ms(durations, 99)}  max {max(durations) * 1000:.0f} ms  "
+                f"hedges {hedges} ({hedges / options['requests']:.1%})"
+            )
+
+    def run(self, count: int, use_async: bool) -> list[float]:
+        cities = [f"Benchcity{i % 200}" for i in range(count)]
+        if use_async:
+            return asyncio.run(self.arun(cities))
+        durations = []
+        for city in cities:
+            started = time.perf_counter()
+            providers.fetch('weather', city)
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    async def arun(self, cities: list[str]) -> list[float]:
+        durations = []
+        for city in cities:
+            started = time.perf_counter()
+            await providers.afetch('weather', city)
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    @staticmethod
+    def ms(durations: list[float], pct: float) -> str:
+        return f"{benchmarks.percentile(durations, pct) * 1000:.0f} ms"
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import io
+import json
+import platform
+import random
+import subprocess
+
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmarks, weather_cache
+from core.models import AlertHistory, AlertSchedule, Observation
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the dashboard, admin views and process_alerts against seeded data "
+        "in a throwaway test database, with the weather API and SMTP faked locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="50,500", help="Comma-separated user counts to seed")
+        parser.add_argument("--requests", type=int, default=30, help="Requests per view scenario")
+        parser.add_argument("--alert-runs", type=int, default=3, help="process_alerts runs per size")
+        parser.add_argument("--searches-per-user", type=int, default=20)
+        parser.add_argument("--alerts-per-user", type=int, default=2)
+        parser.add_argument("--locations-per-user", type=int, default=3)
+        parser.add_argument("--weather-latency", type=float, default=0.05, help="Fake weather API latency (s)")
+        parser.add_argument("--forecast-latency", type=float, default=0.08, help="Fake forecast API latency (s)")
+        parser.add_argument("--smtp-latency", type=float, default=0.2, help="Fake SMTP latency per email (s)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        benchmarks.FAKE_LATENCY.update({
+            'weather': options["weather_latency"],
+            'forecast': options["forecast_latency"],
+            'smtp': options["smtp_latency"],
+        })
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                EMAIL_BACKEND='core.benchmarks.FakeSMTPBackend',
+                EMAIL_HOST_USER='bench',
+                EMAIL_HOST_PASSWORD='bench',
+                OPENWEATHERMAP_API_KEY=django_settings.OPENWEATHERMAP_API_KEY or 'benchmark',
+                ALERT_ALLOWED_USERNAMES=[],
+                ALERT_ALLOWED_EMAILS=[],
+                CACHES=benchmarks.BENCH_CACHES,
+            ), benchmarks.patch_weather_api():
+                results = []
+                for size in sizes:
+                    results.extend(self.run_size(size, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = json.dumps({
+            'commit': self.git_commit(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in (
+                'sizes', 'requests', 'alert_runs', 'searches_per_user', 'alerts_per_user',
+                'locations_per_user', 'weather_latency', 'forecast_latency', 'smtp_latency', 'seed',
+            )},
+            'results': results,
+        }, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(report + "\n")
+            self.stderr.write(f"Wrote {len(results)} results to {options['output']}")
+        else:
+            self.stdout.write(report)
+
+    def run_size(self, size: int, options) -> list[dict]:
+        cache.clear()
+        weather_cache.local.clear()
+        for model in (AlertHistory, User, Observation):
+            model.objects.all().delete()
+        users = benchmarks.seed(
+            size,
+            options["searches_per_user"],
+            options["alerts_per_user"],
+            options["locations_per_user"],
+            options["seed"],
+        )
+        staff = User.objects.create_user('bench-admin', 'admin@example.com', 'benchmark', is_staff=True)
+        rng = random.Random(options["seed"])
+        iterations = options["requests"]
+        self.stderr.write(f"Seeded {size} users; running scenarios...")
+
+        user_client = Client()
+        staff_client = Client()
+        staff_client.force_login(staff)
+
+        def dashboard_get(i):
+            user_client.force_login(users[i % len(users)])
+            user_client.get('/dashboard/')
+
+        def dashboard_post(i):
+            user_client.force_login(users[i % len(users)])
+            user_client.post('/dashboard/', {'city': rng.choice(benchmarks.BENCH_CITIES)})
+
+        def process_alerts(_i):
+            # Measure a full pass over every location, not a run the scheduler defers.
+            AlertSchedule.objects.all().delete()
+            call_command('process_alerts', stdout=io.StringIO())
+
+        return [
+            benchmarks.measure('dashboard_get', size, dashboard_get, iterations),
+            benchmarks.measure('dashboard_post', size, dashboard_post, iterations),
+            benchmarks.measure('admin_dashboard', size, lambda _i: staff_client.get('/admin-dashboard/'), iterations),
+            benchmarks.measure('search_history', size, lambda _i: staff_client.get('/admin-panel/search-history/'), iterations),
+            benchmarks.measure('process_alerts', size, process_alerts, options["alert_runs"]),
+        ]
+
+    @staticmethod
+    def git_commit() -> str | None:
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True, text=True, check=True,
+                cwd=django_settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
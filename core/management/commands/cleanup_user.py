@@ -1,38 +1,77 @@
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
 
-from core.models import AlertHistory, AlertPreference, SavedLocation, UserSetting, WeatherSearch
+from core.deletion import claim, resumable_jobs, run_job, start_deletion
+from core.fragments import bump_user_version
+from core.models import AlertPreference
 
 
 class Command(BaseCommand):
-    help = "Disable or delete a user and related data."
+    help = "Disable or delete users and related data."
 
     def add_arguments(self, parser):
-        parser.add_argument("username", type=str, help="Username to clean up")
+        parser.add_argument("usernames", nargs="*", help="Usernames to clean up")
         parser.add_argument(
             "--delete",
             action="store_true",
-            help="Delete the user and related records (default: disable alerts only)",
+            help="Delete the users and related records in batches (default: disable alerts only)",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Also resume interrupted or failed deletion jobs",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows deleted per transaction (default: DELETION_BATCH_SIZE)",
         )
 
     def handle(self, *args, **options):
-        username = options["username"]
-        delete = options["delete"]
+        self.verbosity = options["verbosity"]
+        usernames = list(dict.fromkeys(options["usernames"]))
+        if not usernames and not options["resume"]:
+            raise CommandError("Give at least one username, or --resume")
 
         User = get_user_model()
-        user = User.objects.filter(username=username).first()
-        if not user:
-            raise CommandError(f"User '{username}' not found")
-
-        if delete:
-            AlertHistory.objects.filter(alert__user=user).delete()
-            AlertPreference.objects.filter(user=user).delete()
-            WeatherSearch.objects.filter(user=user).delete()
-            SavedLocation.objects.filter(user=user).delete()
-            UserSetting.objects.filter(user=user).delete()
-            user.delete()
-            self.stdout.write(f"Deleted user '{username}' and related records.")
+        users = list(User.objects.filter(username__in=usernames))
+        missing = sorted(set(usernames) - {user.username for user in users})
+        if missing:
+            raise CommandError(f"User(s) not found: {', '.join(missing)}")
+
+        if not options["delete"]:
+            AlertPreference.objects.filter(user__in=users).update(is_active=False)
+            for user in users:
+                bump_user_version(user.id)
+                self.stdout.write(f"Disabled alerts for user '{user.username}'.")
+            if options["resume"]:
+                self.run_jobs(list(resumable_jobs()), options["batch_size"])
             return
 
-        AlertPreference.objects.filter(user=user).update(is_active=False)
-        self.stdout.write(f"Disabled alerts for user '{username}'.")
+        jobs = [start_deletion(user) for user in users]
+        if options["resume"]:
+            jobs += [job for job in resumable_jobs() if job not in jobs]
+        self.run_jobs(jobs, options["batch_size"])
+
+    def run_jobs(self, jobs, batch_size):
+        failed = []
+        for job in jobs:
+            if not claim(job):
+                self.stdout.write(f"Skipping '{job.username}': its deletion is running elsewhere.")
+                continue
+            self.stdout.write(f"Deleting user '{job.username}'...")
+            try:
+                run_job(job, batch_size, progress=self.report)
+            except Exception as exc:
+                failed.append(job.username)
+                self.stderr.write(f"  failed: {exc}")
+                continue
+            summary = ", ".join(f"{count} {name}" for name, count in job.deleted.items()) or "no related records"
+            self.stdout.write(f"Deleted user '{job.username}' and related records ({summary}).")
+        if failed:
+            raise CommandError(f"Deletion failed for: {', '.join(failed)} (rerun with --resume)")
+
+    def report(self, job, step, deleted):
+        if self.verbosity > 1:
+            self.stdout.write(f"  {step}: {job.deleted[step]} deleted")
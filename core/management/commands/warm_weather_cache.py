@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from core import alert_events, weather_cache
+from core.models import AlertPreference, SavedLocation
+from core.views import (
+    fetch_forecast,
+    fetch_one_call,
+    fetch_weather,
+    most_searched_cities,
+    one_call_enabled,
+    weather_cache_key,
+)
+
+
+def hot_cities(limit: int) -> list[str]:
+    """Rank city queries by active alerts, favorite saved locations and search volume."""
+    scores: Counter[str] = Counter()
+    queries: dict[str, str] = {}
+
+    def add(city: str, country: str, weight: int) -> None:
+        city = (city or "").strip()
+        if not city:
+            return
+        query = f"{city},{country.strip()}" if (country or "").strip() else city
+        key = query.lower()
+        queries.setdefault(key, query)
+        scores[key] += weight
+
+    alert_rows = (
+        AlertPreference.objects.filter(is_active=True)
+        .values('city', 'country')
+        .annotate(total=Count('id'))
+    )
+    for row in alert_rows:
+        add(row['city'], row['country'], row['total'])
+
+    favorite_rows = (
+        SavedLocation.objects.filter(favorite=True)
+        .values('city', 'country')
+        .annotate(total=Count('id'))
+    )
+    for row in favorite_rows:
+        add(row['city'], row['country'], row['total'])
+
+    for row in most_searched_cities(limit):
+        add(row['city'], "", row['total'])
+
+    return [queries[key] for key, _total in scores.most_common(limit)]
+
+
+class Command(BaseCommand):
+    help = "Refresh cached current weather and forecasts for the most popular cities before they expire."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=django_settings.WARM_CACHE_TOP_N,
+            help="Number of hot cities to keep warm",
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=django_settings.WARM_CACHE_REQUEST_BUDGET,
+            help="Maximum upstream API requests per run",
+        )
+        parser.add_argument(
+            "--lead",
+            type=int,
+            default=django_settings.WARM_CACHE_LEAD_SECONDS,
+            help="Refresh entries expiring within this many seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and warm again every N seconds (default: run once)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.warm(options["top"], options["budget"], options["lead"])
+            # New observations stored while warming are evaluated for alerts
+            # in the background; let that finish before exiting or sleeping.
+            alert_events.drain()
+            if options["interval"] <= 0:
+                return
+            time.sleep(options["interval"])
+
+    def warm(self, top: int, budget: int, lead: int) -> None:
+        cities = hot_cities(top)
+        if not cities:
+            self.stdout.write("No hot cities to warm.")
+            return
+
+        if one_call_enabled():
+            fetchers = (('onecall', fetch_one_call),)
+        else:
+            fetchers = (('weather', fetch_weather), ('forecast', fetch_forecast))
+        requests_used = 0
+        refreshed = 0
+        fresh = 0
+        errors = 0
+
+        for city in cities:
+            for kind, fetch in fetchers:
+                expires_at = weather_cache.expires_at(weather_cache_key(kind, city))
+                if expires_at is not None and expires_at - time.time() > lead:
+                    fresh += 1
+                    continue
+                if requests_used >= budget:
+                    self.stdout.write(
+                        f"Request budget of {budget} reached. Refreshed {refreshed}. Fresh {fresh}. Errors {errors}."
+                    )
+                    return
+                requests_used += 1
+                _data, error = fetch(city, refresh=True)
+                if error:
+                    errors += 1
+                else:
+                    refreshed += 1
+
+        self.stdout.write(
+            f"Warmed {len(cities)} cities. Refreshed {refreshed}. Fresh {fresh}. Errors {errors}."
+        )
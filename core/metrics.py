@@ -0,0 +1,224 @@
+"""Counters and histograms exported in the Prometheus text format.
+
+Every metric declares its label values up front, so the full set of series is
+known without a registry of "seen" label combinations. Values accumulate in
+process memory and a background thread flushes them as integer increments
+into the shared Django cache every FLUSH_INTERVAL seconds, so requests never
+wait on it; scrapes and process exit flush too. With `REDIS_URL` set, the web
+workers and the alert cron therefore report into the same totals. Durations are stored in microseconds
+because cache increments are integer-only.
+"""
+from __future__ import annotations
+
+import atexit
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "metrics"
+FLUSH_INTERVAL = 10.0
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_pending: dict[str, int] = {}
+_flusher: threading.Thread | None = None
+_metrics: list[Metric] = []
+
+
+def _label_string(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{name}="{value}"' for name, value in labels.items())
+    return "{" + inner + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: dict[str, tuple[str, ...]] | None = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        _metrics.append(self)
+
+    @property
+    def family(self) -> str:
+        """Name declared in # HELP/# TYPE; every sample name belongs to it."""
+        return self.name
+
+    def label_sets(self) -> list[dict[str, str]]:
+        names = list(self.labels)
+        return [dict(zip(names, values)) for values in itertools.product(*self.labels.values())]
+
+    def _check(self, labels: dict[str, str]) -> None:
+        for name, value in labels.items():
+            if value not in self.labels.get(name, ()):
+                raise ValueError(f"Unknown label {name}={value!r} for {self.name}")
+
+    def series(self, labels: dict[str, str]) -> list[tuple[str, int]]:
+        """(sample name, scale) pairs making up one labelled series."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    @property
+    def family(self) -> str:
+        return f"{self.name}_total"
+
+    def inc(self, amount: int = 1, **labels: str) -> None:
+        self._check(labels)
+        _record(f"{self.family}{_label_string(labels)}", amount)
+
+    def series(self, labels):
+        return [(f"{self.family}{_label_string(labels)}", 1)]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=None, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, seconds: float, **labels: str) -> None:
+        self._check(labels)
+        for bound in self.buckets:
+            if seconds <= bound:
+                _record(f"{self.name}_bucket{_label_string({**labels, 'le': str(bound)})}", 1)
+        _record(f"{self.name}_bucket{_label_string({**labels, 'le': '+Inf'})}", 1)
+        _record(f"{self.name}_sum{_label_string(labels)}", int(seconds * 1_000_000))
+        _record(f"{self.name}_count{_label_string(labels)}", 1)
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def series(self, labels):
+        rows = [
+            (f"{self.name}_bucket{_label_string({**labels, 'le': bound})}", 1)
+            for bound in (*[str(b) for b in self.buckets], '+Inf')
+        ]
+        rows.append((f"{self.name}_sum{_label_string(labels)}", 1_000_000))
+        rows.append((f"{self.name}_count{_label_string(labels)}", 1))
+        return rows
+
+
+def _cache_key(sample: str) -> str:
+    return f"{CACHE_PREFIX}:{sample}"
+
+
+def _record(sample: str, amount: int) -> None:
+    global _flusher
+    with _lock:
+        _pending[sample] = _pending.get(sample, 0) + amount
+        # Started lazily, so each forked server worker gets its own.
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True)
+            _flusher.start()
+
+
+def _flush_periodically() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Flushing metrics failed")
+
+
+def flush() -> None:
+    """Push in-process increments to the shared cache."""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    for sample, amount in pending.items():
+        key = _cache_key(sample)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, amount)
+
+
+# The flusher is a daemon thread: push what it has not yet when the process exits.
+atexit.register(flush)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    flush()
+    lines: list[str] = []
+    for metric in _metrics:
+        rows = [row for labels in metric.label_sets() for row in metric.series(labels)]
+        values = cache.get_many([_cache_key(sample) for sample, _scale in rows])
+        lines.append(f"# HELP {metric.family} {metric.help_text}")
+        lines.append(f"# TYPE {metric.family} {metric.kind}")
+        for sample, scale in rows:
+            value = values.get(_cache_key(sample), 0) / scale
+            lines.append(f"{sample} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Application metrics ---
+
+WEATHER_KINDS = ('weather', 'forecast', 'onecall')
+
+UPSTREAM_LATENCY = Histogram(
+    "weather_upstream_request_seconds",
+    "Latency of weather API requests.",
+    {'kind': WEATHER_KINDS},
+)
+UPSTREAM_ERRORS = Counter(
+    "weather_upstream_errors",
+    "Weather API requests that failed or returned an error status.",
+    {'kind': WEATHER_KINDS},
+)
+UPSTREAM_HEDGES = Counter(
+    "weather_upstream_hedges",
+    "Hedged weather API requests sent after the first was slower than its p95, and those that answered first.",
+    {'kind': WEATHER_KINDS, 'result': ('sent', 'won')},
+)
+CACHE_REQUESTS = Counter(
+    "weather_cache_requests",
+    "Weather cache and observation store lookups.",
+    {'kind': ('weather', 'forecast', 'onecall', 'forecast_series', 'observation'), 'result': ('hit', 'miss')},
+)
+WEATHER_L1 = Counter(
+    "weather_l1_cache",
+    "In-process weather payload cache: hits, hits revalidated against L2, misses and LRU evictions.",
+    {'result': ('hit', 'revalidated', 'miss', 'eviction')},
+)
+ALERTS_TRIGGERED = Counter(
+    "alerts_triggered",
+    "Alerts that triggered during alert processing.",
+)
+ALERT_EMAILS = Counter(
+    "alert_emails",
+    "Alert emails by delivery outcome.",
+    {'outcome': ('sent', 'failed')},
+)
+ALERT_EMAIL_LATENCY = Histogram(
+    "alert_email_send_seconds",
+    "Time spent sending one alert email over SMTP.",
+)
+ALERT_DB_WRITE_LATENCY = Histogram(
+    "alert_db_write_seconds",
+    "Time spent writing alert state and history for one trigger.",
+)
+ALERT_RUN_DURATION = Histogram(
+    "alert_run_seconds",
+    "Duration of a full process_alerts run.",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
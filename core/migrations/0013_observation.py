@@ -0,0 +1,114 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:34
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_observations(apps, schema_editor):
+    """Move the metrics copied onto each WeatherSearch into shared Observation rows."""
+    WeatherSearch = apps.get_model('core', 'WeatherSearch')
+    Observation = apps.get_model('core', 'Observation')
+    for search in WeatherSearch.objects.filter(observation__isnull=True).iterator():
+        payload = search.api_payload or {}
+        observed_at = search.searched_at
+        if payload.get('dt'):
+            observed_at = datetime.fromtimestamp(payload['dt'], tz=dt_timezone.utc)
+        main = payload.get('main', {})
+        coord = payload.get('coord', {})
+        weather = (payload.get('weather') or [{}])[0]
+        observation, _ = Observation.objects.get_or_create(
+            city_key=search.city.strip().lower(),
+            country=search.country,
+            observed_at=observed_at,
+            defaults={
+                'city': search.city,
+                'latitude': coord.get('lat'),
+                'longitude': coord.get('lon'),
+                'fetched_at': search.searched_at,
+                'temperature_c': search.temperature_c,
+                'feels_like_c': main.get('feels_like'),
+                'humidity': search.humidity,
+                'pressure_hpa': main.get('pressure'),
+                'wind_speed_kph': search.wind_speed_kph,
+                'condition_id': weather.get('id'),
+                'condition_main': search.condition_main,
+                'condition_description': search.condition_description,
+                'icon_code': search.icon_code,
+            },
+        )
+        search.observation = observation
+        search.save(update_fields=['observation'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_savedlocation_favorite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Observation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=120)),
+                ('country', models.CharField(blank=True, max_length=80)),
+                ('city_key', models.CharField(db_index=True, max_length=120)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('observed_at', models.DateTimeField()),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('temperature_c', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('feels_like_c', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('humidity', models.PositiveIntegerField(blank=True, null=True)),
+                ('pressure_hpa', models.PositiveIntegerField(blank=True, null=True)),
+                ('wind_speed_kph', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True)),
+                ('condition_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('condition_main', models.CharField(blank=True, max_length=80)),
+                ('condition_description', models.CharField(blank=True, max_length=160)),
+                ('icon_code', models.CharField(blank=True, max_length=10)),
+            ],
+            options={
+                'ordering': ['-observed_at'],
+                'indexes': [models.Index(fields=['city_key', '-fetched_at'], name='core_observ_city_ke_b205ea_idx')],
+                'unique_together': {('city_key', 'country', 'observed_at')},
+            },
+        ),
+        migrations.AddField(
+            model_name='weathersearch',
+            name='observation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='searches', to='core.observation'),
+        ),
+        migrations.RunPython(backfill_observations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='api_payload',
+        ),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='condition_description',
+        ),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='condition_main',
+        ),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='humidity',
+        ),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='icon_code',
+        ),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='temperature_c',
+        ),
+        migrations.RemoveField(
+            model_name='weathersearch',
+            name='wind_speed_kph',
+        ),
+    ]
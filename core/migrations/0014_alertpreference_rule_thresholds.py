@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_observation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertpreference',
+            name='humidity_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alertpreference',
+            name='low_temperature_threshold',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='alertpreference',
+            name='wind_speed_threshold',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True),
+        ),
+    ]
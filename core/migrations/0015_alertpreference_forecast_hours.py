@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_alertpreference_rule_thresholds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertpreference',
+            name='forecast_hours',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(6, 'Next 6 hours'), (12, 'Next 12 hours'), (24, 'Next 24 hours'), (48, 'Next 48 hours')], null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_alertpreference_forecast_hours'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alertpreference',
+            index=models.Index(fields=['user', '-last_triggered'], name='core_alertp_user_id_f88a23_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weathersearch',
+            index=models.Index(fields=['user', '-searched_at'], name='core_weathe_user_id_11298c_idx'),
+        ),
+    ]
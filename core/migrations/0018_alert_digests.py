@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerthistory',
+            name='condition',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='alerthistory',
+            name='digest_pending',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='alerthistory',
+            name='reason',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='usersetting',
+            name='alert_delivery',
+            field=models.CharField(choices=[('immediate', 'One email per alert'), ('run', 'One digest per alert check'), ('hourly', 'Hourly digest'), ('daily', 'Daily digest')], default='immediate', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='usersetting',
+            name='last_digest_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
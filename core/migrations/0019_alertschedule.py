@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_alert_digests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_key', models.CharField(max_length=210, unique=True)),
+                ('next_check_at', models.DateTimeField()),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_margin', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_alertschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertschedule',
+            name='last_forecast_dt',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alertschedule',
+            name='last_observed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
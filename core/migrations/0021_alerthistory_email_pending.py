@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_alertschedule_last_evaluated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerthistory',
+            name='email_pending',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_alerthistory_email_pending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usersetting',
+            name='temperature_unit',
+            field=models.CharField(choices=[('metric', 'Celsius (C)'), ('imperial', 'Fahrenheit (F)')], default='metric', max_length=10),
+        ),
+    ]
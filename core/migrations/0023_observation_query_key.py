@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_alter_usersetting_temperature_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observation',
+            name='query_key',
+            field=models.CharField(blank=True, db_index=True, max_length=120),
+        ),
+    ]
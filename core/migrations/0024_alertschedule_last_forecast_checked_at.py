@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_observation_query_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertschedule',
+            name='last_forecast_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
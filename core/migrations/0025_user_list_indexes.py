@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import migrations
+
+# auth_user belongs to django.contrib.auth, so its indexes for the staff user
+# list are created with SQL rather than declared on a model.
+INDEXES = {
+    'core_user_date_joined_idx': '(date_joined, id)',
+    # Match the UPPER(col::text) LIKE 'PREFIX%' that istartswith compiles to.
+    'core_user_username_prefix_idx': '(UPPER(username::text) text_pattern_ops)',
+    'core_user_email_prefix_idx': '(UPPER(email::text) text_pattern_ops)',
+}
+
+
+def create_indexes(apps, schema_editor):
+    postgres = schema_editor.connection.vendor == 'postgresql'
+    for name, columns in INDEXES.items():
+        if postgres:
+            # Built without blocking writes to the users table.
+            schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON auth_user {columns}')
+        elif name == 'core_user_date_joined_idx':
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON auth_user {columns}')
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0024_alertschedule_last_forecast_checked_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
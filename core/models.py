@@ -2,24 +2,52 @@ from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
-class WeatherSearch(models.Model):
-    user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='weather_searches'
-    )
+class Observation(models.Model):
+    """One current-weather reading for a city, keyed by the OWM `dt` timestamp."""
     city = models.CharField(max_length=120)
     country = models.CharField(max_length=80, blank=True)
+    city_key = models.CharField(max_length=120, db_index=True)
+    # The query that fetched the row when its name and country do not match it
+    # ('london,uk' for London, GB; an alias).
+    query_key = models.CharField(max_length=120, blank=True, db_index=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    observed_at = models.DateTimeField()
+    fetched_at = models.DateTimeField(default=timezone.now)
     temperature_c = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    feels_like_c = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     humidity = models.PositiveIntegerField(null=True, blank=True)
+    pressure_hpa = models.PositiveIntegerField(null=True, blank=True)
     wind_speed_kph = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    condition_id = models.PositiveIntegerField(null=True, blank=True)
     condition_main = models.CharField(max_length=80, blank=True)
     condition_description = models.CharField(max_length=160, blank=True)
     icon_code = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        ordering = ['-observed_at']
+        unique_together = ['city_key', 'country', 'observed_at']
+        indexes = [models.Index(fields=['city_key', '-fetched_at'])]
+
+    def __str__(self) -> str:
+        return f"{self.city} @ {self.observed_at:%Y-%m-%d %H:%M}"
+
+
+class WeatherSearch(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='weather_searches'
+    )
+    city = models.CharField(max_length=120)
+    country = models.CharField(max_length=80, blank=True)
+    observation = models.ForeignKey(
+        Observation, on_delete=models.SET_NULL, null=True, blank=True, related_name='searches'
+    )
     searched_at = models.DateTimeField(auto_now_add=True)
     is_deleted_by_user = models.BooleanField(default=False)
-    api_payload = models.JSONField(null=True, blank=True)
 
     class Meta:
         ordering = ['-searched_at']
+        indexes = [models.Index(fields=['user', '-searched_at'])]
 
     def __str__(self) -> str:
         return f"{self.city} ({self.user})"
@@ -32,6 +60,12 @@ class AlertPreference(models.Model):
     city = models.CharField(max_length=120)
     country = models.CharField(max_length=80, blank=True)
     temperature_threshold = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    low_temperature_threshold = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    humidity_threshold = models.PositiveIntegerField(null=True, blank=True)
+    wind_speed_threshold = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    forecast_hours = models.PositiveSmallIntegerField(
+        null=True, blank=True, choices=[(6, 'Next 6 hours'), (12, 'Next 12 hours'), (24, 'Next 24 hours'), (48, 'Next 48 hours')]
+    )
     condition_alerts = models.BooleanField(default=True)
     email_alerts = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -41,18 +75,46 @@ class AlertPreference(models.Model):
 
     class Meta:
         unique_together = ['user', 'city', 'country']
+        indexes = [models.Index(fields=['user', '-last_triggered'])]
 
     def __str__(self) -> str:
         return f"{self.user.username} - {self.city}"
 
 
+class AlertSchedule(models.Model):
+    """When process_alerts next checks one alert location."""
+
+    # Lowercased 'city' or 'city,country' query, as grouped by AlertIndex.
+    location_key = models.CharField(max_length=210, unique=True)
+    next_check_at = models.DateTimeField()
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    # Distance from the nearest threshold at the last check (see alert_engine).
+    last_margin = models.FloatField(null=True, blank=True)
+    # Upstream `dt` of the observation last evaluated for this location, and
+    # first slot `dt` (the issuance) of the forecast last evaluated.
+    last_observed_at = models.DateTimeField(null=True, blank=True)
+    last_forecast_dt = models.BigIntegerField(null=True, blank=True)
+    # When that forecast was last evaluated: each forecast horizon covered the
+    # slots up to this time plus its hours.
+    last_forecast_checked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.location_key} @ {self.next_check_at:%Y-%m-%d %H:%M}"
+
+
 class AlertHistory(models.Model):
     alert = models.ForeignKey(
         AlertPreference, on_delete=models.CASCADE, related_name='trigger_history'
     )
     temperature = models.DecimalField(max_digits=5, decimal_places=2, default=0.0)  # Added default
+    condition = models.CharField(max_length=120, blank=True)
+    reason = models.TextField(blank=True)
     triggered_at = models.DateTimeField(auto_now_add=True)
     email_sent = models.BooleanField(default=False)
+    # Waiting to go out in the user's next digest email.
+    digest_pending = models.BooleanField(default=False, db_index=True)
+    # An immediate email that has not gone out yet; retried on the next run.
+    email_pending = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         ordering = ['-triggered_at']
@@ -90,6 +152,44 @@ class UserSetting(models.Model):
     )
     dark_mode = models.BooleanField(default=True)
     enable_all_alerts = models.BooleanField(default=True)
+    alert_delivery = models.CharField(
+        max_length=10,
+        choices=[
+            ('immediate', 'One email per alert'),
+            ('run', 'One digest per alert check'),
+            ('hourly', 'Hourly digest'),
+            ('daily', 'Daily digest'),
+        ],
+        default='immediate'
+    )
+    last_digest_sent_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self) -> str:
         return f"{self.user.username} Settings"
+
+
+class DeletionJob(models.Model):
+    """Progress of a chunked user deletion (see core/deletion.py)."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # Not a foreign key: the job outlives the user it deletes.
+    user_id = models.PositiveIntegerField(db_index=True)
+    username = models.CharField(max_length=150)
+    status = models.CharField(
+        max_length=10,
+        choices=[(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')],
+        default=PENDING,
+    )
+    step = models.CharField(max_length=40, blank=True)
+    deleted = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Delete {self.username} ({self.status})"
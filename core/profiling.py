@@ -0,0 +1,225 @@
+"""Opt-in per-request timing: SQL, weather API calls and template rendering.
+
+Enabled with PERF_TIMING_ENABLED=1. A PERF_TIMING_SAMPLE_RATE fraction of
+requests is measured; measured requests get a `Server-Timing` header and one
+structured `core.profiling` log line. Staff can force measurement plus a
+cProfile capture of a single request with the `X-Profile: 1` header, and a
+PERF_PROFILE_SAMPLE_RATE fraction of measured requests is profiled as well.
+
+SQL is counted by an execute wrapper that every database connection gets when
+it connects (see `install_sql_hook`). Connections are per thread, and under
+ASGI the ORM runs in `sync_to_async` worker threads rather than on the event
+loop, so the wrapper finds the request being measured through a ContextVar,
+which asgiref carries into those threads.
+
+A profile covers only the view, started from `process_view` on the thread
+about to run it: under ASGI that is the request's thread-sensitive worker
+for sync views, while async views share the event loop thread with other
+requests and are not profiled. cProfile can only hook one thread per
+profiler and allows one active profiler per process, so a profile requested
+while another is running is skipped; the request is still timed.
+"""
+from __future__ import annotations
+
+import cProfile
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings as django_settings
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+# Held while a profile is running anywhere in the process.
+_profile_lock = threading.Lock()
+
+
+def _is_staff(request) -> bool:
+    return getattr(request.user, "is_staff", False)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.upstream_count = 0
+        self.upstream_seconds = 0.0
+        self.render_started: float | None = None
+        self.render_seconds = 0.0
+        self.profile_requested = False
+        self.profiler: cProfile.Profile | None = None
+
+    def start_profile(self) -> None:
+        """Profile the calling thread, unless another profile is running."""
+        if not _profile_lock.acquire(blocking=False):
+            return
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self) -> None:
+        """Stop the profile; call from the thread that started it."""
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.disable()
+        finally:
+            _profile_lock.release()
+
+    def server_timing(self, total: float) -> str:
+        return ", ".join([
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries"',
+            f'upstream;dur={self.upstream_seconds * 1000:.1f};desc="{self.upstream_count} calls"',
+            f'render;dur={self.render_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def record_sql(execute, sql, params, many, context):
+    """Execute wrapper counting queries towards the current request, if measured."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql_count += 1
+        timings.sql_seconds += time.perf_counter() - started
+
+
+def install_sql_hook(connection) -> None:
+    """Add `record_sql` to a connection's execute wrappers (once; it stays across reconnects)."""
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+@contextmanager
+def track_upstream():
+    """Count the wrapped weather API call towards the current request, if measured."""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.upstream_count += 1
+            timings.upstream_seconds += time.perf_counter() - started
+
+
+class RequestProfilingMiddleware:
+    """Runs in the server's mode (WSGI or ASGI) so unmeasured requests pay no adapter hop."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        force = request.headers.get("X-Profile") == "1" and _is_staff(request)
+        if not force and random.random() >= django_settings.PERF_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        with self.measure(force) as timings:
+            try:
+                response = self.get_response(request)
+            finally:
+                timings.stop_profile()
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        force = request.headers.get("X-Profile") == "1" and await sync_to_async(_is_staff)(request)
+        if not force and random.random() >= django_settings.PERF_TIMING_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        with self.measure(force) as timings:
+            try:
+                response = await self.get_response(request)
+            finally:
+                if timings.profiler is not None:
+                    # The request's thread-sensitive worker, which ran the view.
+                    await sync_to_async(timings.stop_profile, thread_sensitive=True)()
+        return self.finish(request, response, timings)
+
+    @contextmanager
+    def measure(self, force: bool):
+        """Collect timings of the wrapped request; `process_view` may add a profile."""
+        timings = RequestTimings()
+        timings.profile_requested = force or random.random() < django_settings.PERF_PROFILE_SAMPLE_RATE
+        token = _current.set(timings)
+        try:
+            yield timings
+        finally:
+            _current.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Start a requested profile of a sync view on the thread that runs it.
+
+        Under ASGI Django calls this sync hook in the request's thread-sensitive
+        worker, the same thread as a sync view.
+        """
+        timings = _current.get()
+        if timings is not None and timings.profile_requested and not iscoroutinefunction(view_func):
+            timings.start_profile()
+        return None
+
+    def finish(self, request, response, timings: RequestTimings):
+        total = time.perf_counter() - timings.started
+        response["Server-Timing"] = timings.server_timing(total)
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "sql_count": timings.sql_count,
+            "sql_ms": round(timings.sql_seconds * 1000, 1),
+            "upstream_count": timings.upstream_count,
+            "upstream_ms": round(timings.upstream_seconds * 1000, 1),
+            "render_ms": round(timings.render_seconds * 1000, 1),
+        }
+        if timings.profiler:
+            record["profile"] = self.save_profile(timings.profiler, request)
+        elif timings.profile_requested:
+            record["profile"] = None
+        logger.info("request_timing %s", json.dumps(record))
+        return response
+
+    def process_template_response(self, request, response):
+        """Time rendering of TemplateResponse views (rendering happens after this hook)."""
+        timings = _current.get()
+        if timings is not None:
+            timings.render_started = time.perf_counter()
+
+            def finish(rendered):
+                timings.render_seconds += time.perf_counter() - timings.render_started
+
+            response.add_post_render_callback(finish)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        # `process_template_response` is this method on async instances.
+        return RequestProfilingMiddleware.process_template_response(self, request, response)
+
+    @staticmethod
+    def save_profile(profiler: cProfile.Profile, request) -> str:
+        directory = Path(django_settings.PERF_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = request.path.strip("/").replace("/", "_") or "root"
+        path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{random.randrange(16 ** 6):06x}.prof"
+        profiler.dump_stats(path)
+        return str(path)
@@ -0,0 +1,609 @@
+"""Weather providers and hedged upstream requests.
+
+`fetch_weather` and `fetch_forecast` (and their async versions) ask the
+configured WEATHER_PROVIDER through `fetch`/`afetch`. Every provider returns
+OpenWeatherMap-shaped payloads, so caching, the observation store and the
+forecast views never see which one answered.
+
+Upstream latency has a long tail: most responses are fast, a few take
+seconds. When a request is still pending after the provider's running p95,
+a second, hedged request goes to WEATHER_HEDGE_PROVIDER (or the same provider
+again) and the first successful response wins. By construction only about 5%
+of requests are hedged, plus those whose first request fails outright.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import ssl
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from functools import lru_cache
+
+import certifi
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+HEDGE_QUANTILE = 0.95
+# Latencies kept per (provider, kind), and how many are needed before hedging.
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+HEDGE_POOL_SIZE = 32
+GEOCODE_TTL = 7 * 24 * 3600
+
+
+class ProviderError(Exception):
+    """The provider could not be reached or sent an unreadable response."""
+
+
+class WeatherProvider:
+    """Fetches `weather` (current) and `forecast` payloads in OpenWeatherMap's shape.
+
+    ``get``/``aget`` return ``(status_code, payload)``; the payload is only
+    required for status 200. Network failures raise ProviderError. Providers
+    listing `onecall` in ``kinds`` also return One Call payloads (see below).
+    """
+    name = ''
+    kinds: tuple[str, ...] = ('weather', 'forecast')
+
+    def configuration_error(self) -> str | None:
+        """Why the provider cannot be used, or None if it can."""
+        return None
+
+    def get(self, kind: str, city: str) -> tuple[int, dict | None]:
+        raise NotImplementedError
+
+    async def aget(self, kind: str, city: str) -> tuple[int, dict | None]:
+        raise NotImplementedError
+
+
+# --- HTTP clients ---
+
+_ssl_context: ssl.SSLContext | None = None
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """Pooled AsyncClient for the running event loop.
+
+    Uvicorn runs one loop per worker, so this is one client per worker; the SSL
+    context is built once per process because it dominates client creation.
+    """
+    global _ssl_context
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        if _ssl_context is None:
+            _ssl_context = ssl.create_default_context(cafile=certifi.where())
+        client = _async_clients[loop] = httpx.AsyncClient(timeout=settings.WEATHER_UPSTREAM_TIMEOUT, verify=_ssl_context)
+    return client
+
+
+def http_get(url: str, params: dict) -> tuple[int, dict | None]:
+    try:
+        response = requests.get(url, params=params, timeout=settings.WEATHER_UPSTREAM_TIMEOUT)
+        return response.status_code, response.json() if response.status_code == 200 else None
+    except (requests.RequestException, ValueError) as exc:
+        raise ProviderError(str(exc)) from exc
+
+
+async def ahttp_get(url: str, params: dict) -> tuple[int, dict | None]:
+    try:
+        response = await async_http_client().get(url, params=params)
+        return response.status_code, response.json() if response.status_code == 200 else None
+    except (httpx.HTTPError, ValueError) as exc:
+        raise ProviderError(str(exc)) from exc
+
+
+# --- One Call payloads ---
+# `onecall` payloads have the shape of OWM's One Call 3.0 response (`current`,
+# `hourly`, `daily`, `alerts`, `timezone_offset`), plus the geocoded `name`
+# and `country`. `weather` and `forecast` payloads can be derived from them.
+
+FORECAST_STEP = 3 * 3600
+FORECAST_DAYS = 5
+FORECAST_SLOTS = 40
+# Local hours, and daily temperature fields, of the slots made from daily entries.
+DAY_PARTS = ((9, 'morn'), (15, 'day'), (21, 'eve'))
+
+
+def one_call_current(payload: dict) -> dict:
+    """An OWM `weather` payload for the current conditions of a One Call payload."""
+    current = payload.get('current', {})
+    return {
+        'coord': {'lat': payload.get('lat'), 'lon': payload.get('lon')},
+        'weather': current.get('weather') or [{}],
+        'main': {
+            'temp': current.get('temp'),
+            'feels_like': current.get('feels_like'),
+            'pressure': current.get('pressure'),
+            'humidity': current.get('humidity'),
+        },
+        'wind': {'speed': current.get('wind_speed') or 0},
+        'dt': current.get('dt'),
+        'sys': {'country': payload.get('country', '')},
+        'timezone': payload.get('timezone_offset', 0),
+        'name': payload.get('name', ''),
+        'uvi': current.get('uvi'),
+    }
+
+
+def forecast_slot(dt: int, entry: dict, part: str | None = None) -> dict:
+    temp, feels_like = entry.get('temp'), entry.get('feels_like')
+    if part:
+        temp = (temp or {}).get(part, (temp or {}).get('day'))
+        feels_like = (feels_like or {}).get(part, (feels_like or {}).get('day'))
+    return {
+        'dt': dt,
+        'main': {'temp': temp, 'feels_like': feels_like, 'pressure': entry.get('pressure'), 'humidity': entry.get('humidity')},
+        'weather': entry.get('weather') or [{}],
+        'wind': {'speed': entry.get('wind_speed') or 0},
+        'pop': entry.get('pop', 0),
+    }
+
+
+def one_call_forecast(payload: dict) -> dict:
+    """An OWM 5-day/3-hour `forecast` payload from a One Call payload.
+
+    Hourly entries on 3-hour boundaries come first; days past the end of the
+    hourly data get morning, afternoon and evening slots from the daily entries.
+    """
+    offset = payload.get('timezone_offset', 0)
+    start = payload.get('current', {}).get('dt') or int(time.time())
+    end = start + FORECAST_DAYS * 86400
+    slots = [
+        forecast_slot(entry['dt'], entry) for entry in payload.get('hourly', [])
+        if entry.get('dt') and start < entry['dt'] <= end and not entry['dt'] % FORECAST_STEP
+    ]
+    last = slots[-1]['dt'] if slots else start
+    for day in payload.get('daily', []):
+        midnight = (day['dt'] + offset) // 86400 * 86400 - offset
+        for hour, part in DAY_PARTS:
+            dt = midnight + hour * 3600
+            if last < dt <= end:
+                slots.append(forecast_slot(dt, day, part))
+    return {
+        'city': {
+            'name': payload.get('name', ''),
+            'country': payload.get('country', ''),
+            'timezone': offset,
+            'coord': {'lat': payload.get('lat'), 'lon': payload.get('lon')},
+        },
+        'list': slots[:FORECAST_SLOTS],
+    }
+
+
+class GeocodingProvider(WeatherProvider):
+    """A provider whose endpoints take coordinates.
+
+    Cities are geocoded once and cached for a week, as ``{'name', 'country',
+    'lat', 'lon'}``.
+    """
+
+    def geocode_request(self, city: str) -> tuple[str, dict]:
+        raise NotImplementedError
+
+    def parse_place(self, data) -> dict | None:
+        raise NotImplementedError
+
+    def geocode_key(self, city: str) -> str:
+        return f"geocode:{self.name}:{city.strip().lower().replace(' ', '_')}"
+
+    def place(self, status: int, data) -> dict | None:
+        if status != 200:
+            raise ProviderError(f"Geocoding returned {status}")
+        return self.parse_place(data)
+
+    def locate(self, city: str) -> dict | None:
+        place = cache.get(self.geocode_key(city))
+        if place is None:
+            place = self.place(*http_get(*self.geocode_request(city)))
+            if place is not None:
+                cache.set(self.geocode_key(city), place, GEOCODE_TTL)
+        return place
+
+    async def alocate(self, city: str) -> dict | None:
+        place = await cache.aget(self.geocode_key(city))
+        if place is None:
+            place = self.place(*await ahttp_get(*self.geocode_request(city)))
+            if place is not None:
+                await cache.aset(self.geocode_key(city), place, GEOCODE_TTL)
+        return place
+
+
+# --- OpenWeatherMap ---
+
+OWM_GEOCODING_URL = 'https://api.openweathermap.org/geo/1.0/direct'
+OWM_ONE_CALL_URL = 'https://api.openweathermap.org/data/3.0/onecall'
+
+
+def owm_request(kind: str, city: str) -> tuple[str, dict]:
+    """URL and query params for an OpenWeatherMap `weather` or `forecast` call."""
+    url = f'https://api.openweathermap.org/data/2.5/{kind}'
+    params = {'q': city, 'appid': settings.OPENWEATHERMAP_API_KEY, 'units': 'metric'}
+    return url, params
+
+
+class OpenWeatherMapProvider(GeocodingProvider):
+    """OpenWeatherMap's 2.5 `weather` and `forecast`, and One Call 3.0 for `onecall`."""
+    name = 'openweathermap'
+    kinds = ('weather', 'forecast', 'onecall')
+
+    def configuration_error(self):
+        if not settings.OPENWEATHERMAP_API_KEY:
+            return "API Key is missing in settings."
+        return None
+
+    def geocode_request(self, city):
+        return OWM_GEOCODING_URL, {'q': city, 'limit': 1, 'appid': settings.OPENWEATHERMAP_API_KEY}
+
+    def parse_place(self, data):
+        if not data:
+            return None
+        place = data[0]
+        return {'name': place.get('name', ''), 'country': place.get('country', ''), 'lat': place['lat'], 'lon': place['lon']}
+
+    def one_call_request(self, place: dict) -> tuple[str, dict]:
+        return OWM_ONE_CALL_URL, {
+            'lat': place['lat'],
+            'lon': place['lon'],
+            'exclude': 'minutely',
+            'units': 'metric',
+            'appid': settings.OPENWEATHERMAP_API_KEY,
+        }
+
+    @staticmethod
+    def named(status: int, data: dict | None, place: dict) -> tuple[int, dict | None]:
+        if status != 200:
+            return status, None
+        return status, {**data, 'name': place['name'], 'country': place['country']}
+
+    def get(self, kind, city):
+        if kind != 'onecall':
+            return http_get(*owm_request(kind, city))
+        place = self.locate(city)
+        if place is None:
+            return 404, None
+        return self.named(*http_get(*self.one_call_request(place)), place)
+
+    async def aget(self, kind, city):
+        if kind != 'onecall':
+            return await ahttp_get(*owm_request(kind, city))
+        place = await self.alocate(city)
+        if place is None:
+            return 404, None
+        return self.named(*await ahttp_get(*self.one_call_request(place)), place)
+
+
+# --- Open-Meteo ---
+
+# WMO weather code -> (OWM condition id, main, description, icon without d/n).
+WMO_CONDITIONS = {
+    0: (800, 'Clear', 'clear sky', '01'),
+    1: (801, 'Clouds', 'few clouds', '02'),
+    2: (802, 'Clouds', 'scattered clouds', '03'),
+    3: (804, 'Clouds', 'overcast clouds', '04'),
+    45: (741, 'Fog', 'fog', '50'),
+    48: (741, 'Fog', 'fog', '50'),
+    51: (300, 'Drizzle', 'light intensity drizzle', '09'),
+    53: (301, 'Drizzle', 'drizzle', '09'),
+    55: (302, 'Drizzle', 'heavy intensity drizzle', '09'),
+    56: (511, 'Rain', 'freezing rain', '13'),
+    57: (511, 'Rain', 'freezing rain', '13'),
+    61: (500, 'Rain', 'light rain', '10'),
+    63: (501, 'Rain', 'moderate rain', '10'),
+    65: (502, 'Rain', 'heavy intensity rain', '10'),
+    66: (511, 'Rain', 'freezing rain', '13'),
+    67: (511, 'Rain', 'freezing rain', '13'),
+    71: (600, 'Snow', 'light snow', '13'),
+    73: (601, 'Snow', 'snow', '13'),
+    75: (602, 'Snow', 'heavy snow', '13'),
+    77: (600, 'Snow', 'light snow', '13'),
+    80: (520, 'Rain', 'light intensity shower rain', '09'),
+    81: (521, 'Rain', 'shower rain', '09'),
+    82: (522, 'Rain', 'heavy intensity shower rain', '09'),
+    85: (620, 'Snow', 'light shower snow', '13'),
+    86: (622, 'Snow', 'heavy shower snow', '13'),
+    95: (211, 'Thunderstorm', 'thunderstorm', '11'),
+    96: (201, 'Thunderstorm', 'thunderstorm with rain', '11'),
+    99: (202, 'Thunderstorm', 'thunderstorm with heavy rain', '11'),
+}
+OPEN_METEO_FIELDS = 'temperature_2m,apparent_temperature,relative_humidity_2m,pressure_msl,wind_speed_10m,weather_code,is_day,uv_index'
+OPEN_METEO_DAILY_FIELDS = (
+    'weather_code,temperature_2m_max,temperature_2m_min,apparent_temperature_max,'
+    'wind_speed_10m_max,precipitation_probability_max,uv_index_max'
+)
+
+
+def owm_condition(code, is_day=1) -> dict:
+    condition_id, main, description, icon = WMO_CONDITIONS.get(code, WMO_CONDITIONS[3])
+    return {'id': condition_id, 'main': main, 'description': description, 'icon': icon + ('d' if is_day else 'n')}
+
+
+def column(series: dict, field: str, i: int):
+    values = series.get(field) or []
+    return values[i] if i < len(values) else None
+
+
+def percent(value) -> float:
+    return value / 100 if value is not None else 0
+
+
+class OpenMeteoProvider(GeocodingProvider):
+    """Open-Meteo, or any endpoint compatible with its forecast and geocoding APIs.
+
+    Every kind is one coordinate-based request whose response is converted to
+    a One Call payload (WMO weather codes become OWM condition ids), and from
+    there to the `weather` or `forecast` shape.
+    """
+    name = 'open-meteo'
+    kinds = ('weather', 'forecast', 'onecall')
+
+    def geocode_request(self, city):
+        name, _, country = city.partition(',')
+        params = {'name': name.strip(), 'count': 1, 'format': 'json'}
+        if country.strip():
+            params['countryCode'] = country.strip().upper()
+        return settings.OPEN_METEO_GEOCODING_URL, params
+
+    def parse_place(self, data):
+        results = (data or {}).get('results') or []
+        if not results:
+            return None
+        place = results[0]
+        return {'name': place.get('name', ''), 'country': place.get('country_code', ''), 'lat': place['latitude'], 'lon': place['longitude']}
+
+    def forecast_request(self, kind: str, place: dict) -> tuple[str, dict]:
+        params = {
+            'latitude': place['lat'],
+            'longitude': place['lon'],
+            'wind_speed_unit': 'ms',
+            'timeformat': 'unixtime',
+            'timezone': 'auto',
+        }
+        if kind in ('weather', 'onecall'):
+            params['current'] = OPEN_METEO_FIELDS
+        if kind in ('forecast', 'onecall'):
+            params['hourly'] = OPEN_METEO_FIELDS + ',precipitation_probability'
+            params['forecast_days'] = FORECAST_DAYS + 1
+        if kind == 'onecall':
+            params['daily'] = OPEN_METEO_DAILY_FIELDS
+        return settings.OPEN_METEO_URL, params
+
+    def get(self, kind, city):
+        place = self.locate(city)
+        if place is None:
+            return 404, None
+        status, data = http_get(*self.forecast_request(kind, place))
+        return status, self.normalize(kind, place, data) if status == 200 else None
+
+    async def aget(self, kind, city):
+        place = await self.alocate(city)
+        if place is None:
+            return 404, None
+        status, data = await ahttp_get(*self.forecast_request(kind, place))
+        return status, self.normalize(kind, place, data) if status == 200 else None
+
+    def normalize(self, kind: str, place: dict, data: dict) -> dict:
+        payload = self.one_call(place, data)
+        if kind == 'weather':
+            return one_call_current(payload)
+        if kind == 'forecast':
+            return one_call_forecast(payload)
+        return payload
+
+    @staticmethod
+    def one_call(place: dict, data: dict) -> dict:
+        current = data.get('current', {})
+        hourly = data.get('hourly', {})
+        daily = data.get('daily', {})
+        return {
+            'lat': place['lat'],
+            'lon': place['lon'],
+            'name': place['name'],
+            'country': place['country'],
+            'timezone_offset': data.get('utc_offset_seconds', 0),
+            'current': {
+                'dt': current.get('time'),
+                'temp': current.get('temperature_2m'),
+                'feels_like': current.get('apparent_temperature'),
+                'pressure': current.get('pressure_msl'),
+                'humidity': current.get('relative_humidity_2m'),
+                'uvi': current.get('uv_index'),
+                'wind_speed': current.get('wind_speed_10m'),
+                'weather': [owm_condition(current.get('weather_code'), current.get('is_day', 1))],
+            },
+            'hourly': [
+                {
+                    'dt': dt,
+                    'temp': column(hourly, 'temperature_2m', i),
+                    'feels_like': column(hourly, 'apparent_temperature', i),
+                    'pressure': column(hourly, 'pressure_msl', i),
+                    'humidity': column(hourly, 'relative_humidity_2m', i),
+                    'uvi': column(hourly, 'uv_index', i),
+                    'wind_speed': column(hourly, 'wind_speed_10m', i),
+                    'weather': [owm_condition(column(hourly, 'weather_code', i), column(hourly, 'is_day', i))],
+                    'pop': percent(column(hourly, 'precipitation_probability', i)),
+                }
+                for i, dt in enumerate(hourly.get('time', []))
+            ],
+            'daily': [
+                {
+                    'dt': dt,
+                    'temp': {'day': column(daily, 'temperature_2m_max', i), 'min': column(daily, 'temperature_2m_min', i),
+                             'max': column(daily, 'temperature_2m_max', i)},
+                    'feels_like': {'day': column(daily, 'apparent_temperature_max', i)},
+                    'uvi': column(daily, 'uv_index_max', i),
+                    'wind_speed': column(daily, 'wind_speed_10m_max', i),
+                    'weather': [owm_condition(column(daily, 'weather_code', i))],
+                    'pop': percent(column(daily, 'precipitation_probability_max', i)),
+                }
+                for i, dt in enumerate(daily.get('time', []))
+            ],
+        }
+
+
+# --- Hedging ---
+
+class LatencyTracker:
+    """Recent upstream latencies per (provider, kind), for the hedging threshold."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: dict[tuple[str, str], deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault((provider, kind), deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, provider: str, kind: str, q: float = HEDGE_QUANTILE) -> float | None:
+        """The ``q`` quantile of recent latencies, or None below MIN_SAMPLES."""
+        with self._lock:
+            samples = sorted(self._samples.get((provider, kind), ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+latencies = LatencyTracker()
+_pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix='weather-upstream')
+
+
+@lru_cache(maxsize=None)
+def load_provider(path: str) -> WeatherProvider:
+    return import_string(path)()
+
+
+def primary() -> WeatherProvider:
+    return load_provider(settings.WEATHER_PROVIDER)
+
+
+def hedge_provider(kind: str) -> WeatherProvider | None:
+    """The provider hedged ``kind`` requests go to, or None when hedging is off or it is unusable."""
+    if not settings.WEATHER_HEDGE_ENABLED:
+        return None
+    provider = load_provider(settings.WEATHER_HEDGE_PROVIDER or settings.WEATHER_PROVIDER)
+    if provider.configuration_error() or kind not in provider.kinds:
+        return None
+    return provider
+
+
+def hedge_delay(provider: WeatherProvider, kind: str) -> float | None:
+    """Seconds to wait for ``provider`` before hedging, or None while its latencies are unknown."""
+    p95 = latencies.quantile(provider.name, kind)
+    if p95 is None:
+        return None
+    return max(p95, settings.WEATHER_HEDGE_MIN_DELAY_MS / 1000)
+
+
+def timed_get(provider: WeatherProvider, kind: str, city: str) -> tuple[int, dict | None]:
+    started = time.perf_counter()
+    try:
+        return provider.get(kind, city)
+    finally:
+        latencies.record(provider.name, kind, time.perf_counter() - started)
+
+
+async def atimed_get(provider: WeatherProvider, kind: str, city: str) -> tuple[int, dict | None]:
+    started = time.perf_counter()
+    try:
+        return await provider.aget(kind, city)
+    finally:
+        # A cancelled loser records how long it had been waiting: a lower bound.
+        latencies.record(provider.name, kind, time.perf_counter() - started)
+
+
+def first_success(outcomes: list) -> tuple[int, dict | None]:
+    """Pick the answer once every request has finished without a 200.
+
+    ``outcomes`` are (status, payload) tuples or exceptions, primary first.
+    """
+    for outcome in outcomes:
+        if not isinstance(outcome, Exception):
+            return outcome
+    raise outcomes[0]
+
+
+def fetch(kind: str, city: str) -> tuple[int, dict | None]:
+    """``(status, payload)`` for a `weather`, `forecast` or `onecall` request, hedged when slow.
+
+    Raises ProviderError when no provider could be reached.
+    """
+    provider = primary()
+    hedge = hedge_provider(kind)
+    delay = hedge_delay(provider, kind) if hedge else None
+    if delay is None:
+        return timed_get(provider, kind, city)
+
+    # The hedge shares the primary's time budget rather than getting its own.
+    deadline = time.monotonic() + settings.WEATHER_UPSTREAM_TIMEOUT
+    first = _pool.submit(timed_get, provider, kind, city)
+    try:
+        return first.result(timeout=delay)
+    except FuturesTimeout:
+        pass
+    except ProviderError:
+        # Failed before the hedge was due: fall over to it right away.
+        pass
+    metrics.UPSTREAM_HEDGES.inc(kind=kind, result='sent')
+    second = _pool.submit(timed_get, hedge, kind, city)
+
+    # The losing request is left to finish on the pool; its latency still counts.
+    pending = {first, second}
+    while pending:
+        remaining = max(deadline - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            raise ProviderError("Weather providers timed out")
+        for future in done:
+            if future.exception() is None and future.result()[0] == 200:
+                if future is second:
+                    metrics.UPSTREAM_HEDGES.inc(kind=kind, result='won')
+                return future.result()
+    return first_success([future.exception() or future.result() for future in (first, second)])
+
+
+async def afetch(kind: str, city: str) -> tuple[int, dict | None]:
+    """Async version of `fetch`; the losing request is cancelled."""
+    provider = primary()
+    hedge = hedge_provider(kind)
+    delay = hedge_delay(provider, kind) if hedge else None
+    if delay is None:
+        return await atimed_get(provider, kind, city)
+
+    first = asyncio.ensure_future(atimed_get(provider, kind, city))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done and not isinstance(first.exception(), ProviderError):
+        return first.result()
+    metrics.UPSTREAM_HEDGES.inc(kind=kind, result='sent')
+    second = asyncio.ensure_future(atimed_get(hedge, kind, city))
+
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result()[0] == 200:
+                    if task is second:
+                        metrics.UPSTREAM_HEDGES.inc(kind=kind, result='won')
+                    return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    return first_success([task.exception() or task.result() for task in (first, second)])
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import alert_events, profiling
+from .fragments import bump_user_version
+from .models import AlertPreference, SavedLocation, UserSetting, WeatherSearch
+
+# Sent with `observation` when an observation with a new upstream `dt` is stored.
+observation_stored = Signal()
+
+
+@receiver([post_save, post_delete], sender=WeatherSearch)
+@receiver([post_save, post_delete], sender=AlertPreference)
+@receiver([post_save, post_delete], sender=SavedLocation)
+@receiver([post_save, post_delete], sender=UserSetting)
+def invalidate_user_fragments(sender, instance, **kwargs):
+    """Drop the owner's cached page fragments when one of their records changes."""
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_account_fragments(sender, instance, update_fields=None, **kwargs):
+    """Cached fragments show the account's email; logins only touch last_login."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_user_version(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=AlertPreference)
+def invalidate_alert_index(sender, **kwargs):
+    alert_events.invalidate_index()
+
+
+@receiver(observation_stored)
+def evaluate_observation_alerts(sender, observation, **kwargs):
+    alert_events.on_observation_stored(observation)
+
+
+@receiver(connection_created)
+def count_request_queries(sender, connection, **kwargs):
+    """Let request profiling count queries on whichever thread's connection runs them."""
+    profiling.install_sql_hook(connection)
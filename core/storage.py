@@ -0,0 +1,31 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from . import images
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Manifest storage that also optimizes images (see `core.images`).
+
+    Variants and minified SVGs are written to STATIC_ROOT before the parent
+    class runs, so they are hashed and compressed like any other asset.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            index = {}
+            for name in list(paths):
+                if images.is_svg(name):
+                    with self.open(name) as handle:
+                        source = handle.read().decode()
+                    images.replace_file(self, name, images.minify_svg(source).encode())
+                    paths[name] = (self, name)
+                elif images.is_raster(name):
+                    entry = images.build_variants(self, name)
+                    if entry:
+                        index[name] = entry
+                        for rows in entry["variants"].values():
+                            for variant, _width in rows:
+                                paths[variant] = (self, variant)
+            images.write_index(self, index)
+        yield from super().post_process(paths, dry_run, **options)
@@ -0,0 +1,46 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.encoding import iri_to_uri
+from django.utils.html import format_html, format_html_join
+
+from core.images import load_index
+
+register = template.Library()
+
+
+def _url(name: str) -> str:
+    # srcset entries are space-separated, so spaces in filenames must be escaped.
+    return iri_to_uri(static(name))
+
+
+def _srcset(rows) -> str:
+    return ", ".join(f"{_url(name)} {width}w" for name, width in rows)
+
+
+@register.simple_tag
+def picture(name, alt="", sizes="100vw", css_class="", loading="lazy", fetchpriority="auto"):
+    """Responsive ``<picture>`` for a static image, falling back to a plain ``<img>``.
+
+    Uses the AVIF/WebP/JPEG variants produced by `collectstatic`; without them
+    (e.g. in development) the original file is referenced directly.
+    """
+    entry = load_index().get(name)
+    if not entry:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async" fetchpriority="{}">',
+            _url(name), alt, css_class, loading, fetchpriority,
+        )
+
+    variants = entry["variants"]
+    fallback = variants.get("image/jpeg") or next(iter(variants.values()))
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime, _srcset(rows), sizes) for mime, rows in variants.items() if rows is not fallback),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async" fetchpriority="{}"></picture>',
+        sources, _url(fallback[-1][0]), _srcset(fallback), sizes,
+        entry["width"], entry["height"], alt, css_class, loading, fetchpriority,
+    )
@@ -1,3 +1,2685 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.utils import load_backend
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone as dj_timezone
+from django.utils.http import http_date
+
+from . import alert_events, alert_runner, benchmarks, codec, db, deletion, fragments, images, metrics, profiling, providers, weather_cache
+from .alert_runner import SCHEDULE_SLACK, AlertRun, location_due
+from .management.commands.bench_cache_codec import full_current, full_forecast, full_one_call
+from .management.commands.warm_weather_cache import hot_cities
+from .alert_engine import (
+    SEVERE_CONDITION_RANGES, AlertIndex, LocationRules, check_interval, is_severe_condition, summarize_forecast,
+)
+from .models import (
+    AlertHistory,
+    AlertPreference,
+    AlertSchedule,
+    DeletionJob,
+    Observation,
+    SavedLocation,
+    UserSetting,
+    WeatherSearch,
+)
+from .profiling import RequestProfilingMiddleware
+from .views import (
+    afetch_observation,
+    alert_should_trigger,
+    fetch_forecast,
+    fetch_observation,
+    fetch_one_call,
+    fetch_weather,
+    get_forecast_series,
+    get_latest_observation,
+    keyset_page,
+    parse_forecast_series,
+    store_observation,
+    user_cursor,
+    users_with_activity,
+    weather_cache_key,
+)
+
+
+class ConnectionReuseTests(SimpleTestCase):
+    """Persistent, health-checked connections as configured in settings.DATABASES.
+
+    Each test drives a private connection to the test database through the
+    same open/close hooks Django runs at the start and end of every request.
+    """
+
+    def make_connection(self, **overrides):
+        settings_dict = {**connections['default'].settings_dict, **overrides}
+        if settings_dict['ENGINE'] == 'django.db.backends.sqlite3':
+            # In-memory SQLite connections are never closed, so use a file.
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            self.addCleanup(os.remove, path)
+            settings_dict['NAME'] = path
+        wrapper = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias='reuse_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def simulate_request(self, wrapper):
+        """Run one query between the request_started/request_finished hooks; return the DB-API connection used."""
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+        return raw
+
+    def test_settings_enable_health_checks(self):
+        self.assertTrue(settings.DATABASES['default']['CONN_HEALTH_CHECKS'])
+        self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], settings.DB_CONN_MAX_AGE)
+
+    def test_connection_is_reused_across_requests(self):
+        wrapper = self.make_connection(CONN_MAX_AGE=60)
+        first = self.simulate_request(wrapper)
+        self.assertIs(self.simulate_request(wrapper), first)
+        self.assertIs(self.simulate_request(wrapper), first)
+
+    def test_connection_is_not_reused_without_max_age(self):
+        wrapper = self.make_connection(CONN_MAX_AGE=0)
+        first = self.simulate_request(wrapper)
+        self.assertIsNone(wrapper.connection)
+        self.assertIsNot(self.simulate_request(wrapper), first)
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite connections are always reported usable')
+    def test_broken_connection_is_replaced_after_health_check(self):
+        wrapper = self.make_connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        first = self.simulate_request(wrapper)
+        first.close()
+        second = self.simulate_request(wrapper)
+        self.assertIsNot(second, first)
+
+
+class AlertEngineEquivalenceTests(SimpleTestCase):
+    """AlertIndex triggers exactly the alerts alert_should_trigger does.
+
+    Reason wording differs in number formatting, so alerts are compared by
+    whether they trigger and how many reasons they give.
+    """
+
+    THRESHOLDS = {
+        'temperature_threshold': ('temperature_c', Decimal('30.00')),
+        'low_temperature_threshold': ('temperature_c', Decimal('-2.50')),
+        'humidity_threshold': ('humidity', 85),
+        'wind_speed_threshold': ('wind_speed_kph', Decimal('40.20')),
+    }
+
+    def observation(self, temperature_c=20.0, humidity=50, wind_speed_kph=10.0, condition_id=800, description='clear sky'):
+        return SimpleNamespace(
+            temperature_c=temperature_c,
+            humidity=humidity,
+            wind_speed_kph=wind_speed_kph,
+            condition_id=condition_id,
+            condition_main='',
+            condition_description=description,
+        )
+
+    def old_path(self, alerts, observation):
+        triggered = {}
+        for alert in alerts:
+            should_trigger, reason = alert_should_trigger(
+                alert,
+                observation.temperature_c,
+                observation.condition_description,
+                humidity=observation.humidity,
+                wind_speed=observation.wind_speed_kph,
+                condition_id=observation.condition_id,
+            )
+            if should_trigger:
+                triggered[alert.pk] = len(reason.split(' | '))
+        return triggered
+
+    def new_path(self, alerts, observation):
+        triggered = AlertIndex(alerts).evaluate_all({'Manila': observation})
+        return {alert.pk: len(reason.split(' | ')) for alert, reason in triggered}
+
+    def assertSamePaths(self, alerts, observation):
+        self.assertEqual(self.new_path(alerts, observation), self.old_path(alerts, observation))
+
+    def test_thresholds_at_and_either_side_of_each_boundary(self):
+        for field, (reading_field, threshold) in self.THRESHOLDS.items():
+            alerts = [AlertPreference(pk=1, city='Manila', condition_alerts=False, **{field: threshold})]
+            for delta in (-0.01, 0, 0.01):
+                reading = float(threshold) + delta
+                with self.subTest(field=field, reading=reading):
+                    observation = self.observation(**{reading_field: reading})
+                    self.assertSamePaths(alerts, observation)
+            # Sanity check that the boundary itself is inclusive.
+            at = self.observation(**{reading_field: float(threshold)})
+            self.assertEqual(self.new_path(alerts, at), {1: 1})
+
+    def test_many_alerts_sharing_a_location(self):
+        thresholds = [Decimal(value) / 4 for value in range(100, 140)]
+        alerts = [
+            AlertPreference(
+                pk=i,
+                city='Manila',
+                temperature_threshold=value,
+                low_temperature_threshold=value - 5,
+                humidity_threshold=int(value) * 3,
+                wind_speed_threshold=value,
+                condition_alerts=i % 2 == 0,
+            )
+            for i, value in enumerate(thresholds, start=1)
+        ]
+        for value in thresholds:
+            for delta in (-0.01, 0, 0.01):
+                reading = float(value) + delta
+                observation = self.observation(
+                    temperature_c=reading, humidity=int(value) * 3, wind_speed_kph=reading, condition_id=211,
+                    description='thunderstorm',
+                )
+                with self.subTest(reading=reading):
+                    self.assertSamePaths(alerts, observation)
+
+    def test_severe_condition_ranges(self):
+        alerts = [
+            AlertPreference(pk=1, city='Manila', condition_alerts=True),
+            AlertPreference(pk=2, city='Manila', condition_alerts=False, temperature_threshold=Decimal('15')),
+        ]
+        condition_ids = {800, 500, 711}
+        for low, high in SEVERE_CONDITION_RANGES:
+            condition_ids.update((low - 1, low, high, high + 1))
+        for condition_id in sorted(condition_ids):
+            with self.subTest(condition_id=condition_id):
+                self.assertSamePaths(alerts, self.observation(condition_id=condition_id, description='weather'))
+        self.assertEqual(self.new_path(alerts, self.observation(condition_id=701)), {1: 1, 2: 1})
+        self.assertEqual(self.new_path(alerts, self.observation(condition_id=711)), {2: 1})
+
+    def test_sleet_is_not_severe_but_snow_is(self):
+        # Matches the description keywords, which never included sleet.
+        for condition_id, description in ((611, 'sleet'), (612, 'light shower sleet'), (613, 'shower sleet')):
+            with self.subTest(condition_id=condition_id):
+                self.assertFalse(is_severe_condition(condition_id, description))
+                self.assertFalse(is_severe_condition(None, description))
+        for condition_id, description in ((600, 'light snow'), (616, 'rain and snow'), (622, 'heavy shower snow')):
+            with self.subTest(condition_id=condition_id):
+                self.assertTrue(is_severe_condition(condition_id, description))
+                self.assertTrue(is_severe_condition(None, description))
+
+    def test_condition_description_without_id(self):
+        alerts = [AlertPreference(pk=1, city='Manila', condition_alerts=True)]
+        for description in ('dense fog', 'Thunderstorm', 'light rain', ''):
+            with self.subTest(description=description):
+                self.assertSamePaths(alerts, self.observation(condition_id=None, description=description))
+
+    def test_missing_readings_skip_only_their_own_rules(self):
+        alerts = [
+            AlertPreference(
+                pk=1, city='Manila', condition_alerts=True, temperature_threshold=Decimal('30'),
+                low_temperature_threshold=Decimal('0'), humidity_threshold=80, wind_speed_threshold=Decimal('40'),
+            ),
+            AlertPreference(pk=2, city='Manila', condition_alerts=False, temperature_threshold=Decimal('30')),
+            AlertPreference(pk=3, city='Manila', condition_alerts=False, humidity_threshold=80),
+        ]
+        readings = {'temperature_c': 35.0, 'humidity': 90, 'wind_speed_kph': 50.0}
+        for missing in readings:
+            observation = self.observation(**{**readings, missing: None}, condition_id=211, description='thunderstorm')
+            with self.subTest(missing=missing):
+                self.assertSamePaths(alerts, observation)
+        # No temperature: the alert still triggers on humidity, wind and the storm.
+        no_temperature = self.observation(temperature_c=None, humidity=90, wind_speed_kph=50.0, condition_id=211)
+        self.assertEqual(self.new_path(alerts, no_temperature), {1: 3, 3: 1})
+
+    def test_inactive_alerts_never_trigger(self):
+        alerts = [AlertPreference(pk=1, city='Manila', is_active=False, temperature_threshold=Decimal('10'))]
+        self.assertSamePaths(alerts, self.observation(temperature_c=35.0))
+        self.assertEqual(self.new_path(alerts, self.observation(temperature_c=35.0)), {})
+
+
+@override_settings(
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'core.profiling.RequestProfilingMiddleware'],
+    PERF_TIMING_SAMPLE_RATE=1.0,
+    PERF_PROFILE_SAMPLE_RATE=0.0,
+)
+class RequestProfilingMiddlewareTests(TestCase):
+    def test_runs_in_the_mode_of_the_handler(self):
+        async def async_view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(RequestProfilingMiddleware(async_view)))
+        self.assertFalse(iscoroutinefunction(RequestProfilingMiddleware(lambda request: HttpResponse())))
+
+    def test_sync_request_is_measured(self):
+        with self.assertLogs('core.profiling', 'INFO'):
+            response = self.client.get('/register/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    async def test_async_request_is_measured(self):
+        with self.assertLogs('core.profiling', 'INFO') as logs:
+            response = await self.async_client.get('/register/')
+        self.assertIn('"path": "/register/"', logs.output[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(PERF_TIMING_SAMPLE_RATE=0.0)
+    async def test_unsampled_async_request_has_no_timing(self):
+        response = await self.async_client.get('/register/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    def sql_count(self, response) -> int:
+        return int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response['Server-Timing']).group(1))
+
+    def log_in(self):
+        self.client.force_login(User.objects.create_user('profiled', 'profiled@example.com', 'pw'))
+        self.async_client.cookies = self.client.cookies
+
+    def test_sync_request_counts_queries(self):
+        self.log_in()
+        with self.assertLogs('core.profiling', 'INFO') as logs:
+            response = self.client.get('/settings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.sql_count(response), 0)
+        self.assertIn(f'"sql_count": {self.sql_count(response)}', logs.output[0])
+
+    async def test_async_request_counts_queries_run_off_the_event_loop(self):
+        await sync_to_async(self.log_in)()
+        with self.assertLogs('core.profiling', 'INFO'):
+            await sync_to_async(self.client.get)('/settings/')  # creates the user's settings
+            sync_response = await sync_to_async(self.client.get)('/settings/')
+            response = await self.async_client.get('/settings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.sql_count(response), 0)
+        self.assertEqual(self.sql_count(response), self.sql_count(sync_response))
+
+    def profiled(self, logs) -> dict:
+        return json.loads(logs.output[-1].split('request_timing ', 1)[1])
+
+    async def test_async_profile_covers_the_sync_view_thread(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                self.settings(PERF_PROFILE_SAMPLE_RATE=1.0, PERF_PROFILE_DIR=directory):
+            with self.assertLogs('core.profiling', 'INFO') as logs:
+                response = await self.async_client.get('/register/')
+            self.assertEqual(response.status_code, 200)
+            functions = {name for _file, _line, name in pstats.Stats(self.profiled(logs)['profile']).stats}
+        self.assertIn('register', functions)
+        self.assertFalse(profiling._profile_lock.locked())
+
+    async def test_async_view_is_timed_but_not_profiled(self):
+        await sync_to_async(self.log_in)()
+        with self.settings(PERF_PROFILE_SAMPLE_RATE=1.0), self.assertLogs('core.profiling', 'INFO') as logs:
+            response = await self.async_client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.profiled(logs)['profile'])
+
+    @override_settings(PERF_PROFILE_SAMPLE_RATE=1.0)
+    def test_overlapping_profile_is_skipped(self):
+        with profiling._profile_lock, self.assertLogs('core.profiling', 'INFO') as logs:
+            response = self.client.get('/register/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.profiled(logs)['profile'])
+        self.assertFalse(profiling._profile_lock.locked())
+
+
+class DashboardFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('frag', 'old@example.com', 'pw')
+        # One request (so one CSRF secret) for every render of a test.
+        self.request = RequestFactory().get('/dashboard/')
+        self.request.user = self.user
+
+    def render_dashboard(self, city: str, description: str) -> str:
+        request = self.request
+        return render_to_string('dashboard/user_dashboard.html', {
+            **fragments.fragment_context(request),
+            'weather_data': {'city': city},
+            'forecast_stamp': 1700000000.0,
+            'forecast_city_key': city.lower(),
+            'forecast_items': [{'date': 'Mon', 'slots': [{'label': '9 AM', 'temp': 20, 'desc': description}]}],
+            'all_alerts': [],
+        }, request=request)
+
+    def test_forecast_fragment_is_per_city(self):
+        self.assertIn('Clear Sky', self.render_dashboard('Manila', 'clear sky'))
+        html = self.render_dashboard('Cebu', 'light rain')
+        self.assertIn('Light Rain', html)
+        self.assertNotIn('Clear Sky', html)
+
+    def test_email_change_invalidates_fragments(self):
+        self.assertIn('old@example.com', self.render_dashboard('Manila', 'clear sky'))
+        self.user.email = 'new@example.com'
+        self.user.save()
+        html = self.render_dashboard('Manila', 'clear sky')
+        self.assertIn('Email alerts go to: new@example.com', html)
+        self.assertNotIn('old@example.com', html)
+
+    def test_login_does_not_invalidate_fragments(self):
+        version = fragments.user_version(self.user.id)
+        self.assertTrue(self.client.login(username='frag', password='pw'))
+        self.assertEqual(fragments.user_version(self.user.id), version)
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', WEATHER_ONE_CALL=False, ALERT_EVENTS_ENABLED=False)
+class AsyncDashboardSearchTests(TestCase):
+    """A dashboard search fetches current weather and the forecast concurrently."""
+
+    LATENCY = 0.3
+
+    def setUp(self):
+        cache.clear()
+        weather_cache.local.clear()
+        self.user = User.objects.create_user('searcher', 'searcher@example.com', 'pw')
+        self.async_client.force_login(self.user)
+        self.statuses = {'weather': 200, 'forecast': 200}
+        patcher = mock.patch('core.views.providers.afetch', side_effect=self.afetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def afetch(self, kind, city):
+        await asyncio.sleep(self.LATENCY)
+        if self.statuses[kind] != 200:
+            return self.statuses[kind], None
+        rng = random.Random(city)
+        make = benchmarks.fake_current_payload if kind == 'weather' else benchmarks.fake_forecast_payload
+        return 200, make(city, rng)
+
+    async def test_search_fetches_concurrently_and_records_the_search(self):
+        started = time.perf_counter()
+        response = await self.async_client.post('/dashboard/', {'city': 'Manila'})
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        # About max(latencies), not their sum.
+        self.assertGreaterEqual(elapsed, self.LATENCY)
+        self.assertLess(elapsed, 2 * self.LATENCY - 0.1)
+        self.assertContains(response, 'Showing weather for Manila.')
+        search = await WeatherSearch.objects.select_related('observation').aget(user=self.user)
+        self.assertEqual((search.city, search.observation.city), ('Manila', 'Manila'))
+        self.assertTrue(response.context['forecast_items'])
+
+    async def test_failed_fetch_shows_the_error(self):
+        self.statuses['weather'] = 404
+        response = await self.async_client.post('/dashboard/', {'city': 'Atlantis'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "City &#x27;Atlantis&#x27; not found.")
+        self.assertFalse(await WeatherSearch.objects.aexists())
+        self.assertIsNone(response.context['weather_data'])
+
+
+class LiveUpdatesTests(TestCase):
+    """The SSE stream is only offered where it can stream: under ASGI."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('live', 'live@example.com', 'pw')
+        SavedLocation.objects.create(user=self.user, city='Manila', country='PH')
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def test_wsgi_stream_request_is_refused(self):
+        response = self.client.get('/live/?city=Manila')
+        self.assertEqual(response.status_code, 204)
+
+    async def test_asgi_stream_is_served(self):
+        response = await self.async_client.get('/live/?city=Manila')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+    def test_wsgi_page_polls_instead(self):
+        response = self.client.get('/locations/')
+        self.assertContains(response, 'locations-grid')
+        self.assertNotContains(response, 'data-live-url')
+
+    async def test_asgi_page_streams(self):
+        response = await self.async_client.get('/locations/')
+        self.assertContains(response, 'data-live-url')
+
+
+class KeysetPaginationTests(TestCase):
+    """Keyset pages of the staff user list cover every user exactly once, in order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        joined = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        # Three users per date_joined, so pages split inside groups of ties.
+        for i in range(9):
+            User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw', date_joined=joined + timedelta(days=i // 3))
+
+    def expected(self, sort: str) -> list[int]:
+        field = sort.lstrip('-')
+        users = sorted(User.objects.all(), key=lambda user: (getattr(user, field), user.pk), reverse=sort.startswith('-'))
+        return [user.pk for user in users]
+
+    def walk(self, sort: str, size: int, backwards: bool = False, cursor: str | None = None) -> list[list[int]]:
+        field = sort.lstrip('-')
+        pages = []
+        while True:
+            rows, has_more = keyset_page(users_with_activity(), sort, cursor, backwards, size)
+            pages.append([user.pk for user in rows])
+            if not has_more:
+                return pages
+            cursor = user_cursor(rows[0] if backwards else rows[-1], field)
+
+    def test_forward_pages_break_ties_by_id(self):
+        for sort in ('date_joined', '-date_joined', 'username', '-id'):
+            with self.subTest(sort=sort):
+                pages = self.walk(sort, size=4)
+                self.assertEqual([pk for page in pages for pk in page], self.expected(sort))
+                self.assertEqual([len(page) for page in pages], [4, 4, 2])
+
+    def test_backward_pages_from_the_last_row(self):
+        sort = '-date_joined'
+        expected = self.expected(sort)
+        last = User.objects.get(pk=expected[-1])
+        pages = self.walk(sort, size=4, backwards=True, cursor=user_cursor(last, 'date_joined'))
+        self.assertEqual([pk for page in reversed(pages) for pk in page], expected[:-1])
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+
+    def test_date_joined_sort_is_indexed(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'auth_user')
+        self.assertEqual(constraints['core_user_date_joined_idx']['columns'], ['date_joined', 'id'])
+
+    def test_invalid_or_tampered_cursor_starts_over(self):
+        first, _ = keyset_page(users_with_activity(), '-id', None, False, 3)
+        cursor = user_cursor(first[-1], 'id')
+        for bad in ('garbage', cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'), 'W1siMSIsIDFd'):
+            with self.subTest(cursor=bad):
+                rows, has_more = keyset_page(users_with_activity(), '-id', bad, False, 3)
+                self.assertEqual(rows, first)
+                self.assertTrue(has_more)
+
+    def page(self, url: str):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_prev_and_next_links(self):
+        self.client.force_login(self.staff)
+        expected = self.expected('date_joined')
+        with mock.patch('core.views.USERS_PAGE_SIZE', 4):
+            first = self.page('/admin-panel/users/?sort=date_joined')
+            self.assertIsNone(first.context['prev_url'])
+            self.assertEqual([user.pk for user in first.context['users']], expected[:4])
+
+            second = self.page('/admin-panel/users/' + first.context['next_url'])
+            self.assertEqual([user.pk for user in second.context['users']], expected[4:8])
+            self.assertEqual(parse_qs(urlsplit(second.context['next_url']).query)['sort'], ['date_joined'])
+
+            last = self.page('/admin-panel/users/' + second.context['next_url'])
+            self.assertEqual([user.pk for user in last.context['users']], expected[8:])
+            self.assertIsNone(last.context['next_url'])
+
+            back = self.page('/admin-panel/users/' + last.context['prev_url'])
+            self.assertEqual([user.pk for user in back.context['users']], expected[4:8])
+            back = self.page('/admin-panel/users/' + back.context['prev_url'])
+            self.assertEqual([user.pk for user in back.context['users']], expected[:4])
+            self.assertIsNone(back.context['prev_url'])
+            self.assertIsNotNone(back.context['next_url'])
+
+            for bad in ('after=not-a-cursor', 'before=not-a-cursor'):
+                tampered = self.page(f'/admin-panel/users/?sort=date_joined&{bad}')
+                self.assertEqual([user.pk for user in tampered.context['users']], expected[:4])
+                self.assertIsNone(tampered.context['prev_url'])
+                self.assertIsNotNone(tampered.context['next_url'])
+
+    def test_activity_columns_do_not_sort(self):
+        self.client.force_login(self.staff)
+        response = self.page('/admin-panel/users/?sort=-search_count')
+        self.assertEqual(response.context['sort'], '-id')
+        self.assertEqual(set(response.context['sort_links']), {'id', 'username', 'date_joined'})
+        self.assertEqual(response.context['users'][0].search_count, 0)
+
+    def test_search_matches_username_or_email_prefix(self):
+        User.objects.create_user('alice', 'ops-user1@example.com', 'pw')
+        self.client.force_login(self.staff)
+        found = self.page('/admin-panel/users/?q=USER1')
+        self.assertEqual([user.username for user in found.context['users']], ['user1'])
+        found = self.page('/admin-panel/users/?q=ops')
+        self.assertEqual([user.username for user in found.context['users']], ['alice'])
+        # Not a prefix of either.
+        self.assertEqual(list(self.page('/admin-panel/users/?q=ser1').context['users']), [])
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ChunkedDeletionMixin:
+    def make_user(self, username: str, rows: int = 3) -> User:
+        user = User.objects.create_user(username, f'{username}@example.com', 'pw')
+        UserSetting.objects.create(user=user)
+        for i in range(rows):
+            alert = AlertPreference.objects.create(user=user, city=f'City{"abcdefgh"[i]}')
+            AlertHistory.objects.create(alert=alert, reason='test')
+            AlertHistory.objects.create(alert=alert, reason='test')
+            WeatherSearch.objects.create(user=user, city='Manila')
+            SavedLocation.objects.create(user=user, city=f'City{"abcdefgh"[i]}')
+        return user
+
+    def assertUserGone(self, user_id: int):
+        for name, model, lookup in deletion.STEPS:
+            self.assertFalse(model.objects.filter(**{lookup: user_id}).exists(), name)
+        self.assertFalse(User.objects.filter(pk=user_id).exists())
+
+    def assertUserIntact(self, user_id: int, rows: int = 3):
+        self.assertEqual(AlertHistory.objects.filter(alert__user_id=user_id).count(), 2 * rows)
+        self.assertEqual(WeatherSearch.objects.filter(user_id=user_id).count(), rows)
+        self.assertTrue(UserSetting.objects.filter(user_id=user_id).exists())
+
+
+class ChunkedDeletionTests(ChunkedDeletionMixin, TestCase):
+    def setUp(self):
+        self.user = self.make_user('doomed')
+        self.bystander = self.make_user('bystander')
+
+    def interrupt_after_first_batch(self, job):
+        def progress(job, step, deleted):
+            raise Interrupted(step)
+
+        with self.assertRaises(Interrupted):
+            deletion.run_job(job, batch_size=2, progress=progress)
+        job.refresh_from_db()
+        return job
+
+    def test_interrupted_job_resumes_to_completion(self):
+        job = deletion.start_deletion(self.user)
+        self.assertTrue(deletion.claim(job))
+        job = self.interrupt_after_first_batch(job)
+        self.assertEqual(job.status, DeletionJob.FAILED)
+        self.assertEqual(job.deleted, {'alert history': 2})
+        self.assertEqual(AlertHistory.objects.filter(alert__user_id=self.user.pk).count(), 4)
+
+        self.assertTrue(deletion.claim(job))
+        deletion.run_job(job, batch_size=2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.deleted, {
+            'alert history': 6, 'alerts': 3, 'searches': 3, 'saved locations': 3, 'settings': 1,
+        })
+        self.assertUserGone(self.user.pk)
+        self.assertUserIntact(self.bystander.pk)
+
+    def test_job_cannot_be_claimed_twice(self):
+        job = deletion.start_deletion(self.user)
+        self.assertTrue(deletion.claim(job))
+        self.assertFalse(deletion.claim(job))
+        self.assertFalse(deletion.claim(DeletionJob.objects.get(pk=job.pk)))
+        # Until it stops making progress for DELETION_STALE_SECONDS.
+        DeletionJob.objects.filter(pk=job.pk).update(updated_at=job.updated_at - timedelta(hours=1))
+        self.assertTrue(deletion.claim(job))
+
+    def test_start_deletion_reuses_the_unfinished_job(self):
+        job = deletion.start_deletion(self.user)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(deletion.start_deletion(self.user), job)
+
+    def test_cleanup_user_resume(self):
+        job = deletion.start_deletion(self.user)
+        self.assertTrue(deletion.claim(job))
+        self.interrupt_after_first_batch(job)
+
+        out = io.StringIO()
+        call_command('cleanup_user', '--resume', '--batch-size', '2', stdout=out)
+        self.assertIn("Deleted user 'doomed'", out.getvalue())
+        self.assertEqual(DeletionJob.objects.get(pk=job.pk).status, DeletionJob.DONE)
+        self.assertUserGone(self.user.pk)
+        self.assertUserIntact(self.bystander.pk)
+
+    def test_cleanup_user_skips_a_job_running_elsewhere(self):
+        job = deletion.start_deletion(self.user)
+        self.assertTrue(deletion.claim(job))
+        out = io.StringIO()
+        call_command('cleanup_user', 'doomed', '--delete', stdout=out)
+        self.assertIn('running elsewhere', out.getvalue())
+        self.assertUserIntact(self.user.pk)
+
+
+class BackgroundDeletionTests(ChunkedDeletionMixin, TransactionTestCase):
+    def test_run_in_background(self):
+        user = self.make_user('doomed')
+        job = deletion.start_deletion(user)
+        daemon = []
+        delete_batch = deletion.delete_batch
+
+        def record_thread(*args):
+            daemon.append(threading.current_thread().daemon)
+            return delete_batch(*args)
+
+        with mock.patch('core.deletion.delete_batch', side_effect=record_thread):
+            deletion.run_in_background(job)
+            self.assertTrue(deletion.drain(10))
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertUserGone(user.pk)
+        # Not a daemon thread, so interpreter shutdown waits for the job.
+        self.assertFalse(any(daemon))
+
+    def test_job_killed_partway_is_resumed_by_cleanup_user(self):
+        user = self.make_user('doomed')
+        bystander = self.make_user('bystander')
+        job = deletion.start_deletion(user)
+        calls = 0
+        delete_batch = deletion.delete_batch
+
+        def die_on_third_batch(*args):
+            nonlocal calls
+            calls += 1
+            if calls == 3:
+                raise ProcessDied
+            return delete_batch(*args)
+
+        with override_settings(DELETION_BATCH_SIZE=2), \
+                mock.patch('core.deletion.delete_batch', side_effect=die_on_third_batch):
+            deletion.run_in_background(job)
+            deletion.drain(10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.RUNNING)
+        self.assertEqual(job.deleted, {'alert history': 4})
+        self.assertEqual(AlertHistory.objects.filter(alert__user_id=user.pk).count(), 2)
+
+        # Left alone while it might still be making progress somewhere...
+        out = io.StringIO()
+        call_command('cleanup_user', '--resume', stdout=out)
+        self.assertNotIn('doomed', out.getvalue())
+        self.assertEqual(DeletionJob.objects.get(pk=job.pk).status, DeletionJob.RUNNING)
+
+        # ...and finished by the cron once it has gone stale.
+        stale = dj_timezone.now() - timedelta(seconds=settings.DELETION_STALE_SECONDS + 1)
+        DeletionJob.objects.filter(pk=job.pk).update(updated_at=stale)
+        call_command('cleanup_user', '--resume', '--batch-size', '2', stdout=out)
+        self.assertIn("Deleted user 'doomed'", out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.deleted['alert history'], 6)
+        self.assertUserGone(user.pk)
+        self.assertUserIntact(bystander.pk)
+
+
+class ProcessDied(BaseException):
+    """Stands in for the process exiting mid-run (not caught by `except Exception`)."""
+
+
+# Configured email (sent to the locmem outbox) and no recipient allow-list.
+ALERT_EMAIL_SETTINGS = {
+    'EMAIL_HOST': 'smtp.example.com',
+    'EMAIL_HOST_USER': 'alerts@example.com',
+    'EMAIL_HOST_PASSWORD': 'secret',
+    'ALERT_ALLOWED_USERNAMES': [],
+    'ALERT_ALLOWED_EMAILS': [],
+}
+
+
+class AlertDeliveryMixin:
+    def make_alert(self) -> AlertPreference:
+        user = User.objects.create_user('alerted', 'alerted@example.com', 'pw')
+        return AlertPreference.objects.create(user=user, city='Manila', temperature_threshold=30, email_alerts=True)
+
+    def make_observation(self, temperature=Decimal('31.50'), minute=0) -> Observation:
+        return Observation.objects.create(
+            city='Manila', city_key='manila', temperature_c=temperature, humidity=60,
+            wind_speed_kph=Decimal('5'), condition_id=800, condition_description='clear sky',
+            observed_at=datetime(2026, 1, 1, 12, minute, tzinfo=timezone.utc),
+        )
+
+    def run_alerts(self, observation: Observation, pending: bool = True):
+        AlertRun().run(
+            alerts=AlertPreference.objects.filter(is_active=True).select_related('user'),
+            observations={'manila': observation},
+            pending=pending,
+        )
+
+
+@override_settings(**ALERT_EMAIL_SETTINGS)
+class AlertDeliveryTests(AlertDeliveryMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alert = self.make_alert()
+
+    def test_schedule_is_written_after_delivery(self):
+        observation = self.make_observation()
+        with mock.patch('core.alert_runner.send_alert_email', side_effect=ProcessDied):
+            with self.assertRaises(ProcessDied):
+                self.run_alerts(observation, pending=False)
+        # The run died before delivering: the observation still counts as new.
+        self.assertFalse(AlertSchedule.objects.exists())
+
+        self.run_alerts(observation, pending=False)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(AlertSchedule.objects.get().last_observed_at, observation.observed_at)
+
+        # Delivered: the same observation does not trigger again.
+        self.run_alerts(observation, pending=False)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_email_is_resent_on_the_next_run(self):
+        observation = self.make_observation()
+        with mock.patch('core.views.send_mail', side_effect=OSError('SMTP down')):
+            self.run_alerts(observation)
+        history = AlertHistory.objects.get()
+        self.assertFalse(history.email_sent)
+        self.assertTrue(history.email_pending)
+        self.assertEqual(AlertSchedule.objects.get().last_observed_at, observation.observed_at)
+
+        # Still failing: stays pending.
+        with mock.patch('core.views.send_mail', side_effect=OSError('SMTP down')):
+            self.run_alerts(observation)
+        self.assertTrue(AlertHistory.objects.get().email_pending)
+
+        # The observation is unchanged, so only the resend goes out.
+        self.run_alerts(observation)
+        history = AlertHistory.objects.get()
+        self.assertTrue(history.email_sent)
+        self.assertFalse(history.email_pending)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Reason: Temperature 31.5C', mail.outbox[0].body)
+
+        self.run_alerts(observation)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_resend_is_dropped_when_email_alerts_are_turned_off(self):
+        with mock.patch('core.views.send_mail', side_effect=OSError('SMTP down')):
+            self.run_alerts(self.make_observation())
+        self.alert.email_alerts = False
+        self.alert.save()
+        self.run_alerts(self.make_observation(temperature=Decimal('20'), minute=10))
+        self.assertFalse(AlertHistory.objects.get().email_pending)
+        self.assertEqual(mail.outbox, [])
+
+    def test_event_evaluation_leaves_resends_to_the_cron(self):
+        with mock.patch('core.views.send_mail', side_effect=OSError('SMTP down')):
+            self.run_alerts(self.make_observation())
+        self.run_alerts(self.make_observation(temperature=Decimal('20'), minute=10), pending=False)
+        self.assertTrue(AlertHistory.objects.get().email_pending)
+
+
+@override_settings(**ALERT_EMAIL_SETTINGS)
+class AlertEventTests(AlertDeliveryMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.alert = self.make_alert()
+
+    def test_evaluations_run_on_non_daemon_workers_and_drain(self):
+        observation = self.make_observation()
+        started = threading.Event()
+        release = threading.Event()
+        evaluate = alert_events.evaluate
+
+        def slow_evaluate(*args):
+            started.set()
+            release.wait(10)
+            evaluate(*args)
+
+        with mock.patch('core.alert_events.evaluate', slow_evaluate):
+            alert_events.on_observation_stored(observation)
+            self.assertTrue(started.wait(10))
+            workers = [thread for thread in threading.enumerate() if thread.name.startswith('alert-event')]
+            self.assertTrue(workers)
+            self.assertFalse(any(thread.daemon for thread in workers))
+            self.assertFalse(alert_events.drain(timeout=0.05))
+            with self.assertLogs('core.alert_events', 'INFO'):
+                release.set()
+                self.assertTrue(alert_events.drain(timeout=10))
+        self.assertEqual(AlertHistory.objects.get().email_sent, True)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_alert_under_a_query_alias_is_evaluated(self):
+        # Saved as the user typed it, answered by the provider as 'Manila'.
+        self.alert.city = 'Metro Manila'
+        self.alert.country = 'PH'
+        self.alert.save()
+        observation = self.make_observation()
+        observation.country = 'PH'
+        observation.query_key = 'metro manila,ph'
+        observation.save()
+        self.assertIn('metro manila,ph', alert_events.observation_queries(observation))
+
+        with self.assertLogs('core.alert_events', 'INFO'):
+            alert_events.on_observation_stored(observation)
+            self.assertTrue(alert_events.drain(timeout=10))
+        self.assertEqual(AlertHistory.objects.get().alert, self.alert)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_warm_weather_cache_drains_evaluations(self):
+        with mock.patch('core.management.commands.warm_weather_cache.hot_cities', return_value=[]), \
+                mock.patch('core.alert_events.drain') as drain:
+            call_command('warm_weather_cache', stdout=io.StringIO())
+        drain.assert_called_once_with()
+
+
+
+
+@override_settings(**ALERT_EMAIL_SETTINGS)
+class ChangeDetectionTests(AlertDeliveryMixin, TestCase):
+    """A location whose observation has not changed since its last check is not evaluated again."""
+
+    def setUp(self):
+        cache.clear()
+        self.alert = self.make_alert()
+        self.observation = self.make_observation()
+        self.run_alerts(self.observation, pending=False)
+        self.assertEqual(AlertHistory.objects.count(), 1)
+
+    def add_alert(self, **fields) -> AlertPreference:
+        user = User.objects.create_user('newcomer', 'newcomer@example.com', 'pw')
+        return AlertPreference.objects.create(user=user, city='Manila', email_alerts=True, **fields)
+
+    def test_unchanged_observation_skips_evaluation(self):
+        output = []
+        with mock.patch.object(AlertIndex, 'evaluate_all', autospec=True, return_value=[]) as evaluate_all:
+            AlertRun(write=output.append).run(
+                alerts=AlertPreference.objects.filter(is_active=True).select_related('user'),
+                observations={'manila': self.observation},
+                pending=False,
+            )
+        evaluate_all.assert_called_once_with(mock.ANY, {})
+        self.assertIn('(1 unchanged)', output[-1])
+        self.assertEqual(AlertHistory.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_new_observation_is_evaluated(self):
+        self.run_alerts(self.make_observation(minute=10), pending=False)
+        self.assertEqual(AlertHistory.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_new_alert_is_evaluated_against_the_unchanged_observation(self):
+        added = self.add_alert(temperature_threshold=31)
+        self.run_alerts(self.observation, pending=False)
+        # Only the new alert triggers; the first was already evaluated against this observation.
+        self.assertEqual(list(AlertHistory.objects.values_list('alert_id', flat=True).order_by('pk')), [self.alert.pk, added.pk])
+        self.assertEqual([message.to for message in mail.outbox], [['alerted@example.com'], ['newcomer@example.com']])
+
+        self.run_alerts(self.observation, pending=False)
+        self.assertEqual(AlertHistory.objects.count(), 2)
+
+    def test_edited_alert_is_evaluated_against_the_unchanged_observation(self):
+        other = self.add_alert(temperature_threshold=35)
+        self.run_alerts(self.observation, pending=False)
+        self.assertEqual(AlertHistory.objects.count(), 1)
+
+        other.temperature_threshold = 31
+        other.save()
+        self.run_alerts(self.observation, pending=False)
+        self.assertEqual(AlertHistory.objects.filter(alert=other).count(), 1)
+        self.assertEqual(AlertHistory.objects.filter(alert=self.alert).count(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@override_settings(**ALERT_EMAIL_SETTINGS)
+class DigestDeliveryTests(AlertDeliveryMixin, TestCase):
+    """`send_digests` windows: every pending row goes out in exactly one digest."""
+
+    START = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        self.alert = self.make_alert()
+        self.setting = UserSetting.objects.create(
+            user=self.alert.user, alert_delivery='hourly', last_digest_sent_at=self.START,
+        )
+        # Below the threshold: runs only deliver what is already pending.
+        self.quiet = self.make_observation(temperature=Decimal('20'))
+
+    def pending_row(self, at: datetime, reason: str = 'Temperature 31.5C') -> AlertHistory:
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            return AlertHistory.objects.create(
+                alert=self.alert, temperature=Decimal('31.5'), reason=reason, digest_pending=True,
+            )
+
+    def run_at(self, at: datetime):
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            self.run_alerts(self.quiet)
+
+    def test_digest_waits_for_the_end_of_the_window(self):
+        row = self.pending_row(self.START + timedelta(minutes=5))
+        self.run_at(self.START + timedelta(minutes=59, seconds=59))
+        self.assertEqual(mail.outbox, [])
+        self.assertTrue(AlertHistory.objects.get(pk=row.pk).digest_pending)
+
+        self.run_at(self.START + timedelta(hours=1))
+        self.assertEqual(len(mail.outbox), 1)
+        row.refresh_from_db()
+        self.assertFalse(row.digest_pending)
+        self.assertTrue(row.email_sent)
+        self.setting.refresh_from_db()
+        self.assertEqual(self.setting.last_digest_sent_at, self.START + timedelta(hours=1))
+
+    def test_each_row_is_digested_once(self):
+        first = self.pending_row(self.START + timedelta(minutes=5), reason='first')
+        second = self.pending_row(self.START + timedelta(minutes=50), reason='second')
+        self.run_at(self.START + timedelta(hours=1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('2 weather alert(s) triggered', mail.outbox[0].body)
+
+        third = self.pending_row(self.START + timedelta(hours=1, minutes=30), reason='third')
+        self.run_at(self.START + timedelta(hours=1, minutes=45))
+        self.assertEqual(len(mail.outbox), 1)
+        self.run_at(self.START + timedelta(hours=2))
+        self.assertEqual(len(mail.outbox), 2)
+        body = mail.outbox[1].body
+        self.assertIn('1 weather alert(s) triggered', body)
+        self.assertIn('Reason: third', body)
+        self.assertNotIn('Reason: first', body)
+        self.assertNotIn('Reason: second', body)
+
+        self.run_at(self.START + timedelta(hours=5))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(AlertHistory.objects.filter(pk__in=[first.pk, second.pk, third.pk], digest_pending=True).exists())
+
+    def test_row_recorded_while_a_digest_is_sent_goes_in_the_next_one(self):
+        self.pending_row(self.START + timedelta(minutes=5), reason='first')
+        send = alert_runner.send_alert_digest_email
+        late = []
+
+        def send_while_triggering(user, entries):
+            late.append(self.pending_row(self.START + timedelta(hours=1), reason='late'))
+            return send(user, entries)
+
+        with mock.patch('core.alert_runner.send_alert_digest_email', side_effect=send_while_triggering):
+            self.run_at(self.START + timedelta(hours=1))
+        self.assertNotIn('Reason: late', mail.outbox[0].body)
+        self.assertTrue(AlertHistory.objects.get(pk=late[0].pk).digest_pending)
+
+        self.run_at(self.START + timedelta(hours=2))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('Reason: late', mail.outbox[1].body)
+        self.assertFalse(AlertHistory.objects.filter(digest_pending=True).exists())
+
+    def test_failed_digest_is_retried_with_the_same_rows(self):
+        row = self.pending_row(self.START + timedelta(minutes=5))
+        with mock.patch('core.views.send_mail', side_effect=OSError('SMTP down')):
+            self.run_at(self.START + timedelta(hours=1))
+        self.assertTrue(AlertHistory.objects.get(pk=row.pk).digest_pending)
+        self.setting.refresh_from_db()
+        self.assertEqual(self.setting.last_digest_sent_at, self.START)
+
+        self.run_at(self.START + timedelta(hours=1, minutes=5))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(AlertHistory.objects.get(pk=row.pk).digest_pending)
+
+    def test_run_delivery_sends_the_trigger_in_the_same_run(self):
+        self.setting.alert_delivery = 'run'
+        self.setting.save()
+        observation = self.make_observation(minute=5)
+        self.run_alerts(observation)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(AlertHistory.objects.get().email_sent)
+
+        self.run_alerts(observation)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_daily_window_is_24_hours_in_any_time_zone(self):
+        # Sent at 09:00 EST; clocks go forward at 02:00 on 2026-03-08.
+        sent = datetime(2026, 3, 7, 14, 0, tzinfo=timezone.utc)
+        self.setting.alert_delivery = 'daily'
+        self.setting.last_digest_sent_at = sent
+        self.setting.save()
+        self.pending_row(datetime(2026, 3, 7, 20, 30, tzinfo=timezone.utc))
+
+        # 09:00 EDT the next day is only 23 hours later.
+        self.run_at(datetime(2026, 3, 8, 13, 0, tzinfo=timezone.utc))
+        self.assertEqual(mail.outbox, [])
+        self.run_at(sent + timedelta(days=1))
+        self.assertEqual(len(mail.outbox), 1)
+        # Trigger times are shown in the site's time zone.
+        self.assertIn('Mar 07 15:30 - Manila', mail.outbox[0].body)
+
+
+
+class CheckIntervalTests(SimpleTestCase):
+    """`check_interval` with the default 300s minimum and 3600s maximum."""
+
+    def interval(self, margin, previous_margin=None, elapsed=None):
+        return check_interval(margin, 300, 3600, previous_margin, elapsed)
+
+    def test_interval_doubles_per_unit_of_margin_near_the_threshold(self):
+        self.assertEqual(self.interval(0.0), 300)
+        self.assertEqual(self.interval(1.0), 600)
+        self.assertEqual(self.interval(2.0), 1200)
+        self.assertAlmostEqual(self.interval(0.5), 300 * 2 ** 0.5)
+
+    def test_far_from_every_threshold_waits_the_maximum(self):
+        self.assertEqual(self.interval(4.0), 3600)
+        self.assertEqual(self.interval(1e9), 3600)
+
+    def test_reading_past_the_threshold_is_checked_at_the_minimum(self):
+        self.assertEqual(self.interval(-2.0), 300)
+
+    def test_no_margin_waits_the_maximum(self):
+        self.assertEqual(self.interval(None), 3600)
+        self.assertEqual(self.interval(None, previous_margin=1.0, elapsed=300), 3600)
+
+    def test_shrinking_margin_checks_before_the_threshold_is_reached(self):
+        # 4 -> 3 units in 600s reaches the threshold in 1800s: check at half that.
+        self.assertEqual(self.interval(3.0, previous_margin=4.0, elapsed=600), 900)
+        # Closing fast: clamped to the minimum.
+        self.assertEqual(self.interval(1.0, previous_margin=5.0, elapsed=300), 300)
+
+    def test_growing_or_unknown_trend_uses_the_margin_alone(self):
+        self.assertEqual(self.interval(2.0, previous_margin=1.0, elapsed=600), 1200)
+        self.assertEqual(self.interval(2.0, previous_margin=3.0, elapsed=None), 1200)
+        self.assertEqual(self.interval(2.0, previous_margin=3.0, elapsed=0), 1200)
+
+
+class LocationDueTests(SimpleTestCase):
+    NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def rules(self, edited_minutes_ago: float = 60) -> LocationRules:
+        rules = LocationRules('manila')
+        rules.alerts.append(SimpleNamespace(updated_at=self.NOW - timedelta(minutes=edited_minutes_ago)))
+        return rules
+
+    def schedule(self, next_check_in: timedelta, checked_minutes_ago: float | None = 10) -> AlertSchedule:
+        return AlertSchedule(
+            location_key='manila',
+            next_check_at=self.NOW + next_check_in,
+            last_checked_at=None if checked_minutes_ago is None else self.NOW - timedelta(minutes=checked_minutes_ago),
+        )
+
+    def test_location_never_checked_is_due(self):
+        self.assertTrue(location_due(self.rules(), None, self.NOW))
+        self.assertTrue(location_due(self.rules(), self.schedule(timedelta(hours=1), checked_minutes_ago=None), self.NOW))
+
+    def test_location_is_due_at_its_scheduled_check(self):
+        self.assertTrue(location_due(self.rules(), self.schedule(timedelta(minutes=-1)), self.NOW))
+        self.assertTrue(location_due(self.rules(), self.schedule(timedelta(0)), self.NOW))
+
+    def test_check_within_the_slack_is_brought_forward(self):
+        self.assertTrue(location_due(self.rules(), self.schedule(SCHEDULE_SLACK), self.NOW))
+        self.assertFalse(location_due(self.rules(), self.schedule(SCHEDULE_SLACK + timedelta(seconds=1)), self.NOW))
+
+    def test_alert_edited_since_the_last_check_is_due_early(self):
+        self.assertFalse(location_due(self.rules(edited_minutes_ago=60), self.schedule(timedelta(hours=1)), self.NOW))
+        self.assertTrue(location_due(self.rules(edited_minutes_ago=5), self.schedule(timedelta(hours=1)), self.NOW))
+
+
+@override_settings(ALERT_CHECK_MIN_INTERVAL=300, ALERT_CHECK_MAX_INTERVAL=3600)
+class RescheduleTests(AlertDeliveryMixin, TestCase):
+    """The next check `AlertRun` stores for a location (threshold 30C, 3C per unit of margin)."""
+
+    def setUp(self):
+        cache.clear()
+        self.make_alert()
+
+    def scheduled_interval(self) -> float:
+        schedule = AlertSchedule.objects.get()
+        return (schedule.next_check_at - schedule.last_checked_at).total_seconds()
+
+    def test_reading_near_the_threshold_is_checked_soon(self):
+        self.run_alerts(self.make_observation(temperature=Decimal('28.5')), pending=False)
+        self.assertAlmostEqual(self.scheduled_interval(), 300 * 2 ** 0.5, places=3)
+
+    def test_reading_far_from_the_threshold_is_checked_at_the_maximum(self):
+        self.run_alerts(self.make_observation(temperature=Decimal('10')), pending=False)
+        self.assertEqual(self.scheduled_interval(), 3600)
+
+    def test_approaching_reading_shortens_the_interval(self):
+        then = dj_timezone.now() - timedelta(minutes=10)
+        AlertPreference.objects.update(updated_at=then - timedelta(minutes=1))
+        # Four units away ten minutes ago, three now.
+        AlertSchedule.objects.create(location_key='manila', next_check_at=then, last_checked_at=then, last_margin=4.0)
+        self.run_alerts(self.make_observation(temperature=Decimal('21')), pending=False)
+        self.assertAlmostEqual(self.scheduled_interval(), 900, delta=5)
+
+    def test_failed_check_is_retried_at_the_minimum(self):
+        with mock.patch('core.alert_runner.fetch_observation', return_value=(None, 'upstream down')):
+            AlertRun().run()
+        self.assertEqual(self.scheduled_interval(), 300)
+
+
+
+@override_settings(**ALERT_EMAIL_SETTINGS, ALERT_EVENTS_ENABLED=True)
+class AlertRunLockingTests(AlertDeliveryMixin, TransactionTestCase):
+    """The cron run and event evaluations never process the same location at once."""
+
+    def setUp(self):
+        cache.clear()
+        self.alert = self.make_alert()
+        self.observation = self.make_observation()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def blocking(self, real):
+        def call(*args, **kwargs):
+            self.started.set()
+            self.release.wait(10)
+            return real(*args, **kwargs)
+        return call
+
+    def cron_run(self) -> list[str]:
+        output = []
+        with mock.patch('core.alert_runner.fetch_observation', return_value=(self.observation, None)):
+            AlertRun(write=output.append).run()
+        return output
+
+    def test_lock_keys_are_valid_for_every_cache_backend(self):
+        run = AlertRun()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            self.assertTrue(run.claim_location('metro manila,ph'))
+            self.assertFalse(AlertRun().claim_location('metro manila,ph'))
+            self.assertTrue(AlertRun().claim_location('metro_manila_ph'))
+            run.release_locations()
+        self.assertTrue(AlertRun().claim_location('metro manila,ph'))
+
+    def test_cron_leaves_a_location_to_the_event_delivering_it(self):
+        send = mock.patch('core.alert_runner.send_alert_email', side_effect=self.blocking(alert_runner.send_alert_email))
+        with send:
+            alert_events.on_observation_stored(self.observation)
+            self.assertTrue(self.started.wait(10))
+            # The event has recorded the trigger and is sending its email.
+            self.assertTrue(AlertHistory.objects.get().email_pending)
+            output = self.cron_run()
+            with self.assertLogs('core.alert_events', 'INFO'):
+                self.release.set()
+                self.assertTrue(alert_events.drain(timeout=10))
+        self.assertIn('Skipped 1 location(s) being processed by another run.', output)
+        self.assertIn('Emails resent 0.', output[-1])
+        history = AlertHistory.objects.get()
+        self.assertTrue(history.email_sent)
+        self.assertFalse(history.email_pending)
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Released: the cron finds the observation already evaluated.
+        self.cron_run()
+        self.assertEqual(AlertHistory.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_event_is_skipped_while_the_cron_processes_the_location(self):
+        fetch = self.blocking(lambda query: (self.observation, None))
+        with mock.patch('core.alert_runner.fetch_observation', side_effect=fetch):
+            cron = threading.Thread(target=lambda: (AlertRun().run(), connections.close_all()))
+            cron.start()
+            self.assertTrue(self.started.wait(10))
+            with self.assertLogs('core.alert_events', 'INFO') as logs:
+                alert_events.evaluate(self.observation, [self.alert.pk])
+            self.assertIn('being processed by another run', logs.output[0])
+            self.assertFalse(AlertHistory.objects.exists())
+            self.release.set()
+            cron.join(10)
+        self.assertEqual(AlertHistory.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(cache.get(alert_runner.location_lock_key('manila')))
+
+    def test_failed_event_email_is_resent_once_the_location_is_released(self):
+        with mock.patch('core.views.send_mail', side_effect=OSError('SMTP down')), \
+                self.assertLogs('core.alert_events', 'INFO'):
+            alert_events.evaluate(self.observation, [self.alert.pk])
+        self.assertTrue(AlertHistory.objects.get().email_pending)
+        self.assertIn('Emails resent 1.', self.cron_run()[-1])
+        self.assertEqual(len(mail.outbox), 1)
+
+
+
+# 06:00 UTC, on a 3-hour boundary (14:00 in Manila).
+ONE_CALL_BASE = 1_799_992_800
+
+
+def one_call_fixture(offset: int = 28800, hours: int = 48) -> dict:
+    """A One Call 3.0 response as fetched (before the geocoded name is added), 20 minutes after ONE_CALL_BASE."""
+    hourly = []
+    for i in range(hours):
+        entry = {
+            'dt': ONE_CALL_BASE + i * 3600, 'temp': 20 + i / 10, 'feels_like': 21 + i / 10, 'pressure': 1009,
+            'humidity': 60, 'wind_speed': 3.0, 'weather': [{'id': 500, 'main': 'Rain', 'description': 'light rain'}],
+            'pop': 0.4,
+        }
+        # OWM leaves out `rain` and `snow` when there is none.
+        if i % 6 == 0:
+            entry['rain'] = {'1h': 0.3}
+        hourly.append(entry)
+    first_midnight = (ONE_CALL_BASE + offset) // 86400 * 86400 - offset
+    daily = [
+        {
+            'dt': first_midnight + 12 * 3600 + d * 86400,
+            'temp': {'morn': 10 + d, 'day': 20 + d, 'eve': 15 + d, 'night': 12 + d, 'min': 9 + d, 'max': 21 + d},
+            'feels_like': {'morn': 11 + d, 'day': 21 + d, 'eve': 16 + d, 'night': 13 + d},
+            'pressure': 1010, 'humidity': 70, 'wind_speed': 4.0, 'pop': 0.2, 'rain': 1.2,
+            'weather': [{'id': 803, 'main': 'Clouds', 'description': 'broken clouds'}],
+        }
+        for d in range(8)
+    ]
+    return {
+        'lat': 14.6042, 'lon': 120.9822, 'timezone': 'Asia/Manila', 'timezone_offset': offset,
+        'current': {
+            'dt': ONE_CALL_BASE + 1200, 'temp': 31.2, 'feels_like': 36.4, 'pressure': 1008, 'humidity': 66,
+            'uvi': 9.1, 'wind_speed': 2.5, 'weather': [{'id': 802, 'main': 'Clouds', 'description': 'scattered clouds'}],
+        },
+        'hourly': hourly,
+        'daily': daily,
+    }
+
+
+def local_hour(dt: int, offset: int) -> int:
+    return (dt + offset) % 86400 // 3600
+
+
+class OneCallPayloadTests(SimpleTestCase):
+    """`one_call_current` / `one_call_forecast` against One Call fixtures."""
+
+    def payload(self, **kwargs) -> dict:
+        return {**one_call_fixture(**kwargs), 'name': 'Manila', 'country': 'PH'}
+
+    def test_current_conditions(self):
+        current = providers.one_call_current(self.payload())
+        self.assertEqual(current['main'], {'temp': 31.2, 'feels_like': 36.4, 'pressure': 1008, 'humidity': 66})
+        self.assertEqual(current['weather'][0]['id'], 802)
+        self.assertEqual(current['wind'], {'speed': 2.5})
+        self.assertEqual(current['dt'], ONE_CALL_BASE + 1200)
+        self.assertEqual((current['name'], current['sys'], current['timezone']), ('Manila', {'country': 'PH'}, 28800))
+        self.assertEqual(current['coord'], {'lat': 14.6042, 'lon': 120.9822})
+
+    def test_current_conditions_with_missing_fields(self):
+        current = providers.one_call_current({'name': 'Manila', 'current': {'dt': ONE_CALL_BASE, 'temp': 30}})
+        self.assertEqual(current['weather'], [{}])
+        self.assertEqual(current['wind'], {'speed': 0})
+        self.assertEqual((current['timezone'], current['sys']['country']), (0, ''))
+
+    def test_hourly_slots_then_daily_parts_in_local_time(self):
+        forecast = providers.one_call_forecast(self.payload())
+        self.assertEqual(forecast['city']['timezone'], 28800)
+        dts = [slot['dt'] for slot in forecast['list']]
+        # Every 3 hours of the hourly data after the current time...
+        self.assertEqual(dts[:15], list(range(ONE_CALL_BASE + 3 * 3600, ONE_CALL_BASE + 45 * 3600 + 1, 3 * 3600)))
+        # ...then Manila's 09:00, 15:00 and 21:00 from the daily data, up to five days ahead.
+        daily = forecast['list'][15:]
+        self.assertEqual([local_hour(slot['dt'], 28800) for slot in daily], [15, 21] + [9, 15, 21] * 2 + [9])
+        self.assertEqual(daily[0]['dt'], ONE_CALL_BASE + 49 * 3600)
+        self.assertEqual(daily[-1]['dt'], ONE_CALL_BASE + 115 * 3600)
+        self.assertEqual(len(dts), 24)
+        # The day part picks the matching daily temperature.
+        self.assertEqual([slot['main']['temp'] for slot in daily[:3]], [22, 17, 13])
+        self.assertEqual([slot['main']['feels_like'] for slot in daily[:3]], [23, 18, 14])
+
+    def test_negative_offset_keeps_local_day_parts(self):
+        forecast = providers.one_call_forecast(self.payload(offset=-18000))
+        self.assertEqual(forecast['city']['timezone'], -18000)
+        dts = [slot['dt'] for slot in forecast['list']]
+        self.assertEqual(dts, sorted(set(dts)))
+        self.assertLessEqual(dts[-1], ONE_CALL_BASE + 1200 + 5 * 86400)
+        daily = [dt for dt in dts if dt > ONE_CALL_BASE + 45 * 3600]
+        self.assertTrue(daily)
+        self.assertTrue(all(local_hour(dt, -18000) in (9, 15, 21) for dt in daily))
+
+    def test_slot_count_is_capped(self):
+        forecast = providers.one_call_forecast(self.payload(hours=130))
+        self.assertEqual(len(forecast['list']), providers.FORECAST_SLOTS)
+        self.assertEqual(forecast['list'][-1]['dt'], ONE_CALL_BASE + 120 * 3600)
+
+    def test_entries_with_missing_keys(self):
+        payload = self.payload()
+        payload['hourly'] = [{'dt': ONE_CALL_BASE + 3 * 3600, 'temp': 21.0}]
+        for day in payload['daily']:
+            del day['temp']['eve'], day['feels_like'], day['rain'], day['pop']
+        forecast = providers.one_call_forecast(payload)
+        first = forecast['list'][0]
+        self.assertEqual(first['main'], {'temp': 21.0, 'feels_like': None, 'pressure': None, 'humidity': None})
+        self.assertEqual((first['weather'], first['wind'], first['pop']), ([{}], {'speed': 0}, 0))
+        # The daily slots start that evening, which has no `eve` temperature: the day's stands in.
+        evening = forecast['list'][1]
+        self.assertEqual(local_hour(evening['dt'], 28800), 21)
+        self.assertEqual(evening['main']['temp'], 20)
+        self.assertIsNone(evening['main']['feels_like'])
+        series = parse_forecast_series(forecast)
+        self.assertEqual(series[0], {
+            'dt': ONE_CALL_BASE + 3 * 3600, 'temp': 21.0, 'humidity': None, 'wind_speed_kph': 0,
+            'condition_id': None, 'description': '',
+        })
+        for slot in forecast['list']:
+            self.assertFalse({'rain', 'snow'} & slot.keys())
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key')
+class OpenWeatherMapOneCallTests(SimpleTestCase):
+    PLACE = [{'name': 'Manila', 'country': 'PH', 'lat': 14.6, 'lon': 120.98}]
+
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+        self.responses = {providers.OWM_GEOCODING_URL: (200, self.PLACE), providers.OWM_ONE_CALL_URL: (200, one_call_fixture())}
+
+        def http_get(url, params):
+            self.requests.append((url, params))
+            return self.responses[url]
+
+        patcher = mock.patch('core.providers.http_get', side_effect=http_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_call_is_fetched_for_the_geocoded_place(self):
+        status, payload = providers.OpenWeatherMapProvider().get('onecall', 'Manila,PH')
+        self.assertEqual(status, 200)
+        self.assertEqual((payload['name'], payload['country'], payload['timezone_offset']), ('Manila', 'PH', 28800))
+        url, params = self.requests[-1]
+        self.assertEqual(url, providers.OWM_ONE_CALL_URL)
+        self.assertEqual((params['lat'], params['lon'], params['exclude'], params['units']), (14.6, 120.98, 'minutely', 'metric'))
+
+        # The place is geocoded once.
+        providers.OpenWeatherMapProvider().get('onecall', 'Manila,PH')
+        self.assertEqual([url for url, _ in self.requests].count(providers.OWM_GEOCODING_URL), 1)
+
+    def test_unknown_place_and_upstream_errors(self):
+        self.responses[providers.OWM_GEOCODING_URL] = (200, [])
+        self.assertEqual(providers.OpenWeatherMapProvider().get('onecall', 'Atlantis'), (404, None))
+        self.responses[providers.OWM_GEOCODING_URL] = (200, self.PLACE)
+        self.responses[providers.OWM_ONE_CALL_URL] = (401, None)
+        self.assertEqual(providers.OpenWeatherMapProvider().get('onecall', 'Manila'), (401, None))
+
+    def test_other_kinds_use_the_separate_endpoints(self):
+        self.responses['https://api.openweathermap.org/data/2.5/forecast'] = (200, {'list': []})
+        self.assertEqual(providers.OpenWeatherMapProvider().get('forecast', 'Manila'), (200, {'list': []}))
+        self.assertEqual(self.requests, [(
+            'https://api.openweathermap.org/data/2.5/forecast', {'q': 'Manila', 'appid': 'test-key', 'units': 'metric'},
+        )])
+
+
+@override_settings(WEATHER_ONE_CALL=True)
+class FetchOneCallTests(TestCase):
+    """`fetch_weather` / `fetch_forecast` share one cached `onecall` request when it is enabled."""
+
+    def setUp(self):
+        cache.clear()
+        weather_cache.local.clear()
+        self.calls = []
+        self.responses = {
+            'onecall': (200, {**one_call_fixture(), 'name': 'Manila', 'country': 'PH'}),
+            'weather': (200, weather_payload(28.0)),
+            'forecast': (200, providers.one_call_forecast({**one_call_fixture(), 'name': 'Manila'})),
+        }
+        self.provider = ScriptedProvider('owm')
+
+        def fetch(kind, city):
+            self.calls.append(kind)
+            response = self.responses[kind]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        for target, value in (('fetch', fetch), ('primary', mock.Mock(side_effect=lambda: self.provider))):
+            patcher = mock.patch.object(providers, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_current_and_forecast_come_from_one_request(self):
+        weather, error = fetch_weather('Manila')
+        self.assertIsNone(error)
+        self.assertEqual(weather['main']['temp'], 31.2)
+        forecast, error = fetch_forecast('Manila')
+        self.assertIsNone(error)
+        self.assertEqual(len(forecast['list']), 24)
+        series, _ = get_forecast_series('Manila')
+        self.assertEqual(series[0]['dt'], ONE_CALL_BASE + 3 * 3600)
+        self.assertEqual(self.calls, ['onecall'])
+        observation = Observation.objects.get()
+        self.assertEqual((observation.city_key, observation.temperature_c), ('manila', Decimal('31.20')))
+
+    def test_refresh_refetches(self):
+        fetch_one_call('Manila')
+        fetch_one_call('Manila', refresh=True)
+        self.assertEqual(self.calls, ['onecall', 'onecall'])
+
+    def test_errors_are_not_cached(self):
+        for response, message in (
+            ((404, None), "City 'Atlantis' not found."),
+            ((500, None), "Weather service error."),
+            (providers.ProviderError('timed out'), "Network error."),
+        ):
+            with self.subTest(message=message):
+                self.responses['onecall'] = response
+                self.assertEqual(fetch_weather('Atlantis'), (None, message))
+        self.assertEqual(self.calls, ['onecall'] * 3)
+        self.assertFalse(Observation.objects.exists())
+
+    def test_disabled_one_call_uses_the_separate_endpoints(self):
+        with override_settings(WEATHER_ONE_CALL=False):
+            self.assertEqual(fetch_weather('Manila')[0]['main']['temp'], 28.0)
+            self.assertEqual(len(fetch_forecast('Manila')[0]['list']), 24)
+        self.assertEqual(self.calls, ['weather', 'forecast'])
+
+    def test_provider_without_one_call_uses_the_separate_endpoints(self):
+        self.provider.kinds = ('weather', 'forecast')
+        self.assertEqual(fetch_weather('Manila')[0]['main']['temp'], 28.0)
+        fetch_forecast('Manila')
+        self.assertEqual(self.calls, ['weather', 'forecast'])
+
+
+class ScriptedProvider(providers.WeatherProvider):
+    """Answers after ``delay`` seconds with ``status``, or raises ProviderError(``error``)."""
+
+    kinds = ('weather', 'forecast', 'onecall')
+
+    def __init__(self, name: str, delay: float = 0.0, status: int = 200, error: str | None = None):
+        self.name = name
+        self.delay = delay
+        self.status = status
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.finished = threading.Event()
+
+    def outcome(self) -> tuple[int, dict | None]:
+        if self.error:
+            raise providers.ProviderError(self.error)
+        return self.status, {'name': self.name} if self.status == 200 else None
+
+    def get(self, kind, city):
+        self.calls += 1
+        try:
+            time.sleep(self.delay)
+            return self.outcome()
+        finally:
+            self.finished.set()
+
+    async def aget(self, kind, city):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.finished.set()
+        return self.outcome()
+
+
+class LatencyDistributionTests(SimpleTestCase):
+    def test_parse_pads_missing_parts(self):
+        for spec, expected in (
+            ('80', (0.08, 0.0, 1.0)),
+            ('80,0.05', (0.08, 0.05, 1.0)),
+            ('80,0.05,1500', (0.08, 0.05, 1.5)),
+        ):
+            with self.subTest(spec=spec):
+                latency = benchmarks.LatencyDistribution.parse(spec)
+                self.assertEqual((latency.median, latency.tail_rate, latency.tail), expected)
+
+    def test_parse_rejects_extra_parts(self):
+        with self.assertRaises(CommandError):
+            benchmarks.LatencyDistribution.parse('80,0.05,1500,3')
+
+
+@override_settings(WEATHER_HEDGE_MIN_DELAY_MS=50, WEATHER_UPSTREAM_TIMEOUT=2)
+class HedgedFetchTests(SimpleTestCase):
+    """`fetch`/`afetch` hedge a request still pending after the primary's p95 (here 50 ms)."""
+
+    def setUp(self):
+        providers.latencies.clear()
+        self.addCleanup(providers.latencies.clear)
+        hedges = mock.patch.object(metrics.UPSTREAM_HEDGES, 'inc')
+        self.hedges = hedges.start()
+        self.addCleanup(hedges.stop)
+
+    def use(self, primary: ScriptedProvider, hedge: ScriptedProvider):
+        for _ in range(providers.MIN_SAMPLES):
+            providers.latencies.record(primary.name, 'weather', 0.001)
+        for target, provider in (('primary', primary), ('hedge_provider', hedge)):
+            patcher = mock.patch.object(providers, target, return_value=provider)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def hedge_results(self) -> list[str]:
+        return [call.kwargs['result'] for call in self.hedges.call_args_list]
+
+    def assertPoolIdle(self):
+        # Nothing queued behind the finished requests, no extra threads.
+        self.assertEqual(providers._pool._work_queue.qsize(), 0)
+        workers = [thread for thread in threading.enumerate() if thread.name.startswith('weather-upstream')]
+        self.assertLessEqual(len(workers), providers.HEDGE_POOL_SIZE)
+
+    def test_no_hedging_until_latencies_are_known(self):
+        primary, hedge = ScriptedProvider('primary', delay=0.1), ScriptedProvider('hedge')
+        with mock.patch.object(providers, 'primary', return_value=primary), \
+                mock.patch.object(providers, 'hedge_provider', return_value=hedge):
+            self.assertEqual(providers.fetch('weather', 'Manila'), (200, {'name': 'primary'}))
+        self.assertEqual(hedge.calls, 0)
+
+    def test_primary_wins(self):
+        primary, hedge = ScriptedProvider('primary'), ScriptedProvider('hedge')
+        self.use(primary, hedge)
+        self.assertEqual(providers.fetch('weather', 'Manila'), (200, {'name': 'primary'}))
+        self.assertEqual(hedge.calls, 0)
+        self.assertEqual(self.hedge_results(), [])
+
+    def test_hedge_wins_after_the_delay(self):
+        primary, hedge = ScriptedProvider('primary', delay=0.5), ScriptedProvider('hedge')
+        self.use(primary, hedge)
+        started = time.perf_counter()
+        self.assertEqual(providers.fetch('weather', 'Manila'), (200, {'name': 'hedge'}))
+        elapsed = time.perf_counter() - started
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.hedge_results(), ['sent', 'won'])
+        # The losing primary is ignored; it finishes on the pool and its latency counts.
+        self.assertTrue(primary.finished.wait(2))
+        self.assertPoolIdle()
+
+    def test_primary_error_falls_over_to_the_hedge(self):
+        for delay in (0, 0.1):
+            with self.subTest(primary_fails_after=delay):
+                self.hedges.reset_mock()
+                primary = ScriptedProvider('primary', delay=delay, error='connection refused')
+                hedge = ScriptedProvider('hedge', delay=0.1)
+                self.use(primary, hedge)
+                self.assertEqual(providers.fetch('weather', 'Manila'), (200, {'name': 'hedge'}))
+                self.assertEqual(self.hedge_results(), ['sent', 'won'])
+                self.assertPoolIdle()
+
+    def test_not_found_is_not_hedged(self):
+        primary, hedge = ScriptedProvider('primary', status=404), ScriptedProvider('hedge')
+        self.use(primary, hedge)
+        self.assertEqual(providers.fetch('weather', 'Atlantis'), (404, None))
+        self.assertEqual(hedge.calls, 0)
+
+    def test_both_fail(self):
+        primary = ScriptedProvider('primary', delay=0.1, error='primary down')
+        hedge = ScriptedProvider('hedge', error='hedge down')
+        self.use(primary, hedge)
+        with self.assertRaisesMessage(providers.ProviderError, 'primary down'):
+            providers.fetch('weather', 'Manila')
+        self.assertEqual(self.hedge_results(), ['sent'])
+        self.assertPoolIdle()
+
+    def test_both_fail_with_a_status(self):
+        primary, hedge = ScriptedProvider('primary', delay=0.1, status=503), ScriptedProvider('hedge', status=502)
+        self.use(primary, hedge)
+        self.assertEqual(providers.fetch('weather', 'Manila'), (503, None))
+
+    @override_settings(WEATHER_UPSTREAM_TIMEOUT=0.2)
+    def test_both_time_out(self):
+        primary, hedge = ScriptedProvider('primary', delay=1), ScriptedProvider('hedge', delay=1)
+        self.use(primary, hedge)
+        with self.assertRaisesMessage(providers.ProviderError, 'timed out'):
+            providers.fetch('weather', 'Manila')
+        self.assertTrue(primary.finished.wait(2) and hedge.finished.wait(2))
+        self.assertPoolIdle()
+
+    @override_settings(WEATHER_UPSTREAM_TIMEOUT=0.3)
+    def test_timeout_covers_the_whole_hedged_request(self):
+        # The primary answers 503 just before the timeout; the hedge is not given a fresh one.
+        primary, hedge = ScriptedProvider('primary', delay=0.25, status=503), ScriptedProvider('hedge', delay=1)
+        self.use(primary, hedge)
+        started = time.perf_counter()
+        with self.assertRaisesMessage(providers.ProviderError, 'timed out'):
+            providers.fetch('weather', 'Manila')
+        self.assertLess(time.perf_counter() - started, 0.45)
+        self.assertTrue(hedge.finished.wait(2))
+        self.assertPoolIdle()
+
+    def test_async_primary_wins(self):
+        primary, hedge = ScriptedProvider('primary'), ScriptedProvider('hedge')
+        self.use(primary, hedge)
+        self.assertEqual(asyncio.run(providers.afetch('weather', 'Manila')), (200, {'name': 'primary'}))
+        self.assertEqual(hedge.calls, 0)
+
+    def test_async_hedge_wins_and_the_primary_is_cancelled(self):
+        primary, hedge = ScriptedProvider('primary', delay=5), ScriptedProvider('hedge')
+        self.use(primary, hedge)
+        started = time.perf_counter()
+        self.assertEqual(asyncio.run(providers.afetch('weather', 'Manila')), (200, {'name': 'hedge'}))
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertTrue(primary.cancelled)
+        self.assertEqual(self.hedge_results(), ['sent', 'won'])
+
+    def test_async_primary_wins_the_race_and_the_hedge_is_cancelled(self):
+        primary, hedge = ScriptedProvider('primary', delay=0.1), ScriptedProvider('hedge', delay=5)
+        self.use(primary, hedge)
+        self.assertEqual(asyncio.run(providers.afetch('weather', 'Manila')), (200, {'name': 'primary'}))
+        self.assertTrue(hedge.cancelled)
+        self.assertEqual(self.hedge_results(), ['sent'])
+
+    def test_async_primary_error_falls_over_to_the_hedge(self):
+        primary = ScriptedProvider('primary', error='connection refused')
+        hedge = ScriptedProvider('hedge', delay=0.1)
+        self.use(primary, hedge)
+        self.assertEqual(asyncio.run(providers.afetch('weather', 'Manila')), (200, {'name': 'hedge'}))
+
+    def test_async_both_fail(self):
+        primary = ScriptedProvider('primary', delay=0.1, error='primary down')
+        hedge = ScriptedProvider('hedge', error='hedge down')
+        self.use(primary, hedge)
+        with self.assertRaisesMessage(providers.ProviderError, 'primary down'):
+            asyncio.run(providers.afetch('weather', 'Manila'))
+
+
+class FakeClock:
+    """Stands in for the `time` module in core.weather_cache."""
+
+    def __init__(self):
+        self.now = 1_800_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time_ns(self) -> int:
+        return int(self.now * 1e9)
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def weather_payload(temp: float, name: str = 'Manila') -> dict:
+    return {
+        'coord': {'lat': 14.6, 'lon': 121.0},
+        'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}],
+        'main': {'temp': temp, 'feels_like': temp, 'pressure': 1009, 'humidity': 70},
+        'wind': {'speed': 3.1},
+        'dt': 1_800_000_000,
+        'sys': {'country': 'PH'},
+        'timezone': 28800,
+        'name': name,
+    }
+
+
+class LocalCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(weather_cache, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        local = weather_cache.LocalCache(max_entries=2, ttl=30)
+        expires = self.clock.now + 600
+        local.store('a', 'A', 1, expires)
+        local.store('b', 'B', 1, expires)
+        self.assertEqual(local.lookup('a')[0], 'A')  # 'a' is now the most recent
+        local.store('c', 'C', 1, expires)
+        self.assertIsNone(local.lookup('b'))
+        self.assertEqual(local.lookup('a')[0], 'A')
+        self.assertEqual(local.lookup('c')[0], 'C')
+        self.assertEqual(local.stats['eviction'], 1)
+        self.assertEqual(len(local), 2)
+
+    def test_storing_again_refreshes_recency(self):
+        local = weather_cache.LocalCache(max_entries=2, ttl=30)
+        expires = self.clock.now + 600
+        local.store('a', 'A', 1, expires)
+        local.store('b', 'B', 1, expires)
+        local.store('a', 'A2', 2, expires)
+        local.store('c', 'C', 1, expires)
+        self.assertIsNone(local.lookup('b'))
+        self.assertEqual(local.lookup('a')[:2], ('A2', 2))
+
+    def test_entry_needs_a_check_after_ttl_and_goes_at_expiry(self):
+        local = weather_cache.LocalCache(max_entries=4, ttl=30)
+        local.store('a', 'A', 7, self.clock.now + 100)
+        self.assertEqual(local.lookup('a'), ('A', 7, True))
+        self.clock.advance(30)
+        self.assertEqual(local.lookup('a'), ('A', 7, False))
+        local.extend('a')
+        self.assertEqual(local.lookup('a'), ('A', 7, True))
+        self.clock.advance(70)
+        self.assertIsNone(local.lookup('a'))
+        self.assertEqual(len(local), 0)
+
+    def test_disabled_with_no_entries(self):
+        local = weather_cache.LocalCache(max_entries=0, ttl=30)
+        local.store('a', 'A', 1, self.clock.now + 100)
+        self.assertIsNone(local.lookup('a'))
+
+
+class TieredWeatherCacheTests(SimpleTestCase):
+    """`get`/`aget` serve L1 while fresh, revalidate it against L2's version, then reload."""
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        self.local = weather_cache.LocalCache(max_entries=8, ttl=30)
+        self.shared = mock.Mock(wraps=cache)
+        for target, value in (('time', self.clock), ('local', self.local), ('cache', self.shared)):
+            patcher = mock.patch.object(weather_cache, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def shared_reads(self) -> int:
+        reads = [call for call in self.shared.method_calls if call[0] in ('get', 'get_many', 'aget', 'aget_many')]
+        self.shared.reset_mock()
+        return len(reads)
+
+    def write_from_another_process(self, key: str, payload: dict):
+        other = weather_cache.LocalCache(max_entries=8, ttl=30)
+        self.clock.advance(0.001)  # a new version
+        with mock.patch.object(weather_cache, 'local', other):
+            weather_cache.set(key, payload, 600)
+        self.shared.reset_mock()
+
+    def test_get_goes_through_both_tiers(self):
+        weather_cache.set('w', weather_payload(30.0), 600)
+        self.shared.reset_mock()
+
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 30.0)
+        self.assertEqual(self.shared_reads(), 0)
+        self.assertEqual(self.local.stats['hit'], 1)
+
+        # Past the TTL, one small version read revalidates the L1 copy.
+        self.clock.advance(31)
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 30.0)
+        self.assertEqual(self.shared_reads(), 1)
+        self.assertEqual(self.local.stats['revalidated'], 1)
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 30.0)
+        self.assertEqual(self.shared_reads(), 0)
+
+        # Another process wrote a new version: served from L1 until the next
+        # check, then reloaded from L2.
+        self.write_from_another_process('w', weather_payload(25.0))
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 30.0)
+        self.clock.advance(31)
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 25.0)
+        self.assertEqual(self.local.stats['miss'], 1)
+
+    def test_l1_miss_loads_from_l2(self):
+        self.write_from_another_process('w', weather_payload(28.0))
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 28.0)
+        self.assertEqual(self.shared_reads(), 1)
+        self.assertEqual(weather_cache.get('w')['main']['temp'], 28.0)
+        self.assertEqual(self.shared_reads(), 0)
+
+    def test_missing_from_both_tiers(self):
+        self.assertIsNone(weather_cache.get('w'))
+        self.assertEqual(len(self.local), 0)
+
+    def test_entry_dropped_from_l2_is_not_served_after_the_check(self):
+        weather_cache.set('w', weather_payload(30.0), 600)
+        cache.delete_many(['w', weather_cache.version_key('w'), weather_cache.expires_key('w')])
+        self.clock.advance(31)
+        self.assertIsNone(weather_cache.get('w'))
+
+    def test_l1_entry_expires_with_l2(self):
+        weather_cache.set('w', weather_payload(30.0), 60)
+        self.assertEqual(weather_cache.expires_at('w'), self.clock.now + 60)
+        self.clock.advance(61)
+        self.assertIsNone(self.local.lookup('w'))
+
+    def test_aget_goes_through_both_tiers(self):
+        async def scenario():
+            await weather_cache.aset('w', weather_payload(30.0), 600)
+            self.shared.reset_mock()
+            first = await weather_cache.aget('w')
+            fresh_reads = self.shared_reads()
+            self.clock.advance(31)
+            second = await weather_cache.aget('w')
+            revalidate_reads = self.shared_reads()
+            self.write_from_another_process('w', weather_payload(25.0))
+            self.clock.advance(31)
+            third = await weather_cache.aget('w')
+            return first, fresh_reads, second, revalidate_reads, third
+
+        first, fresh_reads, second, revalidate_reads, third = asyncio.run(scenario())
+        self.assertEqual((first['main']['temp'], fresh_reads), (30.0, 0))
+        self.assertEqual((second['main']['temp'], revalidate_reads), (30.0, 1))
+        self.assertEqual(third['main']['temp'], 25.0)
+        self.assertEqual(self.local.stats, {'hit': 1, 'revalidated': 1, 'miss': 1, 'eviction': 0})
+
+
+class CodecTests(SimpleTestCase):
+    def payloads(self):
+        rng = random.Random(7)
+        dt = 1_800_000_000
+        return {
+            'weather': full_current(rng, dt),
+            'forecast': full_forecast(rng, dt),
+            'onecall': full_one_call(rng, dt),
+        }
+
+    def assertRoundTrips(self, level: int, compressed: bool):
+        with override_settings(WEATHER_CACHE_COMPRESS_LEVEL=level):
+            for kind, payload in self.payloads().items():
+                with self.subTest(kind=kind):
+                    encoded = codec.encode(payload)
+                    self.assertEqual(encoded[:2], codec.MAGIC + bytes((codec.VERSION,)))
+                    self.assertEqual(bool(encoded[2] & codec.COMPRESSED), compressed)
+                    self.assertEqual(bool(encoded[2] & codec.COLUMNAR), kind != 'weather')
+                    decoded = codec.decode(encoded)
+                    self.assertEqual(codec.payload_kind(decoded), kind)
+                    self.assertEqual(decoded, codec.join(*codec.split(payload)))
+                    # Trimmed payloads survive a second pass unchanged.
+                    self.assertEqual(codec.decode(codec.encode(decoded)), decoded)
+
+    def test_round_trip_compressed(self):
+        self.assertRoundTrips(6, compressed=True)
+
+    def test_round_trip_uncompressed(self):
+        self.assertRoundTrips(0, compressed=False)
+
+    def test_series_values_survive(self):
+        payload = self.payloads()['forecast']
+        payload['list'][0]['main']['humidity'] = None
+        decoded = codec.decode(codec.encode(payload))
+        self.assertEqual(len(decoded['list']), 40)
+        first, original = decoded['list'][0], payload['list'][0]
+        self.assertEqual(first['dt'], original['dt'])
+        self.assertEqual(first['main']['temp'], original['main']['temp'])
+        self.assertIsNone(first['main']['humidity'])
+        self.assertEqual(first['weather'], original['weather'])
+        self.assertEqual(decoded['city']['name'], 'Manila')
+
+    def test_rows_that_do_not_pack_are_kept_as_json(self):
+        payload = self.payloads()['onecall']
+        payload['hourly'][0]['temp'] = 1000.0  # out of range for the packed column
+        encoded = codec.encode(payload)
+        self.assertFalse(encoded[2] & codec.COLUMNAR)
+        self.assertEqual(codec.decode(encoded)['hourly'][0]['temp'], 1000.0)
+
+    def test_values_cached_before_encoding_are_returned_as_is(self):
+        legacy = {'name': 'Manila', 'main': {'temp': 30.0}}
+        self.assertIs(codec.decode(legacy), legacy)
+        self.assertIsNone(codec.decode(None))
+        self.assertEqual(codec.decode(b'{"name": "Manila"}'), b'{"name": "Manila"}')
+
+    def test_truncated_or_corrupt_entries_decode_to_none(self):
+        encoded = codec.encode(self.payloads()['forecast'])
+        for data in (
+            codec.MAGIC,
+            codec.MAGIC + bytes((codec.VERSION,)),
+            codec.MAGIC + bytes((codec.VERSION + 1,)) + encoded[2:],
+            encoded[:3],
+            encoded[:len(encoded) // 2],
+            encoded[:3] + b'\x00' * 40,
+            codec.MAGIC + bytes((codec.VERSION, codec.COLUMNAR)) + b'\x10\x00\x00\x00{"kind":"x"}',
+        ):
+            with self.subTest(data=data[:16]):
+                self.assertIsNone(codec.decode(data))
+
+    def test_corrupt_entry_is_a_cache_miss(self):
+        local = weather_cache.LocalCache(max_entries=8, ttl=30)
+        with mock.patch.object(weather_cache, 'local', local):
+            cache.set('corrupt', codec.MAGIC + bytes((codec.VERSION,)))
+            self.assertIsNone(weather_cache.get('corrupt'))
+            self.assertIsNone(asyncio.run(weather_cache.aget('corrupt')))
+        self.assertEqual(len(local), 0)
+
+
+@override_settings(WEATHER_ONE_CALL=False, OBSERVATION_MAX_AGE=600)
+class ObservationStoreTests(TestCase):
+    """`fetch_observation` serves the shared store while a row is fresh, whatever the query spelling."""
+
+    def setUp(self):
+        cache.clear()
+        weather_cache.local.clear()
+        self.payloads = {}
+        self.upstream = []
+
+        def fetch(kind, city):
+            self.upstream.append(city)
+            return 200, self.payloads[city]
+
+        async def afetch(kind, city):
+            return fetch(kind, city)
+
+        for target, value in (('fetch', fetch), ('afetch', afetch),
+                              ('primary', mock.Mock(return_value=ScriptedProvider('owm')))):
+            patcher = mock.patch.object(providers, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def payload(self, name: str, country: str, dt: int = 1_800_000_000) -> dict:
+        return {**weather_payload(12.5, name), 'dt': dt, 'sys': {'country': country}}
+
+    def test_country_alias_query_hits_the_store(self):
+        self.payloads['London,uk'] = self.payload('London', 'GB')
+        first, error = fetch_observation('London,uk')
+        self.assertIsNone(error)
+        self.assertEqual((first.city_key, first.country, first.query_key), ('london', 'GB', 'london,uk'))
+        for query in ('London,uk', 'london, UK', 'London', 'London,GB'):
+            with self.subTest(query=query), \
+                    mock.patch('core.views.fetch_weather', side_effect=AssertionError('store miss')):
+                self.assertEqual(get_latest_observation(query), first)
+                self.assertEqual(fetch_observation(query), (first, None))
+        self.assertEqual(self.upstream, ['London,uk'])
+        self.assertEqual(Observation.objects.count(), 1)
+
+    def test_city_alias_query_hits_the_store(self):
+        self.payloads['NYC'] = self.payload('New York', 'US')
+        first, _ = fetch_observation('NYC')
+        with mock.patch('core.views.fetch_weather', side_effect=AssertionError('store miss')):
+            self.assertEqual(fetch_observation('NYC'), (first, None))
+            self.assertEqual(fetch_observation('New York,US'), (first, None))
+        self.assertEqual(self.upstream, ['NYC'])
+
+    def test_query_matching_the_name_is_not_recorded(self):
+        self.payloads['London,uk'] = self.payload('London', 'GB')
+        store_observation(self.payloads['London,uk'], query='London,uk')
+        store_observation(self.payloads['London,uk'], query='London')
+        store_observation(self.payloads['London,uk'], touch=True, query='london,gb')
+        self.assertEqual(Observation.objects.get().query_key, 'london,uk')
+
+    def test_other_city_with_the_same_name_does_not_match(self):
+        self.payloads['London,uk'] = self.payload('London', 'GB')
+        fetch_observation('London,uk')
+        self.assertIsNone(get_latest_observation('London,CA'))
+
+    def test_newest_observation_wins(self):
+        store_observation(self.payload('Manila', 'PH', dt=1_800_000_000))
+        newer = store_observation(self.payload('Manila', 'PH', dt=1_800_000_600))
+        self.assertEqual(get_latest_observation('Manila'), newer)
+
+    def test_stale_observation_is_refetched_and_touched(self):
+        self.payloads['London,uk'] = self.payload('London', 'GB')
+        first, _ = fetch_observation('London,uk')
+        Observation.objects.update(fetched_at=first.fetched_at - timedelta(seconds=599))
+        self.assertEqual(get_latest_observation('London,uk'), first)
+        self.assertIsNone(get_latest_observation('London,uk', max_age=598))
+
+        Observation.objects.update(fetched_at=first.fetched_at - timedelta(seconds=601))
+        self.assertIsNone(get_latest_observation('London,uk'))
+        cache.clear()
+        weather_cache.local.clear()
+        again, _ = fetch_observation('London,uk')
+        # Same OWM `dt`: the row is refreshed, not duplicated.
+        self.assertEqual(again, first)
+        self.assertEqual(Observation.objects.count(), 1)
+        self.assertEqual(get_latest_observation('London,uk'), first)
+        self.assertEqual(self.upstream, ['London,uk', 'London,uk'])
+
+    async def test_async_fetch_shares_the_store(self):
+        self.payloads['London,uk'] = self.payload('London', 'GB')
+        first, _ = await afetch_observation('London,uk')
+        self.assertEqual(await afetch_observation('London,uk'), (first, None))
+        self.assertEqual(await afetch_observation('London'), (first, None))
+        self.assertEqual(self.upstream, ['London,uk'])
+        self.assertEqual(first.query_key, 'london,uk')
+
+
+class ObservationBackfillTests(TransactionTestCase):
+    """Migration 0013 moves the metrics copied onto searches into shared Observation rows."""
+
+    before = [('core', '0012_savedlocation_favorite')]
+    after = [('core', '0013_observation')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_searches_are_backfilled_into_observations(self):
+        old_apps = self.migrate(self.before)
+        OldUser = old_apps.get_model('auth', 'User')
+        OldSearch = old_apps.get_model('core', 'WeatherSearch')
+        user = OldUser.objects.create(username='backfill')
+        payload = {**weather_payload(31.5), 'dt': 1_800_000_000}
+        common = {
+            'user': user, 'city': 'Manila', 'country': 'PH', 'temperature_c': Decimal('31.50'), 'humidity': 70,
+            'wind_speed_kph': Decimal('11.16'), 'condition_main': 'Clear', 'condition_description': 'clear sky',
+            'icon_code': '01d',
+        }
+        twins = [OldSearch.objects.create(**common, api_payload=payload) for _ in range(2)]
+        legacy = OldSearch.objects.create(**{**common, 'city': 'Cebu'}, api_payload=None)
+
+        new_apps = self.migrate(self.after)
+        NewObservation = new_apps.get_model('core', 'Observation')
+        NewSearch = new_apps.get_model('core', 'WeatherSearch')
+        self.assertEqual(NewObservation.objects.count(), 2)
+
+        manila = NewObservation.objects.get(city_key='manila')
+        self.assertEqual(manila.observed_at, datetime.fromtimestamp(1_800_000_000, tz=timezone.utc))
+        self.assertEqual((manila.country, manila.temperature_c, manila.pressure_hpa), ('PH', Decimal('31.50'), 1009))
+        self.assertEqual(manila.condition_id, 800)
+        self.assertEqual({search.observation_id for search in NewSearch.objects.filter(pk__in=[t.pk for t in twins])},
+                         {manila.pk})
+
+        # Without a payload `dt` the search time stands in for the observation time.
+        cebu = NewSearch.objects.get(pk=legacy.pk).observation
+        self.assertEqual(cebu.observed_at, legacy.searched_at)
+        self.assertIsNone(cebu.pressure_hpa)
+
+
+@override_settings(WEATHER_ONE_CALL=False)
+class WarmWeatherCacheTests(TestCase):
+    """`warm_weather_cache` refreshes the hottest cities first, within its request budget."""
+
+    def setUp(self):
+        cache.clear()
+        weather_cache.local.clear()
+        users = [User.objects.create_user(f'warm{i}') for i in range(3)]
+        for user in users:
+            AlertPreference.objects.create(user=user, city='Manila', temperature_threshold=30)
+        AlertPreference.objects.create(user=users[0], city='manila', country='', humidity_threshold=90)
+        AlertPreference.objects.create(user=users[0], city='Cebu', country='PH', temperature_threshold=30)
+        AlertPreference.objects.create(user=users[1], city='Baguio', temperature_threshold=30, is_active=False)
+        SavedLocation.objects.create(user=users[1], city='Cebu', country='PH')
+        SavedLocation.objects.create(user=users[2], city='Iloilo', favorite=False)
+        WeatherSearch.objects.create(user=users[2], city='Davao')
+
+        self.calls = []
+        for kind in ('weather', 'forecast'):
+            patcher = mock.patch(f'core.management.commands.warm_weather_cache.fetch_{kind}', self.fetcher(kind))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fetcher(self, kind: str):
+        def fetch(city, refresh=False):
+            self.assertTrue(refresh)
+            self.calls.append((kind, city))
+            return (None, 'Network error.') if city == 'Davao' else ({}, None)
+        return fetch
+
+    def warm(self, **options) -> str:
+        out = io.StringIO()
+        call_command('warm_weather_cache', stdout=out, **options)
+        return out.getvalue().strip()
+
+    def test_cities_are_ranked_by_alerts_favorites_and_searches(self):
+        self.assertEqual(hot_cities(10), ['Manila', 'Cebu,PH', 'Davao'])
+        self.assertEqual(hot_cities(2), ['Manila', 'Cebu,PH'])
+
+    def test_budget_stops_the_run_after_the_hottest_cities(self):
+        self.assertEqual(self.warm(budget=3), 'Request budget of 3 reached. Refreshed 3. Fresh 0. Errors 0.')
+        self.assertEqual(self.calls, [('weather', 'Manila'), ('forecast', 'Manila'), ('weather', 'Cebu,PH')])
+
+    def test_entries_expiring_after_the_lead_time_are_left_alone(self):
+        weather_cache.set(weather_cache_key('weather', 'Manila'), {'name': 'Manila'}, 3600)
+        weather_cache.set(weather_cache_key('forecast', 'Manila'), {'list': []}, 60)
+        self.assertEqual(self.warm(budget=10, lead=300), 'Warmed 3 cities. Refreshed 3. Fresh 1. Errors 2.')
+        self.assertEqual(self.calls, [
+            ('forecast', 'Manila'), ('weather', 'Cebu,PH'), ('forecast', 'Cebu,PH'),
+            ('weather', 'Davao'), ('forecast', 'Davao'),
+        ])
+
+    def test_nothing_to_warm(self):
+        AlertPreference.objects.all().delete()
+        SavedLocation.objects.all().delete()
+        WeatherSearch.objects.all().delete()
+        self.assertEqual(self.warm(), 'No hot cities to warm.')
+        self.assertEqual(self.calls, [])
+
+
+FORECAST_NOW = 1_800_000_000.0
+
+
+def forecast_slot(hours: float, temp=20.0, humidity=50, wind_speed_kph=10.0, condition_id=800,
+                  description='clear sky', now: float = FORECAST_NOW) -> dict:
+    """A parsed forecast slot ``hours`` after ``now``."""
+    return {
+        'dt': int(now + hours * 3600), 'temp': temp, 'humidity': humidity, 'wind_speed_kph': wind_speed_kph,
+        'condition_id': condition_id, 'description': description,
+    }
+
+
+class ForecastSummaryTests(SimpleTestCase):
+    def test_only_slots_inside_the_horizon_count(self):
+        series = [
+            forecast_slot(-3, temp=40.0),  # ended before the current 3h slot
+            forecast_slot(-2.5, temp=25.0),
+            forecast_slot(6, temp=10.0),
+            forecast_slot(6.5, temp=45.0, condition_id=211, description='thunderstorm'),
+        ]
+        summary = summarize_forecast(series, 6, FORECAST_NOW)
+        self.assertEqual(summary['readings']['temperature_threshold'], 25.0)
+        self.assertEqual(summary['readings']['low_temperature_threshold'], 10.0)
+        self.assertIsNone(summary['severe'])
+        self.assertEqual(summarize_forecast(series, 7, FORECAST_NOW)['readings']['temperature_threshold'], 45.0)
+
+    def test_extremes_skip_missing_readings(self):
+        series = [
+            forecast_slot(1, humidity=None, wind_speed_kph=None),
+            forecast_slot(4, humidity=80, wind_speed_kph=None),
+            forecast_slot(7, humidity=60, wind_speed_kph=None, temp=None),
+        ]
+        readings = summarize_forecast(series, 12, FORECAST_NOW)['readings']
+        self.assertEqual(readings['humidity_threshold'], 80)
+        self.assertIsNone(readings['wind_speed_threshold'])
+        self.assertEqual(readings['temperature_threshold'], 20.0)
+
+    def test_first_severe_slot_is_reported(self):
+        series = [
+            forecast_slot(1),
+            forecast_slot(4, condition_id=None, description='heavy snow'),
+            forecast_slot(7, condition_id=211, description='thunderstorm'),
+        ]
+        self.assertEqual(summarize_forecast(series, 12, FORECAST_NOW)['severe'], series[1])
+
+    def test_no_slot_in_the_horizon(self):
+        self.assertIsNone(summarize_forecast([], 12, FORECAST_NOW))
+        self.assertIsNone(summarize_forecast([forecast_slot(13)], 12, FORECAST_NOW))
+
+
+class ForecastEvaluationTests(SimpleTestCase):
+    def setUp(self):
+        def alert(pk, **fields):
+            return AlertPreference(pk=pk, city='Manila', updated_at=datetime(2026, 1, 1, tzinfo=timezone.utc), **fields)
+
+        self.alerts = [
+            alert(1, forecast_hours=6, temperature_threshold=30),
+            alert(2, forecast_hours=24, temperature_threshold=30),
+            alert(3, temperature_threshold=30),
+            alert(4, forecast_hours=24, temperature_threshold=30, is_active=False),
+            alert(5, forecast_hours=24, humidity_threshold=95, condition_alerts=False),
+        ]
+        self.index = AlertIndex(self.alerts)
+        self.series = [
+            forecast_slot(3, temp=25.0),
+            forecast_slot(12, temp=31.0, condition_id=211, description='thunderstorm'),
+        ]
+
+    def test_alerts_are_evaluated_per_horizon(self):
+        triggered = self.index.evaluate_forecast('manila', self.series, FORECAST_NOW)
+        self.assertEqual([(alert.pk, reason) for alert, reason in triggered], [(2, (
+            'Forecast (next 24h): Temperature 31C reached threshold 30C'
+            ' | Forecast (next 24h): thunderstorm expected'
+        ))])
+        self.assertEqual(self.index.forecast_queries(), ['Manila'])
+        self.assertEqual(self.index.evaluate_forecast('Cebu', self.series, FORECAST_NOW), [])
+
+    def test_horizon_moving_forward_brings_new_slots_in(self):
+        later = FORECAST_NOW + 7 * 3600
+        self.assertEqual(self.index.evaluate_forecast('Manila', self.series, FORECAST_NOW)[0][0].pk, 2)
+        self.assertEqual([alert.pk for alert, _ in self.index.evaluate_forecast('Manila', self.series, later)], [1, 2])
+
+    def test_slots_added_since_the_last_evaluation(self):
+        slots_added = self.index.forecast_slots_added
+        self.assertFalse(slots_added('Manila', self.series, FORECAST_NOW - 600, FORECAST_NOW))
+        # The 6h horizon ended at +4h two hours ago: the +3h slot was already in it.
+        self.assertFalse(slots_added('Manila', self.series, FORECAST_NOW - 2 * 3600, FORECAST_NOW))
+        # Seven hours on, the +12h slot has entered the 6h horizon.
+        self.assertTrue(slots_added('Manila', self.series, FORECAST_NOW, FORECAST_NOW + 7 * 3600))
+        # Four hours ago the 6h horizon ended at +2h, before the +3h slot.
+        self.assertTrue(slots_added('Manila', self.series, FORECAST_NOW - 4 * 3600, FORECAST_NOW))
+        self.assertFalse(AlertIndex(self.alerts[2:3]).forecast_slots_added('Manila', self.series, 0, FORECAST_NOW))
+
+
+class ForecastRunTests(AlertDeliveryMixin, TestCase):
+    """`AlertRun` re-evaluates a forecast it has seen when its horizon brings in new slots."""
+
+    def setUp(self):
+        user = User.objects.create_user('forecaster', 'forecaster@example.com')
+        AlertPreference.objects.create(user=user, city='Manila', forecast_hours=6, temperature_threshold=30)
+        now = time.time()
+        # Issued an hour ago; the hot slot is 4.5h out.
+        self.series = [forecast_slot(h, now=now) for h in (-1, 2)] + [forecast_slot(4.5, temp=32.0, now=now)]
+        patcher = mock.patch('core.alert_runner.get_forecast_series', return_value=(self.series, None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.observation = self.make_observation(temperature=Decimal('20'))
+
+    def seen(self, hours_ago: float, checked_at=True) -> None:
+        """Pretend this forecast issuance was evaluated ``hours_ago``, with unchanged alerts since."""
+        then = dj_timezone.now() - timedelta(hours=hours_ago)
+        AlertPreference.objects.update(updated_at=then - timedelta(minutes=1))
+        AlertSchedule.objects.create(
+            location_key='manila', next_check_at=then, last_checked_at=then,
+            last_forecast_dt=self.series[0]['dt'], last_forecast_checked_at=then if checked_at else None,
+        )
+
+    def test_slot_entering_the_horizon_triggers(self):
+        self.seen(hours_ago=3)
+        self.run_alerts(self.observation, pending=False)
+        self.assertIn('Forecast (next 6h): Temperature 32C', AlertHistory.objects.get().reason)
+        schedule = AlertSchedule.objects.get()
+        self.assertGreater(schedule.last_forecast_checked_at, dj_timezone.now() - timedelta(minutes=1))
+
+        # Nothing new since: the same forecast is not evaluated again.
+        self.run_alerts(self.make_observation(temperature=Decimal('20'), minute=10), pending=False)
+        self.assertEqual(AlertHistory.objects.count(), 1)
+
+    def test_forecast_already_covered_is_skipped(self):
+        self.seen(hours_ago=0.25)
+        self.run_alerts(self.observation, pending=False)
+        self.assertFalse(AlertHistory.objects.exists())
+
+    def test_schedule_without_a_forecast_check_time_is_evaluated(self):
+        self.seen(hours_ago=0.25, checked_at=False)
+        self.run_alerts(self.observation, pending=False)
+        self.assertEqual(AlertHistory.objects.count(), 1)
+
+
+class MetricsRenderTests(SimpleTestCase):
+    """`metrics.render` reports every declared series from the shared cache in Prometheus text format."""
+
+    def setUp(self):
+        metrics.flush()
+        cache.clear()
+
+    def samples(self) -> dict[str, float]:
+        rows = [line.rsplit(' ', 1) for line in metrics.render().splitlines() if not line.startswith('#')]
+        return {sample: float(value) for sample, value in rows}
+
+    def test_counters_render_every_label_set(self):
+        metrics.UPSTREAM_ERRORS.inc(kind='weather')
+        metrics.UPSTREAM_ERRORS.inc(2, kind='weather')
+        metrics.ALERTS_TRIGGERED.inc()
+        text = metrics.render()
+        self.assertIn(
+            '# HELP weather_upstream_errors_total Weather API requests that failed or returned an error status.\n'
+            '# TYPE weather_upstream_errors_total counter\n'
+            'weather_upstream_errors_total{kind="weather"} 3\n'
+            'weather_upstream_errors_total{kind="forecast"} 0\n'
+            'weather_upstream_errors_total{kind="onecall"} 0\n',
+            text,
+        )
+        self.assertIn('alerts_triggered_total 1\n', text)
+        self.assertEqual(self.samples()['weather_cache_requests_total{kind="observation",result="miss"}'], 0)
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.UPSTREAM_LATENCY.observe(0.03, kind='forecast')
+        metrics.UPSTREAM_LATENCY.observe(3.0, kind='forecast')
+        samples = self.samples()
+        bucket = 'weather_upstream_request_seconds_bucket{{kind="forecast",le="{}"}}'.format
+        self.assertEqual([samples[bucket(le)] for le in ('0.025', '0.05', '2.5', '5.0', '+Inf')], [0, 1, 1, 2, 2])
+        self.assertAlmostEqual(samples['weather_upstream_request_seconds_sum{kind="forecast"}'], 3.03)
+        self.assertEqual(samples['weather_upstream_request_seconds_count{kind="forecast"}'], 2)
+        self.assertEqual(samples['weather_upstream_request_seconds_count{kind="weather"}'], 0)
+
+    def test_samples_belong_to_their_declared_family(self):
+        family = None
+        for line in metrics.render().splitlines():
+            if line.startswith('# TYPE '):
+                family, kind = line.split()[2:]
+                continue
+            if line.startswith('#'):
+                continue
+            name = re.split(r'[{ ]', line, maxsplit=1)[0]
+            suffixes = ('',) if kind == 'counter' else ('_bucket', '_sum', '_count')
+            with self.subTest(sample=name):
+                self.assertIn(name, [family + suffix for suffix in suffixes])
+
+    def test_totals_are_shared_through_the_cache(self):
+        metrics.ALERTS_TRIGGERED.inc()
+        metrics.flush()
+        # Another process reporting into the same cache.
+        cache.incr(metrics._cache_key('alerts_triggered_total'), 4)
+        self.assertEqual(self.samples()['alerts_triggered_total'], 5)
+
+    def test_recording_is_flushed_in_the_background(self):
+        key = metrics._cache_key('weather_upstream_request_seconds_count{kind="weather"}')
+        with mock.patch.object(metrics, 'FLUSH_INTERVAL', 0.05), mock.patch.object(metrics, '_flusher', None):
+            for _ in range(50):
+                metrics.UPSTREAM_LATENCY.observe(0.03, kind='weather')
+            # Recording leaves the cache alone; the flusher thread pushes the totals shortly after.
+            self.assertIsNone(cache.get(key))
+            deadline = time.monotonic() + 5
+            while cache.get(key) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(cache.get(key), 50)
+
+    def test_unknown_label_values_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, "Unknown label kind='radar'"):
+            metrics.UPSTREAM_ERRORS.inc(kind='radar')
+
+    @override_settings(ALERT_CRON_TOKEN='scrape-token')
+    def test_endpoint_requires_the_cron_token(self):
+        metrics.ALERTS_TRIGGERED.inc()
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(b'alerts_triggered_total 1\n', response.content)
+
+
+class WeatherApiTests(TestCase):
+    """The JSON API answers 401 to anonymous clients and 304 while a client's validators match."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('api', 'api@example.com', 'pw')
+        self.client.force_login(self.user)
+        self.observation = Observation.objects.create(
+            city='Manila', city_key='manila', country='PH', temperature_c=Decimal('31.50'), humidity=70,
+            wind_speed_kph=Decimal('11.16'), condition_id=800, condition_description='clear sky', icon_code='01d',
+            observed_at=datetime(2026, 10, 19, 9, 0, tzinfo=timezone.utc),
+        )
+        self.forecast = full_forecast(random.Random(3), 1_800_000_000)
+
+    def get(self, path: str, **headers):
+        return self.client.get(path, **{f'HTTP_{name.upper()}': value for name, value in headers.items()})
+
+    def use_forecast(self, fetched_at: float | None):
+        for target, value in (('fetch_forecast', (self.forecast, None)), ('forecast_fetched_at', fetched_at)):
+            patcher = mock.patch(f'core.views.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertNotModified(self, response, etag: str):
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_anonymous_requests_get_401(self):
+        self.client.logout()
+        for path in ('/api/weather/?city=Manila', '/api/forecast/?city=Manila', '/api/searches/', '/api/alerts/'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response.json(), {'error': 'Authentication required.'})
+
+    def test_weather_validators(self):
+        response = self.get('/api/weather/?city=Manila')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['temperature'], 31.5)
+        etag = response['ETag']
+        self.assertEqual(response['Last-Modified'], http_date(self.observation.observed_at.timestamp()))
+
+        self.assertNotModified(self.get('/api/weather/?city=Manila', if_none_match=etag), etag)
+        self.assertNotModified(self.get('/api/weather/?city=Manila', if_none_match=f'"other", {etag}'), etag)
+        self.assertNotModified(
+            self.get('/api/weather/?city=Manila', if_modified_since=response['Last-Modified']), etag,
+        )
+        earlier = http_date(self.observation.observed_at.timestamp() - 60)
+        self.assertEqual(self.get('/api/weather/?city=Manila', if_modified_since=earlier).status_code, 200)
+        # If-None-Match wins over If-Modified-Since.
+        self.assertEqual(self.get(
+            '/api/weather/?city=Manila', if_none_match='"other"', if_modified_since=response['Last-Modified'],
+        ).status_code, 200)
+
+    def test_weather_etag_follows_the_unit(self):
+        etag = self.get('/api/weather/?city=Manila')['ETag']
+        UserSetting.objects.update_or_create(user=self.user, defaults={'temperature_unit': 'imperial'})
+        response = self.get('/api/weather/?city=Manila', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unit_symbol'], 'F')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_forecast_validators_follow_the_fetch_time(self):
+        self.use_forecast(1_800_000_000.0)
+        response = self.get('/api/forecast/?city=Manila')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['city'], 'Manila')
+        self.assertEqual(response['Last-Modified'], http_date(1_800_000_000))
+        self.assertNotModified(self.get('/api/forecast/?city=Manila', if_none_match=response['ETag']), response['ETag'])
+        self.assertNotModified(
+            self.get('/api/forecast/?city=Manila', if_modified_since=response['Last-Modified']), response['ETag'],
+        )
+
+    def test_forecast_with_unknown_fetch_time_is_validated_by_content(self):
+        self.use_forecast(None)
+        first = self.get('/api/forecast/?city=Manila')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('Last-Modified', first)
+        second = self.get('/api/forecast/?city=Manila', if_none_match=first['ETag'])
+        self.assertNotModified(second, first['ETag'])
+
+        self.forecast['list'][0]['main']['temp'] += 1
+        changed = self.get('/api/forecast/?city=Manila', if_none_match=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_list_etags_change_with_their_rows(self):
+        for path, add in (
+            ('/api/searches/', lambda: WeatherSearch.objects.create(user=self.user, city='Manila')),
+            ('/api/alerts/', lambda: AlertPreference.objects.create(user=self.user, city='Manila')),
+        ):
+            with self.subTest(path=path):
+                etag = self.get(path)['ETag']
+                self.assertNotModified(self.get(path, if_none_match=etag), etag)
+                add()
+                response = self.get(path, if_none_match=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(next(iter(value for value in response.json().values() if isinstance(value, list)))), 1)
+
+
+PLAIN_STATIC_STORAGE = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def render_picture(arguments: str) -> str:
+    return Template('{% load images %}{% picture ' + arguments + ' %}').render(Context())
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGE, STATIC_URL='/static/')
+class PictureTagTests(SimpleTestCase):
+    INDEX = {
+        'img/drops glass rain.jpg': {'width': 1600, 'height': 900, 'variants': {
+            'image/avif': [['img/drops glass rain-480w.avif', 480], ['img/drops glass rain-1600w.avif', 1600]],
+            'image/webp': [['img/drops glass rain-480w.webp', 480], ['img/drops glass rain-1600w.webp', 1600]],
+            'image/jpeg': [['img/drops glass rain-480w.jpg', 480], ['img/drops glass rain-1600w.jpg', 1600]],
+        }},
+        'img/sky.png': {'width': 800, 'height': 400, 'variants': {
+            'image/webp': [['img/sky-480w.webp', 480], ['img/sky-800w.webp', 800]],
+        }},
+    }
+
+    def use_index(self, index: dict):
+        patcher = mock.patch('core.templatetags.images.load_index', return_value=index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_image_without_variants_is_a_plain_img(self):
+        self.use_index({})
+        self.assertHTMLEqual(
+            render_picture("'img/drops glass rain.jpg' alt='Rain & drops' css_class='backdrop'"),
+            '<img src="/static/img/drops%20glass%20rain.jpg" alt="Rain &amp; drops" class="backdrop" '
+            'loading="lazy" decoding="async" fetchpriority="auto">',
+        )
+
+    def test_variants_become_sources_in_index_order(self):
+        self.use_index(self.INDEX)
+        self.assertHTMLEqual(
+            render_picture("'img/drops glass rain.jpg' sizes='50vw' loading='eager' fetchpriority='high'"),
+            '<picture>'
+            '<source type="image/avif" sizes="50vw" srcset="/static/img/drops%20glass%20rain-480w.avif 480w, '
+            '/static/img/drops%20glass%20rain-1600w.avif 1600w">'
+            '<source type="image/webp" sizes="50vw" srcset="/static/img/drops%20glass%20rain-480w.webp 480w, '
+            '/static/img/drops%20glass%20rain-1600w.webp 1600w">'
+            '<img src="/static/img/drops%20glass%20rain-1600w.jpg" srcset="/static/img/drops%20glass%20rain-480w.jpg '
+            '480w, /static/img/drops%20glass%20rain-1600w.jpg 1600w" sizes="50vw" width="1600" height="900" alt="" '
+            'class="" loading="eager" decoding="async" fetchpriority="high">'
+            '</picture>',
+        )
+
+    def test_first_format_stands_in_for_a_missing_jpeg(self):
+        self.use_index(self.INDEX)
+        html = render_picture("'img/sky.png'")
+        self.assertNotIn('<source', html)
+        self.assertIn('<img src="/static/img/sky-800w.webp" srcset="/static/img/sky-480w.webp 480w, '
+                      '/static/img/sky-800w.webp 800w"', html)
+
+    def test_index_is_empty_without_collectstatic_output(self):
+        images.load_index.cache_clear()
+        self.addCleanup(images.load_index.cache_clear)
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            self.assertEqual(images.load_index(), {})
+            images.load_index.cache_clear()
+            with open(os.path.join(root, images.INDEX_NAME), 'w') as handle:
+                handle.write('{not json')
+            self.assertEqual(images.load_index(), {})
+
+
+class ImageVariantTests(SimpleTestCase):
+    @override_settings(IMAGE_VARIANT_WIDTHS=(480, 960, 1440))
+    def test_variant_widths_stop_at_the_original(self):
+        self.assertEqual(images.variant_widths(1000), [480, 960, 1000])
+        self.assertEqual(images.variant_widths(300), [300])
+        self.assertEqual(images.variant_widths(1440), [480, 960, 1440])
+        self.assertEqual(images.variant_name('img/a b.jpeg', 480, '.avif'), 'img/a b-480w.avif')
+
+    def test_svg_minification(self):
+        self.assertEqual(
+            images.minify_svg('<!-- logo -->\n<svg  viewBox="0 0 1 1">\n  <path d="M0 0"/>\n</svg>\n'),
+            '<svg viewBox="0 0 1 1"><path d="M0 0"/></svg>',
+        )
+
+    @override_settings(IMAGE_VARIANT_WIDTHS=(480,), STATIC_URL='/static/')
+    def test_collectstatic_builds_hashed_variants_and_the_index(self):
+        from PIL import Image
+
+        source = tempfile.TemporaryDirectory()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        os.mkdir(os.path.join(source.name, 'img'))
+        Image.new('RGB', (600, 300), (30, 90, 160)).save(os.path.join(source.name, 'img', 'sky.png'))
+        with open(os.path.join(source.name, 'img', 'logo.svg'), 'w') as handle:
+            handle.write('<!-- logo -->\n<svg>\n  <g/>\n</svg>\n')
+
+        images.load_index.cache_clear()
+        self.addCleanup(images.load_index.cache_clear)
+        with override_settings(STATICFILES_DIRS=[source.name], STATIC_ROOT=root.name, STORAGES={
+            **PLAIN_STATIC_STORAGE, 'staticfiles': {'BACKEND': 'core.storage.OptimizedStaticFilesStorage'},
+        }):
+            call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+            entry = images.load_index()['img/sky.png']
+            html = render_picture("'img/sky.png'")
+
+        self.assertEqual((entry['width'], entry['height']), (600, 300))
+        self.assertEqual(entry['variants']['image/jpeg'], [['img/sky-480w.jpg', 480], ['img/sky-600w.jpg', 600]])
+        self.assertRegex(html, r'<img src="/static/img/sky-600w\.[0-9a-f]{12}\.jpg" srcset="/static/img/sky-480w\.[0-9a-f]{12}\.jpg 480w')
+        with open(os.path.join(root.name, 'img', 'logo.svg')) as handle:
+            self.assertEqual(handle.read(), '<svg><g/></svg>')
+
+
+class ReplicaAliasTests(SimpleTestCase):
+    def test_primary_is_used_when_no_replica_is_configured(self):
+        self.assertNotIn(db.REPLICA_DB_ALIAS, settings.DATABASES)
+        with mock.patch('core.db.query_replica_lag') as query:
+            self.assertEqual(db.replica_alias(), 'default')
+        query.assert_not_called()
+
+    def test_read_alias_defaults_to_the_primary(self):
+        self.assertEqual(db.read_alias(), 'default')
+        self.assertIsNone(db.ReplicaRouter().db_for_read(User))
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """ReplicaRouter against a second `replica` alias.
+
+    The alias points at the test database, as a TEST MIRROR of the primary
+    would, so rows committed on the primary can be read back through it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added once the test databases exist, so the alias shares the
+        # primary's test database rather than getting one of its own.
+        # settings.DATABASES is the dict django.db.connections reads aliases from.
+        replica_settings = mock.patch.dict(
+            settings.DATABASES, {db.REPLICA_DB_ALIAS: {**settings.DATABASES['default']}},
+        )
+        replica_settings.start()
+        cls.addClassCleanup(replica_settings.stop)
+        cls.addClassCleanup(cls.drop_replica_connection)
+
+    @classmethod
+    def drop_replica_connection(cls):
+        if hasattr(connections._connections, db.REPLICA_DB_ALIAS):
+            del connections[db.REPLICA_DB_ALIAS]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('reader', password='pw')
+
+    def run_view(self, view):
+        return db.use_replica(view)(RequestFactory().get('/'))
+
+    def read_usernames(self, request):
+        return list(User.objects.values_list('username', flat=True))
+
+    def test_reads_go_to_the_replica_when_it_is_caught_up(self):
+        with mock.patch('core.db.query_replica_lag', return_value=5.0), \
+                CaptureQueriesContext(connections['replica']) as replica_queries, \
+                CaptureQueriesContext(connections['default']) as primary_queries:
+            self.assertEqual(self.run_view(self.read_usernames), ['reader'])
+        self.assertEqual(len(replica_queries), 1)
+        self.assertEqual(len(primary_queries), 0)
+
+    def test_reads_outside_use_replica_stay_on_the_primary(self):
+        with mock.patch('core.db.query_replica_lag', return_value=0.0) as query:
+            self.assertEqual(User.objects.all().db, 'default')
+        query.assert_not_called()
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=30)
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        with mock.patch('core.db.query_replica_lag', return_value=45.0), \
+                CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.assertEqual(self.run_view(lambda request: User.objects.all().db), 'default')
+            self.assertEqual(self.run_view(self.read_usernames), ['reader'])
+        self.assertEqual(len(replica_queries), 0)
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=30)
+    def test_lag_at_the_threshold_still_uses_the_replica(self):
+        with mock.patch('core.db.query_replica_lag', return_value=30.0):
+            self.assertEqual(self.run_view(lambda request: User.objects.all().db), 'replica')
+
+    def test_unknown_lag_falls_back_to_the_primary(self):
+        with mock.patch('core.db.query_replica_lag', return_value=None):
+            self.assertEqual(self.run_view(lambda request: User.objects.all().db), 'default')
+
+    def test_unreachable_replica_falls_back_and_is_not_retried_until_the_interval(self):
+        failure = OperationalError('could not connect to server')
+        with mock.patch('core.db.query_replica_lag', side_effect=failure) as query:
+            with self.assertLogs('core.db', 'WARNING'):
+                self.assertEqual(self.run_view(lambda request: User.objects.all().db), 'default')
+            self.assertEqual(self.run_view(lambda request: User.objects.all().db), 'default')
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(cache.get(db.LAG_CACHE_KEY), db.UNREACHABLE)
+
+        cache.delete(db.LAG_CACHE_KEY)
+        with mock.patch('core.db.query_replica_lag', return_value=1.0):
+            self.assertEqual(self.run_view(lambda request: User.objects.all().db), 'replica')
+
+    def test_lag_is_checked_once_per_interval(self):
+        with mock.patch('core.db.query_replica_lag', return_value=2.0) as query:
+            for _ in range(3):
+                self.run_view(self.read_usernames)
+        self.assertEqual(query.call_count, 1)
+
+    def test_writes_go_to_the_primary_inside_use_replica(self):
+        def write(request):
+            user = User.objects.get(username='reader')
+            self.assertEqual(user._state.db, 'replica')
+            user.first_name = 'Edited'
+            user.save()
+            UserSetting.objects.create(user=user)
+            return user
+
+        with mock.patch('core.db.query_replica_lag', return_value=0.0), \
+                CaptureQueriesContext(connections['replica']) as replica_queries, \
+                CaptureQueriesContext(connections['default']) as primary_queries:
+            user = self.run_view(write)
+        self.assertEqual(user._state.db, 'default')
+        self.assertTrue(all(query['sql'].lstrip().upper().startswith('SELECT') for query in replica_queries))
+        self.assertTrue(any(query['sql'].lstrip().upper().startswith('UPDATE') for query in primary_queries))
+        self.assertTrue(any(query['sql'].lstrip().upper().startswith('INSERT') for query in primary_queries))
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, 'Edited')
+
+    def test_router_never_writes_or_migrates_on_the_replica(self):
+        router = db.ReplicaRouter()
+        token = db._read_alias.set('replica')
+        try:
+            self.assertEqual(router.db_for_read(User), 'replica')
+            self.assertEqual(router.db_for_write(User, instance=self.user), 'default')
+        finally:
+            db._read_alias.reset(token)
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+        self.assertIsNone(router.allow_migrate('default', 'core'))
@@ -27,6 +27,14 @@ urlpatterns = [
     path('alerts/<int:alert_id>/toggle/', views.toggle_alert, name='toggle_alert'),
     path('alerts/<int:alert_id>/delete/', views.delete_alert, name='delete_alert'),
     path('alerts/run/', views.run_alerts, name='run_alerts'),
+    path('metrics/', views.metrics_view, name='metrics'),
+
+    # JSON API (conditional GET: ETag / Last-Modified)
+    path('api/weather/', views.api_weather, name='api_weather'),
+    path('api/forecast/', views.api_forecast, name='api_forecast'),
+    path('api/searches/', views.api_searches, name='api_searches'),
+    path('api/alerts/', views.api_alerts, name='api_alerts'),
+    path('live/', views.live_updates, name='live_updates'),
 
     # USER SAVED LOCATIONS
     path('locations/', views.saved_locations, name='saved_locations'),
@@ -1,73 +1,496 @@
 from __future__ import annotations
 from datetime import datetime, timezone, timedelta
-import requests
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
 import os
+import weakref
+from functools import wraps
+
+from asgiref.sync import sync_to_async
 
 from django.conf import settings as django_settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
-from django.db.models import Count
-from django.db.models.functions import TruncDate
+from django.db import OperationalError
+from django.core import signing
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone as dj_timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, urlencode
 from django.core.cache import cache
 import io
 
-from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_POST
+from django.template.response import TemplateResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.core.management import call_command
 
+from . import live, metrics, profiling, providers, weather_cache
+from .db import read_alias, statement_timeout, use_replica
+from .deletion import run_in_background, start_deletion
+from .fragments import afragment_context, bump_user_version, fragment_context
+from .signals import observation_stored
+from .alert_engine import is_severe_condition
 from .forms import AlertPreferenceForm, RegisterForm, UserEditForm, WeatherSearchForm
-from .models import AlertPreference, WeatherSearch, AlertHistory, SavedLocation, UserSetting
+from .models import AlertPreference, WeatherSearch, AlertHistory, DeletionJob, Observation, SavedLocation, UserSetting
+
+logger = logging.getLogger(__name__)
 
 # --- Helper Functions (Weather API) ---
 
-def fetch_weather(city: str) -> tuple[dict | None, str | None]:
-    """Fetches current weather with caching logic."""
-    api_key = django_settings.OPENWEATHERMAP_API_KEY
-    if not api_key:
-        return None, "API Key is missing in settings."
 
+def weather_cache_key(kind: str, city: str) -> str:
+    """Cache key for a `weather` or `forecast` payload of a city query."""
     # Sanitize cache key to avoid memcached issues with special characters
-    import re
     safe_city = re.sub(r'[^a-zA-Z0-9_-]', '_', city.lower().strip())
-    cache_key = f"weather_{safe_city}"
-    cached_data = cache.get(cache_key)
+    return f"{kind}_{safe_city}"
+
+
+def cache_weather_payload(cache_key: str, data: dict, ttl: int) -> None:
+    """Cache a payload together with its expiry time so warmers can refresh it early."""
+    weather_cache.set(cache_key, data, ttl)
+
+
+def one_call_enabled() -> bool:
+    """Whether current weather and forecasts come from one combined `onecall` fetch."""
+    return django_settings.WEATHER_ONE_CALL and 'onecall' in providers.primary().kinds
+
+
+def fetch_one_call(city: str, refresh: bool = False) -> tuple[dict | None, str | None]:
+    """Current, hourly and daily weather for a city in one request, cached as one unit.
+
+    The current conditions are stored as an Observation like `fetch_weather` does.
+    """
+    cache_key = weather_cache_key('onecall', city)
+    cached_data = None if refresh else weather_cache.get(cache_key)
+    if cached_data:
+        metrics.CACHE_REQUESTS.inc(kind='onecall', result='hit')
+        return cached_data, None
+    metrics.CACHE_REQUESTS.inc(kind='onecall', result='miss')
+
+    try:
+        with metrics.UPSTREAM_LATENCY.time(kind='onecall'), profiling.track_upstream():
+            status, data = providers.fetch('onecall', city)
+        if status == 200:
+            cache_weather_payload(cache_key, data, django_settings.WEATHER_CACHE_TTL)
+            store_observation(providers.one_call_current(data), touch=True, query=city)
+            return data, None
+        metrics.UPSTREAM_ERRORS.inc(kind='onecall')
+        if status == 404:
+            return None, f"City '{city}' not found."
+        return None, "Weather service error."
+    except providers.ProviderError:
+        metrics.UPSTREAM_ERRORS.inc(kind='onecall')
+        return None, "Network error."
+
+
+def fetch_weather(city: str, refresh: bool = False) -> tuple[dict | None, str | None]:
+    """Fetches current weather with caching logic.
+
+    ``refresh`` skips the cache lookup and always calls the API.
+    """
+    configuration_error = providers.primary().configuration_error()
+    if configuration_error:
+        return None, configuration_error
+    if one_call_enabled():
+        data, error = fetch_one_call(city, refresh)
+        return (providers.one_call_current(data) if data else None), error
+
+    cache_key = weather_cache_key('weather', city)
+    cached_data = None if refresh else weather_cache.get(cache_key)
+    if cached_data:
+        metrics.CACHE_REQUESTS.inc(kind='weather', result='hit')
+        return cached_data, None
+    metrics.CACHE_REQUESTS.inc(kind='weather', result='miss')
+
+    try:
+        with metrics.UPSTREAM_LATENCY.time(kind='weather'), profiling.track_upstream():
+            status, data = providers.fetch('weather', city)
+        if status == 200:
+            cache_weather_payload(cache_key, data, django_settings.WEATHER_CACHE_TTL)
+            store_observation(data, touch=True, query=city)
+            return data, None
+        metrics.UPSTREAM_ERRORS.inc(kind='weather')
+        if status == 404:
+            return None, f"City '{city}' not found."
+        return None, "Weather service error."
+    except providers.ProviderError:
+        metrics.UPSTREAM_ERRORS.inc(kind='weather')
+        return None, "Network error."
+
+
+def observation_key(city: str) -> tuple[str, str]:
+    """Split a 'City' or 'City,CC' query into the (city_key, country) lookup pair."""
+    name, _, country = city.partition(',')
+    return name.strip().lower(), country.strip()
+
+
+def observation_query_key(city: str) -> str:
+    """Normalized form of a city query, as kept in `Observation.query_key`."""
+    return ','.join(part.strip() for part in city.lower().split(','))[:120]
+
+
+def query_matches_name(city: str, lookup: dict) -> bool:
+    """Whether a query finds an observation by its stored name and country alone."""
+    city_key, country = observation_key(city)
+    return city_key == lookup['city_key'] and (not country or country.lower() == lookup['country'].lower())
+
+
+def observation_fields(payload: dict) -> tuple[dict, dict]:
+    """Split an OWM current-weather payload into Observation (lookup, defaults)."""
+    weather = (payload.get('weather') or [{}])[0]
+    main = payload.get('main', {})
+    wind = payload.get('wind', {})
+    coord = payload.get('coord', {})
+    city = payload.get('name', '')
+    dt = payload.get('dt')
+    observed_at = datetime.fromtimestamp(dt, tz=timezone.utc) if dt else dj_timezone.now()
+
+    defaults = {
+        'city': city,
+        'latitude': coord.get('lat'),
+        'longitude': coord.get('lon'),
+        'temperature_c': main.get('temp'),
+        'feels_like_c': main.get('feels_like'),
+        'humidity': main.get('humidity'),
+        'pressure_hpa': main.get('pressure'),
+        'wind_speed_kph': round(wind.get('speed', 0) * 3.6, 2),
+        'condition_id': weather.get('id'),
+        'condition_main': weather.get('main', ''),
+        'condition_description': weather.get('description', ''),
+        'icon_code': weather.get('icon', ''),
+    }
+    lookup = {
+        'city_key': city.strip().lower(),
+        'country': payload.get('sys', {}).get('country', ''),
+        'observed_at': observed_at,
+    }
+    return lookup, defaults
+
+
+def store_observation(payload: dict, touch: bool = False, query: str = '') -> Observation:
+    """Persist an OWM current-weather payload as one row per city per `dt`.
+
+    ``touch`` bumps ``fetched_at`` on an existing row; only pass it for payloads
+    that just came off the network, never for ones replayed from the cache.
+    ``query`` is the city query the payload was fetched for; it is recorded on
+    the row when the payload's name and country would not find it again.
+    """
+    lookup, defaults = observation_fields(payload)
+    if query and not query_matches_name(query, lookup):
+        defaults['query_key'] = observation_query_key(query)
+    if touch:
+        defaults['fetched_at'] = dj_timezone.now()
+        observation, created = Observation.objects.update_or_create(**lookup, defaults=defaults)
+    else:
+        observation, created = Observation.objects.get_or_create(**lookup, defaults=defaults)
+        if not created and defaults.get('query_key', observation.query_key) != observation.query_key:
+            observation.query_key = defaults['query_key']
+            observation.save(update_fields=['query_key'])
+    if created:
+        observation_stored.send(sender=Observation, observation=observation)
+    return observation
+
+
+def fresh_observations(city: str, max_age: int | None = None):
+    """Stored observations for a city fetched within ``max_age`` seconds, newest first.
+
+    Rows match on their stored name and country, or on the query that fetched them.
+    """
+    if max_age is None:
+        max_age = django_settings.OBSERVATION_MAX_AGE
+    city_key, country = observation_key(city)
+    by_name = Q(city_key=city_key)
+    if country:
+        by_name &= Q(country__iexact=country)
+    observations = Observation.objects.filter(
+        by_name | Q(query_key=observation_query_key(city)),
+        fetched_at__gte=dj_timezone.now() - timedelta(seconds=max_age),
+    )
+    return observations.order_by('-observed_at')
+
+
+def get_latest_observation(city: str, max_age: int | None = None) -> Observation | None:
+    """Return the newest stored observation for a city if it was fetched recently enough."""
+    return fresh_observations(city, max_age).first()
+
+
+def fetch_observation(city: str) -> tuple[Observation | None, str | None]:
+    """Current weather for a city, shared by the dashboard, saved locations and alerts.
+
+    Reads the latest stored observation when it is fresh enough and only falls
+    back to the weather API otherwise.
+    """
+    observation = get_latest_observation(city)
+    if observation:
+        metrics.CACHE_REQUESTS.inc(kind='observation', result='hit')
+        return observation, None
+    metrics.CACHE_REQUESTS.inc(kind='observation', result='miss')
+    payload, error = fetch_weather(city)
+    if not payload:
+        return None, error
+    return store_observation(payload, query=city), None
+
+
+def observation_weather_data(observation: Observation, unit: str) -> dict:
+    """Map an observation to the `weather_data` dict used by the dashboard template."""
+    return {
+        'city': observation.city,
+        'temperature': convert_temperature(observation.temperature_c, unit),
+        'description': observation.condition_description,
+        'icon': observation.icon_code,
+        'humidity': observation.humidity,
+        'wind_speed': observation.wind_speed_kph,
+        'feels_like': convert_temperature(observation.feels_like_c, unit),
+    }
+
+
+def fetch_forecast(city: str, refresh: bool = False) -> tuple[dict | None, str | None]:
+    """Fetches 5-day forecast.
+
+    ``refresh`` skips the cache lookup and always calls the API.
+    """
+    configuration_error = providers.primary().configuration_error()
+    if configuration_error:
+        return None, configuration_error
+    if one_call_enabled():
+        data, error = fetch_one_call(city, refresh)
+        return (providers.one_call_forecast(data) if data else None), error
+
+    cache_key = weather_cache_key('forecast', city)
+    cached_data = None if refresh else weather_cache.get(cache_key)
+    if cached_data:
+        metrics.CACHE_REQUESTS.inc(kind='forecast', result='hit')
+        return cached_data, None
+    metrics.CACHE_REQUESTS.inc(kind='forecast', result='miss')
+
+    try:
+        with metrics.UPSTREAM_LATENCY.time(kind='forecast'), profiling.track_upstream():
+            status, data = providers.fetch('forecast', city)
+        if status == 200:
+            cache_weather_payload(cache_key, data, django_settings.FORECAST_CACHE_TTL)
+            return data, None
+        metrics.UPSTREAM_ERRORS.inc(kind='forecast')
+        return None, "Forecast unavailable."
+    except providers.ProviderError:
+        metrics.UPSTREAM_ERRORS.inc(kind='forecast')
+        return None, "Network error."
+
+
+def parse_forecast_series(forecast: dict) -> list[dict]:
+    """Trim an OWM forecast payload to the per-slot fields used for alerting."""
+    series: list[dict] = []
+    for entry in forecast.get('list', []):
+        if not entry.get('dt'):
+            continue
+        weather = (entry.get('weather') or [{}])[0]
+        main = entry.get('main', {})
+        wind_speed = entry.get('wind', {}).get('speed')
+        series.append({
+            'dt': entry['dt'],
+            'temp': main.get('temp'),
+            'humidity': main.get('humidity'),
+            'wind_speed_kph': round(wind_speed * 3.6, 2) if wind_speed is not None else None,
+            'condition_id': weather.get('id'),
+            'description': weather.get('description', ''),
+        })
+    return series
+
+
+def get_forecast_series(city: str) -> tuple[list[dict] | None, str | None]:
+    """Parsed forecast series for a city, cached until the next forecast issuance.
+
+    OWM issues a new 3-hourly forecast once its first slot has passed, so the
+    parsed series stays valid until then.
+    """
+    cache_key = weather_cache_key('forecast_series', city)
+    series = cache.get(cache_key)
+    if series is not None:
+        metrics.CACHE_REQUESTS.inc(kind='forecast_series', result='hit')
+        return series, None
+    metrics.CACHE_REQUESTS.inc(kind='forecast_series', result='miss')
+
+    forecast, error = fetch_forecast(city)
+    if not forecast:
+        return None, error
+    series = parse_forecast_series(forecast)
+    next_issue = series[0]['dt'] if series else 0
+    ttl = min(max(int(next_issue - time.time()), 60), django_settings.FORECAST_CACHE_TTL)
+    cache.set(cache_key, series, ttl)
+    return series, None
+
+
+def forecast_fetched_at(city: str) -> float | None:
+    """When the cached forecast of a city was fetched (its expiry changes on every refetch)."""
+    if one_call_enabled():
+        expires = weather_cache.expires_at(weather_cache_key('onecall', city))
+        return expires - django_settings.WEATHER_CACHE_TTL if expires else None
+    expires = weather_cache.expires_at(weather_cache_key('forecast', city))
+    return expires - django_settings.FORECAST_CACHE_TTL if expires else None
+
+# --- Async Helper Functions (Weather API) ---
+# Mirror fetch_weather/fetch_forecast/fetch_observation for async views: same
+# cache keys, observation store and metrics, but non-blocking HTTP via httpx and
+# the async ORM, so one ASGI worker can hold many upstream calls in flight.
+
+# In-flight `onecall` fetches per event loop, so the dashboard's concurrent
+# current weather and forecast lookups share one upstream request.
+_one_call_fetches: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def afetch_one_call(city: str, refresh: bool = False) -> tuple[dict | None, str | None]:
+    """Async version of `fetch_one_call`; concurrent calls for a city share one request."""
+    cache_key = weather_cache_key('onecall', city)
+    cached_data = None if refresh else await weather_cache.aget(cache_key)
     if cached_data:
+        metrics.CACHE_REQUESTS.inc(kind='onecall', result='hit')
         return cached_data, None
 
-    url = 'https://api.openweathermap.org/data/2.5/weather'
-    params = {'q': city, 'appid': api_key, 'units': 'metric'}
+    in_flight = _one_call_fetches.setdefault(asyncio.get_running_loop(), {})
+    task = in_flight.get(cache_key)
+    if task is None:
+        metrics.CACHE_REQUESTS.inc(kind='onecall', result='miss')
+        task = in_flight[cache_key] = asyncio.ensure_future(_afetch_one_call(city, cache_key))
+        task.add_done_callback(lambda _task: in_flight.pop(cache_key, None))
+    return await asyncio.shield(task)
+
+
+async def _afetch_one_call(city: str, cache_key: str) -> tuple[dict | None, str | None]:
+    try:
+        with metrics.UPSTREAM_LATENCY.time(kind='onecall'), profiling.track_upstream():
+            status, data = await providers.afetch('onecall', city)
+        if status == 200:
+            await weather_cache.aset(cache_key, data, django_settings.WEATHER_CACHE_TTL)
+            await astore_observation(providers.one_call_current(data), touch=True, query=city)
+            return data, None
+        metrics.UPSTREAM_ERRORS.inc(kind='onecall')
+        if status == 404:
+            return None, f"City '{city}' not found."
+        return None, "Weather service error."
+    except providers.ProviderError:
+        metrics.UPSTREAM_ERRORS.inc(kind='onecall')
+        return None, "Network error."
+
+
+async def afetch_weather(city: str, refresh: bool = False) -> tuple[dict | None, str | None]:
+    """Async version of `fetch_weather`."""
+    configuration_error = providers.primary().configuration_error()
+    if configuration_error:
+        return None, configuration_error
+    if one_call_enabled():
+        data, error = await afetch_one_call(city, refresh)
+        return (providers.one_call_current(data) if data else None), error
+
+    cache_key = weather_cache_key('weather', city)
+    cached_data = None if refresh else await weather_cache.aget(cache_key)
+    if cached_data:
+        metrics.CACHE_REQUESTS.inc(kind='weather', result='hit')
+        return cached_data, None
+    metrics.CACHE_REQUESTS.inc(kind='weather', result='miss')
 
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            cache.set(cache_key, data, 600)
+        with metrics.UPSTREAM_LATENCY.time(kind='weather'), profiling.track_upstream():
+            status, data = await providers.afetch('weather', city)
+        if status == 200:
+            await weather_cache.aset(cache_key, data, django_settings.WEATHER_CACHE_TTL)
+            await astore_observation(data, touch=True, query=city)
             return data, None
-        elif response.status_code == 404:
+        metrics.UPSTREAM_ERRORS.inc(kind='weather')
+        if status == 404:
             return None, f"City '{city}' not found."
         return None, "Weather service error."
-    except requests.RequestException:
+    except providers.ProviderError:
+        metrics.UPSTREAM_ERRORS.inc(kind='weather')
         return None, "Network error."
 
-def fetch_forecast(city: str) -> tuple[dict | None, str | None]:
-    """Fetches 5-day forecast."""
-    api_key = django_settings.OPENWEATHERMAP_API_KEY
-    url = 'https://api.openweathermap.org/data/2.5/forecast'
-    params = {'q': city, 'appid': api_key, 'units': 'metric'}
+
+async def afetch_forecast(city: str, refresh: bool = False) -> tuple[dict | None, str | None]:
+    """Async version of `fetch_forecast`."""
+    configuration_error = providers.primary().configuration_error()
+    if configuration_error:
+        return None, configuration_error
+    if one_call_enabled():
+        data, error = await afetch_one_call(city, refresh)
+        return (providers.one_call_forecast(data) if data else None), error
+
+    cache_key = weather_cache_key('forecast', city)
+    cached_data = None if refresh else await weather_cache.aget(cache_key)
+    if cached_data:
+        metrics.CACHE_REQUESTS.inc(kind='forecast', result='hit')
+        return cached_data, None
+    metrics.CACHE_REQUESTS.inc(kind='forecast', result='miss')
+
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            return response.json(), None
+        with metrics.UPSTREAM_LATENCY.time(kind='forecast'), profiling.track_upstream():
+            status, data = await providers.afetch('forecast', city)
+        if status == 200:
+            await weather_cache.aset(cache_key, data, django_settings.FORECAST_CACHE_TTL)
+            return data, None
+        metrics.UPSTREAM_ERRORS.inc(kind='forecast')
         return None, "Forecast unavailable."
-    except requests.RequestException:
+    except providers.ProviderError:
+        metrics.UPSTREAM_ERRORS.inc(kind='forecast')
         return None, "Network error."
 
+
+async def astore_observation(payload: dict, touch: bool = False, query: str = '') -> Observation:
+    """Async version of `store_observation`."""
+    lookup, defaults = observation_fields(payload)
+    if query and not query_matches_name(query, lookup):
+        defaults['query_key'] = observation_query_key(query)
+    if touch:
+        defaults['fetched_at'] = dj_timezone.now()
+        observation, created = await Observation.objects.aupdate_or_create(**lookup, defaults=defaults)
+    else:
+        observation, created = await Observation.objects.aget_or_create(**lookup, defaults=defaults)
+        if not created and defaults.get('query_key', observation.query_key) != observation.query_key:
+            observation.query_key = defaults['query_key']
+            await observation.asave(update_fields=['query_key'])
+    if created:
+        # Receivers may query the database (the alert index), so keep them off the event loop.
+        await sync_to_async(observation_stored.send)(sender=Observation, observation=observation)
+    return observation
+
+
+async def afetch_observation(city: str) -> tuple[Observation | None, str | None]:
+    """Async version of `fetch_observation`."""
+    observation = await fresh_observations(city).afirst()
+    if observation:
+        metrics.CACHE_REQUESTS.inc(kind='observation', result='hit')
+        return observation, None
+    metrics.CACHE_REQUESTS.inc(kind='observation', result='miss')
+    payload, error = await afetch_weather(city)
+    if not payload:
+        return None, error
+    return await astore_observation(payload, query=city), None
+
+
+async def apoll_observation(city: str) -> Observation | None:
+    """Newest fresh observation for a live feed, refreshing the store when it is stale.
+
+    A cache lock lets one process per poll interval refresh a city; the other
+    workers pick the new row up from the store on their next poll.
+    """
+    observation = await fresh_observations(city).afirst()
+    if observation:
+        return observation
+    lock_key = f"live_refresh_{weather_cache_key('weather', city)}"
+    if await cache.aadd(lock_key, 1, django_settings.LIVE_POLL_INTERVAL):
+        observation, _ = await afetch_observation(city)
+    return observation
+
+
 def convert_temperature(temp_c: float | int | None, unit: str) -> float | None:
     if temp_c is None:
         return None
@@ -75,6 +498,7 @@ def convert_temperature(temp_c: float | int | None, unit: str) -> float | None:
         return round((float(temp_c) * 9 / 5) + 32, 1)
     return round(float(temp_c), 1)
 
+
 def build_five_day_forecast(
     forecast: dict | None,
     unit: str = 'metric',
@@ -134,75 +558,130 @@ def build_five_day_forecast(
 
     return results
 
+
+def most_searched_cities(limit: int):
+    """Cities ranked by how often they were searched, as `{'city', 'total'}` rows."""
+    return WeatherSearch.objects.values('city').annotate(
+        total=Count('city')
+    ).order_by('-total')[:limit]
+
 # --- Helper Functions for Alerts ---
 
-def alert_should_trigger(alert: AlertPreference, temp: float | None, condition_desc: str) -> tuple[bool, str]:
-    """Check if an alert should trigger based on temperature threshold or severe conditions."""
+
+def alert_should_trigger(
+    alert: AlertPreference,
+    temp: float | None,
+    condition_desc: str,
+    humidity: float | None = None,
+    wind_speed: float | None = None,
+    condition_id: int | None = None,
+) -> tuple[bool, str]:
+    """Check if a single alert should trigger; see `core.alert_engine` for batches."""
     if not alert.is_active:
         return False, "Alert is inactive"
 
     reasons: list[str] = []
 
-    # Temperature threshold trigger (assumes metric/Celsius input)
-    if alert.temperature_threshold is not None:
-        if temp is None:
-            return False, "Temperature data unavailable"
-        if float(temp) >= float(alert.temperature_threshold):
+    # Temperature threshold triggers (assumes metric/Celsius input). A missing
+    # reading skips only its own rules, as in `LocationRules.evaluate_readings`.
+    if temp is not None:
+        if alert.temperature_threshold is not None and float(temp) >= float(alert.temperature_threshold):
             reasons.append(f"Temperature {temp}C reached threshold {alert.temperature_threshold}C")
+        if alert.low_temperature_threshold is not None and float(temp) <= float(alert.low_temperature_threshold):
+            reasons.append(f"Temperature {temp}C dropped to threshold {alert.low_temperature_threshold}C")
+
+    if alert.humidity_threshold is not None and humidity is not None:
+        if float(humidity) >= float(alert.humidity_threshold):
+            reasons.append(f"Humidity {humidity}% reached threshold {alert.humidity_threshold}%")
+
+    if alert.wind_speed_threshold is not None and wind_speed is not None:
+        if float(wind_speed) >= float(alert.wind_speed_threshold):
+            reasons.append(f"Wind speed {wind_speed} km/h reached threshold {alert.wind_speed_threshold} km/h")
 
     # Severe weather conditions trigger
-    if alert.condition_alerts and condition_desc:
-        severe_conditions = [
-            'thunderstorm',
-            'snow',
-            'mist',
-            'fog',
-            'haze',
-            'dust',
-            'sand',
-            'ash',
-            'squall',
-            'tornado',
-        ]
-        if any(cond in condition_desc.lower() for cond in severe_conditions):
-            reasons.append(f"Severe weather condition: {condition_desc}")
+    if alert.condition_alerts and is_severe_condition(condition_id, condition_desc):
+        reasons.append(f"Severe weather condition: {condition_desc}")
 
     if reasons:
         return True, " | ".join(reasons)
 
     return False, "No alert conditions met"
 
-def send_alert_email(user, city: str, temp: float, condition: str) -> tuple[bool, str]:
+
+def send_alert_email(user, city: str, temp: float, condition: str, reason: str = "") -> tuple[bool, str]:
     """Send alert email to user."""
     try:
         subject = f"Weather Alert for {city}"
-        message = "\n".join([
+        lines = [
             "Weather Alert Triggered!",
             "",
             f"Location: {city}",
             f"Temperature: {temp}C",
             f"Condition: {condition}",
+        ]
+        if reason:
+            lines.append(f"Reason: {reason}")
+        message = "\n".join(lines + [
             "",
             "This is an automated alert from Weather Forecast.",
         ])
-        send_mail(
-            subject,
-            message,
-            django_settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
+        with metrics.ALERT_EMAIL_LATENCY.time():
+            send_mail(
+                subject,
+                message,
+                django_settings.DEFAULT_FROM_EMAIL,
+                [user.email],
+                fail_silently=False,
+            )
+        metrics.ALERT_EMAILS.inc(outcome='sent')
         return True, "Email sent successfully"
     except Exception as e:
+        metrics.ALERT_EMAILS.inc(outcome='failed')
+        return False, f"Failed to send email: {str(e)}"
+
+
+def send_alert_digest_email(user, entries: list[AlertHistory]) -> tuple[bool, str]:
+    """Send one email summarizing several alert triggers (AlertHistory rows with their alert)."""
+    try:
+        cities = list(dict.fromkeys(entry.alert.city.strip() for entry in entries))
+        shown = ", ".join(cities[:3]) + (f" and {len(cities) - 3} more" if len(cities) > 3 else "")
+        subject = f"Weather Alerts: {len(entries)} triggered for {shown}"
+        lines = [f"{len(entries)} weather alert(s) triggered:", ""]
+        for entry in entries:
+            lines.append(f"{dj_timezone.localtime(entry.triggered_at):%b %d %H:%M} - {entry.alert.city.strip()}")
+            lines.append(f"  Temperature: {entry.temperature}C")
+            if entry.condition:
+                lines.append(f"  Condition: {entry.condition}")
+            if entry.reason:
+                lines.append(f"  Reason: {entry.reason}")
+            lines.append("")
+        message = "\n".join(lines + [
+            "This is an automated alert digest from Weather Forecast.",
+            "Change how often you get it on the Settings page.",
+        ])
+        with metrics.ALERT_EMAIL_LATENCY.time():
+            send_mail(
+                subject,
+                message,
+                django_settings.DEFAULT_FROM_EMAIL,
+                [user.email],
+                fail_silently=False,
+            )
+        metrics.ALERT_EMAILS.inc(outcome='sent')
+        return True, "Email sent successfully"
+    except Exception as e:
+        metrics.ALERT_EMAILS.inc(outcome='failed')
         return False, f"Failed to send email: {str(e)}"
 
 # --- Navigation & Auth Views ---
 
+
 def login_redirect(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
     return redirect('login')
 
+
 def register(request):
     if request.method == 'POST':
         form = RegisterForm(request.POST)
@@ -217,9 +696,15 @@ def register(request):
 
 # --- Main Dashboard View (User UI) ---
 
-@login_required
-def dashboard(request: HttpRequest) -> HttpResponse:
-    """User Dashboard aligned with HTML template variables."""
+
+async def dashboard(request: HttpRequest) -> HttpResponse:
+    """User Dashboard aligned with HTML template variables.
+
+    Async so a search fetches current conditions and the forecast concurrently.
+    """
+    # login_required is not async-aware on Django 4.2; load the lazy user off the event loop.
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path())
     if request.user.is_staff:
         return redirect('admin_dashboard')
 
@@ -227,7 +712,8 @@ def dashboard(request: HttpRequest) -> HttpResponse:
     alert_form = AlertPreferenceForm()
     weather_data = None  # Key fix: Matching HTML name
     forecast_items = []
-    user_settings, _ = UserSetting.objects.get_or_create(user=request.user)
+    forecast_city = None
+    user_settings, _ = await UserSetting.objects.aget_or_create(user=request.user)
     temp_unit = user_settings.temperature_unit
     unit_symbol = 'F' if temp_unit == 'imperial' else 'C'
 
@@ -235,7 +721,7 @@ def dashboard(request: HttpRequest) -> HttpResponse:
     recent_searches = WeatherSearch.objects.filter(
         user=request.user, 
         is_deleted_by_user=False
-    ).order_by('-searched_at')
+    ).select_related('observation').order_by('-searched_at')
     
     if request.method == 'POST':
         # 1. Weather Search Action
@@ -243,67 +729,43 @@ def dashboard(request: HttpRequest) -> HttpResponse:
             form = WeatherSearchForm(request.POST)
             if form.is_valid():
                 city = form.cleaned_data['city']
-                payload, error = fetch_weather(city)
-                
-                if payload:
-                    weather_main = payload.get('weather', [{}])[0]
-                    main_metrics = payload.get('main', {})
-                    wind = payload.get('wind', {})
-                    
-                    # Create and save record
-                    new_search = WeatherSearch.objects.create(
+                (observation, error), (forecast, _) = await asyncio.gather(
+                    afetch_observation(city),
+                    afetch_forecast(city),
+                )
+
+                if observation:
+                    new_search = await WeatherSearch.objects.acreate(
                         user=request.user,
-                        city=payload.get('name', city),
-                        country=payload.get('sys', {}).get('country', ''),
-                        temperature_c=main_metrics.get('temp'),
-                        humidity=main_metrics.get('humidity'),
-                        wind_speed_kph=round(wind.get('speed', 0) * 3.6, 2),
-                        condition_main=weather_main.get('main', ''),
-                        condition_description=weather_main.get('description', ''),
-                        icon_code=weather_main.get('icon', ''),
-                        api_payload=payload
+                        city=observation.city or city,
+                        country=observation.country,
+                        observation=observation,
                     )
-                    
-                    # Mapping to dictionary for HTML compatibility
-                    weather_data = {
-                        'city': new_search.city,
-                        'temperature': convert_temperature(new_search.temperature_c, temp_unit),
-                        'description': new_search.condition_description,
-                        'icon': new_search.icon_code,
-                        'humidity': new_search.humidity,
-                        'wind_speed': new_search.wind_speed_kph,
-                        'feels_like': convert_temperature(main_metrics.get('feels_like'), temp_unit)
-                    }
-                    
-                    forecast, _ = fetch_forecast(city)
+                    weather_data = observation_weather_data(observation, temp_unit)
                     if forecast:
                         forecast_items = build_five_day_forecast(forecast, unit=temp_unit)
-                    
+                        forecast_city = city
+
                     messages.success(request, f"Showing weather for {new_search.city}.")
                 else:
                     messages.error(request, error)
 
     # --- PERSISTENCE LOGIC ---
     # Load last search if no new search made in this POST
-    if not weather_data and recent_searches.exists():
-        last = recent_searches.first()
-        weather_data = {
-            'city': last.city,
-            'temperature': convert_temperature(last.temperature_c, temp_unit),
-            'description': last.condition_description,
-            'icon': last.icon_code,
-            'humidity': last.humidity,
-            'wind_speed': last.wind_speed_kph,
-            'feels_like': convert_temperature(
-                last.api_payload.get('main', {}).get('feels_like') if last.api_payload else None,
-                temp_unit,
-            )
-        }
-        forecast, _ = fetch_forecast(last.city)
+    last = None if weather_data else await recent_searches.afirst()
+    if last and last.observation:
+        weather_data = observation_weather_data(last.observation, temp_unit)
+        forecast, _ = await afetch_forecast(last.city)
         if forecast:
             forecast_items = build_five_day_forecast(forecast, unit=temp_unit)
-
-    return render(request, 'dashboard/user_dashboard.html', {
+            forecast_city = last.city
+    forecast_stamp = await sync_to_async(forecast_fetched_at)(forecast_city) if forecast_city else None
+
+    return TemplateResponse(request, 'dashboard/user_dashboard.html', {
+        **await afragment_context(request),
+        'forecast_stamp': forecast_stamp,
+        'forecast_city_key': (forecast_city or '').strip().lower(),
+        'live_streaming': live.streaming_available(request),
         'form': form,
         'alert_form': alert_form,
         'weather_data': weather_data,      # Match: {% if weather_data %}
@@ -316,31 +778,44 @@ def dashboard(request: HttpRequest) -> HttpResponse:
 
 # --- User Actions ---
 
+
 @login_required
 @require_POST
 def delete_search(request, search_id):
     WeatherSearch.objects.filter(id=search_id, user=request.user).update(is_deleted_by_user=True)
+    bump_user_version(request.user.id)
     return redirect('dashboard')
 
+
 @login_required
 def clear_history(request):
     """Aligns with the {% url 'clear_history' %} in your HTML."""
     WeatherSearch.objects.filter(user=request.user).update(is_deleted_by_user=True)
+    bump_user_version(request.user.id)
     messages.info(request, "Search history cleared.")
     return redirect('dashboard')
 
+
 @login_required
 @require_POST
 def create_alert(request):
     """Aligns with the {% url 'create_alert' %} in your HTML."""
     city = request.POST.get('city')
     threshold = request.POST.get('temperature_threshold')
+    low_threshold = request.POST.get('low_temperature_threshold')
+    humidity_threshold = request.POST.get('humidity_threshold')
+    wind_speed_threshold = request.POST.get('wind_speed_threshold')
+    forecast_hours = request.POST.get('forecast_hours')
     
     AlertPreference.objects.update_or_create(
         user=request.user,
         city=city,
         defaults={
             'temperature_threshold': threshold if threshold else None,
+            'low_temperature_threshold': low_threshold if low_threshold else None,
+            'humidity_threshold': humidity_threshold if humidity_threshold else None,
+            'wind_speed_threshold': wind_speed_threshold if wind_speed_threshold else None,
+            'forecast_hours': forecast_hours if forecast_hours else None,
             'condition_alerts': 'condition_alerts' in request.POST,
             'email_alerts': 'email_alerts' in request.POST,
             'is_active': True,
@@ -351,8 +826,34 @@ def create_alert(request):
 
 # --- Admin Views (Stubs) ---
 
+
 @user_passes_test(lambda u: u.is_staff)
+@use_replica
 def admin_dashboard(request):
+    try:
+        # Bounded so a slow aggregate cannot tie up a database connection.
+        with statement_timeout(django_settings.ANALYTICS_STATEMENT_TIMEOUT_MS, using=read_alias()):
+            stats = admin_statistics()
+    except OperationalError:
+        logger.warning("Admin dashboard statistics timed out", exc_info=True)
+        messages.warning(request, "Statistics are taking too long to load; showing recent activity only.")
+        stats = {
+            'total_searches': None,
+            'unique_cities': None,
+            'todays_searches': None,
+            'total_users': None,
+            'most_searched': [],
+            'chart_labels': [],
+            'chart_values': [],
+        }
+
+    # Recent searches (last 20)
+    stats['recent_searches'] = WeatherSearch.objects.select_related('user', 'observation').order_by('-searched_at')[:20]
+    return render(request, 'dashboard/admin_dashboard.html', stats)
+
+
+def admin_statistics() -> dict:
+    """Aggregates for the admin dashboard, evaluated eagerly."""
     # Total searches
     total_searches = WeatherSearch.objects.count()
 
@@ -367,12 +868,7 @@ def admin_dashboard(request):
     total_users = User.objects.count()
 
     # Most searched cities (top 10)
-    most_searched = WeatherSearch.objects.values('city').annotate(
-        total=Count('city')
-    ).order_by('-total')[:10]
-
-    # Recent searches (last 20)
-    recent_searches = WeatherSearch.objects.select_related('user').order_by('-searched_at')[:20]
+    most_searched = list(most_searched_cities(10))
 
     # Chart data: searches per day for last 7 days
     seven_days_ago = dj_timezone.now() - timedelta(days=7)
@@ -383,21 +879,136 @@ def admin_dashboard(request):
     chart_labels = [entry['date'].strftime('%b %d') for entry in chart_data]
     chart_values = [entry['count'] for entry in chart_data]
 
-    return render(request, 'dashboard/admin_dashboard.html', {
+    return {
         'total_searches': total_searches,
         'unique_cities': unique_cities,
         'todays_searches': todays_searches,
         'total_users': total_users,
         'most_searched': most_searched,
-        'recent_searches': recent_searches,
         'chart_labels': chart_labels,
         'chart_values': chart_values,
-    })
+    }
+
+
+USERS_PAGE_SIZE = 50
+
+# Sortable columns of the user list, each tie-broken by id for keyset
+# pagination. Only indexed columns sort (date_joined: migration 0025); the
+# activity columns are computed per row, so sorting by them would evaluate
+# their subqueries for every user.
+USER_SORT_FIELDS = ('id', 'username', 'date_joined')
+USER_DATETIME_FIELDS = {'date_joined'}
+
+
+def users_with_activity():
+    """Users annotated with search count, active alerts, last search and last alert trigger.
+
+    Each annotation is a correlated subquery answered from the per-user
+    indexes on WeatherSearch and AlertPreference, so a page of users costs
+    a fixed number of index lookups per row.
+    """
+    searches = WeatherSearch.objects.filter(user=OuterRef('pk')).order_by()
+    alerts = AlertPreference.objects.filter(user=OuterRef('pk')).order_by()
+    return User.objects.annotate(
+        search_count=Coalesce(Subquery(searches.values('user').annotate(n=Count('pk')).values('n')), 0),
+        active_alerts=Coalesce(Subquery(alerts.filter(is_active=True).values('user').annotate(n=Count('pk')).values('n')), 0),
+        last_search_at=Subquery(searches.order_by('-searched_at').values('searched_at')[:1]),
+        last_alert_at=Subquery(
+            alerts.filter(last_triggered__isnull=False).order_by('-last_triggered').values('last_triggered')[:1]
+        ),
+    )
+
+
+def keyset_page(queryset, sort: str, cursor: str | None, backwards: bool, size: int):
+    """One page of ``queryset`` ordered by ``sort`` (``-`` prefix for descending) and id.
+
+    ``cursor`` marks the last row of the previous page (or, going
+    ``backwards``, the first row of the next one). Returns the rows and
+    whether more rows follow in the direction of travel.
+    """
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    queryset = queryset.alias(sort_key=F(field))
+    if descending != backwards:
+        queryset = queryset.order_by('-sort_key', '-id')
+        after = 'lt'
+    else:
+        queryset = queryset.order_by('sort_key', 'id')
+        after = 'gt'
+
+    position = read_cursor(cursor, field) if cursor else None
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(
+            Q(**{f'sort_key__{after}': value}) | Q(sort_key=value, **{f'id__{after}': pk})
+        )
+
+    rows = list(queryset[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+    return rows, has_more
+
+
+def read_cursor(cursor: str, field: str) -> tuple | None:
+    """The ``(sort value, id)`` a cursor from `user_cursor` points at, or None if it is invalid."""
+    try:
+        value, pk = signing.loads(cursor, salt='manage_users')
+        if field in USER_DATETIME_FIELDS:
+            value = datetime.fromisoformat(value)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    return value, pk
+
+
+def user_cursor(user, field: str) -> str:
+    value = getattr(user, field)
+    if field in USER_DATETIME_FIELDS:
+        value = value.isoformat()
+    return signing.dumps([value, user.pk], salt='manage_users')
+
 
 @user_passes_test(lambda u: u.is_staff)
+@use_replica
 def manage_users(request):
-    users = User.objects.all()
-    return render(request, 'dashboard/admin_manage_users.html', {'users': users})
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', '-id')
+    if sort.lstrip('-') not in USER_SORT_FIELDS:
+        sort = '-id'
+    field = sort.lstrip('-')
+    backwards = 'before' in request.GET
+    cursor = request.GET.get('before') if backwards else request.GET.get('after')
+    if cursor and read_cursor(cursor, field) is None:
+        # A tampered or stale cursor starts over from the first page.
+        cursor, backwards = None, False
+
+    users = users_with_activity()
+    if query:
+        # Prefix matches, served by the UPPER(...) pattern indexes of migration 0025.
+        users = users.filter(Q(username__istartswith=query) | Q(email__istartswith=query))
+    rows, has_more = keyset_page(users, sort, cursor, backwards, USERS_PAGE_SIZE)
+
+    def page_url(**params):
+        return '?' + urlencode({**({'q': query} if query else {}), 'sort': sort, **params})
+
+    has_next = has_more if not backwards else bool(cursor)
+    has_prev = has_more if backwards else bool(cursor)
+    return render(request, 'dashboard/admin_manage_users.html', {
+        'users': rows,
+        'query': query,
+        'sort': sort,
+        'sort_field': field,
+        'sort_descending': sort.startswith('-'),
+        'sort_links': {
+            name: '?' + urlencode({**({'q': query} if query else {}), 'sort': name if sort == f'-{name}' else f'-{name}'})
+            for name in USER_SORT_FIELDS
+        },
+        'next_url': page_url(after=user_cursor(rows[-1], field)) if rows and has_next else None,
+        'deletion_jobs': DeletionJob.objects.exclude(status=DeletionJob.DONE).order_by('-created_at')[:20],
+        'prev_url': page_url(before=user_cursor(rows[0], field)) if rows and has_prev else None,
+    })
+
 
 @user_passes_test(lambda u: u.is_staff)
 def edit_user(request, user_id):
@@ -412,6 +1023,7 @@ def edit_user(request, user_id):
         form = UserEditForm(instance=user)
     return render(request, 'dashboard/admin_edit_user.html', {'form': form})
 
+
 @user_passes_test(lambda u: u.is_staff)
 @require_POST
 def toggle_user_active(request, user_id):
@@ -422,6 +1034,7 @@ def toggle_user_active(request, user_id):
     messages.success(request, f"User {user.username} has been {status}.")
     return redirect('manage_users')
 
+
 @user_passes_test(lambda u: u.is_staff)
 @require_POST
 def delete_user(request, user_id):
@@ -429,28 +1042,39 @@ def delete_user(request, user_id):
     if user == request.user:
         messages.error(request, "You cannot delete your own account.")
     else:
-        user.delete()
-        messages.success(request, f"User {user.username} has been deleted.")
+        # Deactivated now; the data goes in batches on a background thread.
+        run_in_background(start_deletion(user))
+        messages.success(request, f"User {user.username} has been deactivated and is being deleted.")
     return redirect('manage_users')
 
+
 @user_passes_test(lambda u: u.is_staff)
+@use_replica
 def search_history(request):
-    searches = WeatherSearch.objects.select_related('user').filter(is_deleted_by_user=False).order_by('-searched_at')
+    searches = WeatherSearch.objects.select_related('user', 'observation').filter(is_deleted_by_user=False).order_by('-searched_at')
     return render(request, 'dashboard/admin_search_history.html', {'searches': searches})
 
+
 @user_passes_test(lambda u: u.is_staff)
 def delete_search_admin(request, search_id): return HttpResponse("Admin Delete Search")
 
+
 @user_passes_test(lambda u: u.is_staff)
 def clear_search_history(request): return HttpResponse("Admin Clear History")
 
 # --- User Feature Views ---
 
+
 @login_required
 def saved_locations(request):
     """Display user's saved locations."""
     locations = SavedLocation.objects.filter(user=request.user, favorite=True).order_by('-created_at')
-    return render(request, 'dashboard/saved_locations.html', {'saved_locations': locations})
+    return render(request, 'dashboard/saved_locations.html', {
+        **fragment_context(request),
+        'saved_locations': locations,
+        'live_streaming': live.streaming_available(request),
+    })
+
 
 @login_required
 @require_POST
@@ -464,14 +1088,14 @@ def add_saved_location(request):
         return redirect('saved_locations')
 
     # Fetch weather to get coordinates and canonical city name
-    payload, error = fetch_weather(city)
-    if not payload:
+    observation, error = fetch_observation(city)
+    if not observation:
         messages.error(request, f"Could not add {city}: {error}")
         return redirect('saved_locations')
 
     # Use the canonical city name from the API
-    canonical_city = payload.get('name', city.title())
-    canonical_country = payload.get('sys', {}).get('country', country)
+    canonical_city = observation.city or city.title()
+    canonical_country = observation.country or country
 
     # Check if location already exists
     existing_location = SavedLocation.objects.filter(
@@ -495,12 +1119,13 @@ def add_saved_location(request):
         user=request.user,
         city=canonical_city,
         country=canonical_country,
-        latitude=payload.get('coord', {}).get('lat'),
-        longitude=payload.get('coord', {}).get('lon'),
+        latitude=observation.latitude,
+        longitude=observation.longitude,
     )
     messages.success(request, f"{canonical_city} added to saved locations.")
     return redirect('saved_locations')
 
+
 @login_required
 @require_POST
 def toggle_favorite_location(request, location_id):
@@ -511,12 +1136,15 @@ def toggle_favorite_location(request, location_id):
     messages.success(request, f"{location.city} unfavorited.")
     return redirect('saved_locations')
 
+
 @login_required
 def manage_alerts(request):
     """Display and manage user's weather alerts."""
     alerts = AlertPreference.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'dashboard/manage_alerts.html', {'alerts': alerts})
-
+    return render(request, 'dashboard/manage_alerts.html', {
+        **fragment_context(request),
+        'alerts': alerts,
+    })
 
 
 @login_required
@@ -531,7 +1159,6 @@ def toggle_alert(request, alert_id):
     return redirect('manage_alerts')
 
 
-
 @login_required
 @require_POST
 def delete_alert(request, alert_id):
@@ -542,12 +1169,14 @@ def delete_alert(request, alert_id):
     messages.success(request, f"Alert for {city} deleted successfully.")
     return redirect('manage_alerts')
 
+
 @login_required
 def settings(request):
     """Display user settings."""
     user_settings, created = UserSetting.objects.get_or_create(user=request.user)
     return render(request, 'dashboard/settings.html', {'user_settings': user_settings})
 
+
 @login_required
 @require_POST
 def update_settings(request):
@@ -557,21 +1186,274 @@ def update_settings(request):
     user_settings.temperature_unit = request.POST.get('temperature_unit', 'metric')
     user_settings.dark_mode = 'dark_mode' in request.POST
     user_settings.enable_all_alerts = 'enable_all_alerts' in request.POST
+    delivery = request.POST.get('alert_delivery', user_settings.alert_delivery)
+    if delivery in dict(UserSetting._meta.get_field('alert_delivery').choices):
+        user_settings.alert_delivery = delivery
     user_settings.save()
 
     messages.success(request, "Settings updated successfully.")
     return redirect('settings')
 
 
+def has_cron_token(request) -> bool:
+    """True if the request carries ALERT_CRON_TOKEN as a header, bearer token or query param."""
+    token = request.headers.get("X-Alert-Token") or request.GET.get("token", "")
+    authorization = request.headers.get("Authorization", "")
+    if not token and authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):].strip()
+    return bool(django_settings.ALERT_CRON_TOKEN) and token == django_settings.ALERT_CRON_TOKEN
+
+
 @csrf_exempt
 @require_POST
 def run_alerts(request):
     """Secure endpoint for external schedulers (GitHub Actions, cron services)."""
-    token = request.headers.get("X-Alert-Token") or request.GET.get("token", "")
-    if not django_settings.ALERT_CRON_TOKEN or token != django_settings.ALERT_CRON_TOKEN:
+    if not has_cron_token(request):
         return HttpResponseForbidden("Forbidden")
 
     buffer = io.StringIO()
     call_command("process_alerts", stdout=buffer)
     output = buffer.getvalue().strip()
     return JsonResponse({"status": "ok", "output": output})
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, protected by ALERT_CRON_TOKEN."""
+    if not has_cron_token(request):
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# --- JSON API ---
+# Read-only endpoints built on the same helpers as the pages. Each response
+# carries an ETag, so a polling client that sends If-None-Match gets a bodiless
+# 304 and the payload is never rebuilt. Weather and forecast also send
+# Last-Modified; the list endpoints do not, since deleting a row does not move
+# any timestamp.
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def api_etag(*parts) -> str:
+    """Quoted ETag derived from the values that determine a response body."""
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_json(request, etag: str, last_modified: datetime | None, build) -> HttpResponse:
+    """304 when the request's validators still match, otherwise ``build()`` as JSON."""
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    if last_modified_ts is not None:
+        response['Last-Modified'] = http_date(last_modified_ts)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def api_number(value) -> float | None:
+    return None if value is None else float(value)
+
+
+def observation_api_data(observation: Observation, unit: str) -> dict:
+    """JSON form of an observation, shared by the weather API and the live stream."""
+    data = observation_weather_data(observation, unit)
+    data.update({
+        'country': observation.country,
+        'wind_speed': api_number(observation.wind_speed_kph),
+        'condition_id': observation.condition_id,
+        'observed_at': observation.observed_at.isoformat(),
+        'unit': unit,
+        'unit_symbol': 'F' if unit == 'imperial' else 'C',
+    })
+    return data
+
+
+def api_unit(request) -> str:
+    user_settings, _ = UserSetting.objects.get_or_create(user=request.user)
+    return user_settings.temperature_unit
+
+
+def api_city(request) -> str | None:
+    """The `city` query parameter, defaulting to the user's last search like the dashboard."""
+    city = request.GET.get('city', '').strip()
+    if city:
+        return city
+    last = WeatherSearch.objects.filter(
+        user=request.user, is_deleted_by_user=False
+    ).order_by('-searched_at').values('city', 'country').first()
+    if not last:
+        return None
+    return f"{last['city']},{last['country']}" if last['country'] else last['city']
+
+
+@require_GET
+@api_login_required
+def api_weather(request):
+    """Current conditions for ?city= (or the last searched city)."""
+    city = api_city(request)
+    if not city:
+        return JsonResponse({'error': 'No city given and no recent search.'}, status=400)
+    observation, error = fetch_observation(city)
+    if not observation:
+        return JsonResponse({'error': error}, status=502)
+
+    unit = api_unit(request)
+    etag = api_etag('weather', observation.pk, observation.observed_at.timestamp(), unit)
+
+    return conditional_json(request, etag, observation.observed_at, lambda: observation_api_data(observation, unit))
+
+
+@require_GET
+@api_login_required
+def api_forecast(request):
+    """Five-day forecast for ?city= (or the last searched city), as shown on the dashboard."""
+    city = api_city(request)
+    if not city:
+        return JsonResponse({'error': 'No city given and no recent search.'}, status=400)
+    forecast, error = fetch_forecast(city)
+    if not forecast:
+        return JsonResponse({'error': error}, status=502)
+
+    unit = api_unit(request)
+
+    def build():
+        return {
+            'city': forecast.get('city', {}).get('name', city),
+            'unit': unit,
+            'days': build_five_day_forecast(forecast, unit=unit),
+        }
+
+    fetched = forecast_fetched_at(city)
+    if fetched is None:
+        # No fetch time to validate against (the payload's expiry is not
+        # cached): the ETag is a hash of the body and there is no Last-Modified.
+        body = build()
+        return conditional_json(request, api_etag('forecast', body), None, lambda: body)
+    etag = api_etag('forecast', city.lower(), fetched, unit)
+    return conditional_json(request, etag, datetime.fromtimestamp(fetched, tz=timezone.utc), build)
+
+
+@require_GET
+@api_login_required
+def api_searches(request):
+    """The user's ten most recent searches with the conditions recorded at search time."""
+    searches = WeatherSearch.objects.filter(user=request.user, is_deleted_by_user=False)
+    state = searches.aggregate(count=Count('id'), latest_id=Max('id'))
+    unit = api_unit(request)
+    etag = api_etag('searches', state['count'], state['latest_id'], unit)
+
+    def build():
+        rows = []
+        for search in searches.select_related('observation').order_by('-searched_at')[:10]:
+            observation = search.observation
+            rows.append({
+                'id': search.id,
+                'city': search.city,
+                'country': search.country,
+                'searched_at': search.searched_at.isoformat(),
+                'temperature': convert_temperature(observation.temperature_c, unit) if observation else None,
+                'description': observation.condition_description if observation else '',
+                'icon': observation.icon_code if observation else '',
+            })
+        return {'unit': unit, 'searches': rows}
+
+    return conditional_json(request, etag, None, build)
+
+
+@require_GET
+@api_login_required
+def api_alerts(request):
+    """The user's alerts; thresholds are in Celsius and km/h like the alert form."""
+    alerts = AlertPreference.objects.filter(user=request.user)
+    state = alerts.aggregate(
+        count=Count('id'), latest_id=Max('id'), updated=Max('updated_at'), triggered=Max('last_triggered'),
+    )
+    etag = api_etag('alerts', state['count'], state['latest_id'], state['updated'], state['triggered'])
+
+    def build():
+        return {'alerts': [
+            {
+                'id': alert.id,
+                'city': alert.city,
+                'country': alert.country,
+                'temperature_threshold': api_number(alert.temperature_threshold),
+                'low_temperature_threshold': api_number(alert.low_temperature_threshold),
+                'humidity_threshold': alert.humidity_threshold,
+                'wind_speed_threshold': api_number(alert.wind_speed_threshold),
+                'forecast_hours': alert.forecast_hours,
+                'condition_alerts': alert.condition_alerts,
+                'email_alerts': alert.email_alerts,
+                'is_active': alert.is_active,
+                'last_triggered': alert.last_triggered.isoformat() if alert.last_triggered else None,
+            }
+            for alert in alerts.order_by('-created_at')
+        ]}
+
+    return conditional_json(request, etag, None, build)
+
+
+# --- Live updates (Server-Sent Events) ---
+
+
+async def live_updates(request: HttpRequest) -> HttpResponse:
+    """SSE stream of current conditions for ?city= and the user's favorite locations.
+
+    Streams end after LIVE_STREAM_MAX_AGE seconds and the browser's
+    EventSource reconnects, which bounds how long a stream can outlive a
+    client that went away without the server noticing.
+    """
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return HttpResponse(status=401)
+    if not live.streaming_available(request):
+        # 204 tells EventSource to stop reconnecting; pages poll instead.
+        return HttpResponse(status=204)
+    user_settings, _ = await UserSetting.objects.aget_or_create(user=request.user)
+    unit = user_settings.temperature_unit
+
+    queries: dict[str, str] = {}
+    city = request.GET.get('city', '').strip()
+    if city:
+        queries[city.lower()] = city
+    async for location in SavedLocation.objects.filter(user=request.user, favorite=True):
+        query = f"{location.city},{location.country}" if location.country else location.city
+        queries.setdefault(query.lower(), query)
+    if not queries:
+        # 204 tells EventSource to stop reconnecting.
+        return HttpResponse(status=204)
+    subscriptions = list(queries.values())
+
+    async def stream():
+        hub = live.get_hub(apoll_observation)
+        queue: asyncio.Queue = asyncio.Queue()
+        hub.subscribe(queue, subscriptions)
+        deadline = time.monotonic() + django_settings.LIVE_STREAM_MAX_AGE
+        try:
+            yield f"retry: {django_settings.LIVE_RETRY_MS}\n\n"
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    query, observation = await asyncio.wait_for(
+                        queue.get(), min(remaining, django_settings.LIVE_KEEPALIVE)
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                data = observation_api_data(observation, unit)
+                data['query'] = query.lower()
+                yield live.format_event('weather', json.dumps(data), event_id=str(observation.pk))
+        finally:
+            hub.unsubscribe(queue, subscriptions)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
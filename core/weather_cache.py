@@ -0,0 +1,194 @@
+"""Two-tier cache for weather payloads.
+
+L2 is the shared Django cache (Redis in production), L1 a bounded LRU of
+already-deserialized payloads in each worker process. An L1 entry is served
+with no I/O at all for WEATHER_L1_TTL seconds; after that it is revalidated
+against the entry's version key, a small integer stored next to the payload
+in L2 and replaced on every write by any process. Only when the version has
+changed (or the payload expired) is the full payload read again.
+
+L2 holds payloads trimmed and packed by `core.codec`; L1 holds them decoded.
+Payloads returned from here are shared between requests: treat them as
+read-only.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import codec, metrics
+
+
+def expires_key(cache_key: str) -> str:
+    return f"{cache_key}_expires"
+
+
+def version_key(cache_key: str) -> str:
+    return f"{cache_key}_version"
+
+
+class LocalCache:
+    """Thread-safe LRU of ``key -> (value, version)`` with a per-entry check time.
+
+    ``check_at`` is when the entry must be revalidated (monotonic clock),
+    ``expires_at`` when the L2 copy expires (wall clock); past that, the
+    entry is dropped.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, int, float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = dict.fromkeys(metrics.WEATHER_L1.labels['result'], 0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def count(self, result: str) -> None:
+        with self._lock:
+            self.stats[result] += 1
+        metrics.WEATHER_L1.inc(result=result)
+
+    def lookup(self, key: str) -> tuple[Any, int, bool] | None:
+        """``(value, version, fresh)`` for a live entry; ``fresh`` means no check is due."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, version, check_at, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return value, version, time.monotonic() < check_at
+
+    def store(self, key: str, value: Any, version: int, expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, version, time.monotonic() + self.ttl, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        for _ in range(evicted):
+            self.count('eviction')
+
+    def extend(self, key: str) -> None:
+        """Serve the entry without checks for another ``ttl`` seconds."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], entry[1], time.monotonic() + self.ttl, entry[3])
+
+    def expires_at(self, key: str) -> float | None:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[3] if entry is not None else None
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats = dict.fromkeys(self.stats, 0)
+
+
+local = LocalCache(settings.WEATHER_L1_MAX_ENTRIES, settings.WEATHER_L1_TTL)
+
+
+def _new_version() -> int:
+    return time.time_ns() // 1000
+
+
+def _revalidated(key: str, cached: tuple[Any, int, bool], version: int | None) -> Any | None:
+    """The L1 value if L2 still holds the same version of it."""
+    value, cached_version, _fresh = cached
+    if version != cached_version:
+        return None
+    local.count('revalidated')
+    local.extend(key)
+    return value
+
+
+def _loaded(key: str, values: dict) -> Any | None:
+    """Keep a payload just read from L2 in L1."""
+    local.count('miss')
+    data = codec.decode(values.get(key))
+    version = values.get(version_key(key))
+    if data is None or version is None:
+        # Entries written before versioning are served but not kept locally.
+        local.discard(key)
+        return data
+    local.store(key, data, version, values.get(expires_key(key)) or time.time() + local.ttl)
+    return data
+
+
+def get(key: str) -> Any | None:
+    """The payload under ``key``, from L1 when possible."""
+    cached = local.lookup(key)
+    if cached is not None:
+        if cached[2]:
+            local.count('hit')
+            return cached[0]
+        value = _revalidated(key, cached, cache.get(version_key(key)))
+        if value is not None:
+            return value
+    return _loaded(key, cache.get_many([key, version_key(key), expires_key(key)]))
+
+
+async def aget(key: str) -> Any | None:
+    """Async version of `get`."""
+    cached = local.lookup(key)
+    if cached is not None:
+        if cached[2]:
+            local.count('hit')
+            return cached[0]
+        value = _revalidated(key, cached, await cache.aget(version_key(key)))
+        if value is not None:
+            return value
+    return _loaded(key, await cache.aget_many([key, version_key(key), expires_key(key)]))
+
+
+def expires_at(key: str) -> float | None:
+    """When the payload under ``key`` expires from L2, or None if it is not cached."""
+    expires = local.expires_at(key)
+    return expires if expires is not None else cache.get(expires_key(key))
+
+
+def _entries(key: str, encoded: bytes, ttl: int) -> tuple[dict, int, float]:
+    version = _new_version()
+    expires_at = time.time() + ttl
+    return {key: encoded, expires_key(key): expires_at, version_key(key): version}, version, expires_at
+
+
+def set(key: str, data: dict, ttl: int) -> dict:
+    """Write ``data`` to both tiers and return it as cached (trimmed).
+
+    Other workers see the new version on their next check.
+    """
+    encoded = codec.encode(data)
+    entries, version, expires_at = _entries(key, encoded, ttl)
+    cache.set_many(entries, ttl)
+    data = codec.decode(encoded)
+    local.store(key, data, version, expires_at)
+    return data
+
+
+async def aset(key: str, data: dict, ttl: int) -> dict:
+    """Async version of `set`."""
+    encoded = codec.encode(data)
+    entries, version, expires_at = _entries(key, encoded, ttl)
+    await cache.aset_many(entries, ttl)
+    data = codec.decode(encoded)
+    local.store(key, data, version, expires_at)
+    return data
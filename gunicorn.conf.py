@@ -0,0 +1,16 @@
+"""Gunicorn settings for the web service: uvicorn workers serving the ASGI app.
+
+Picked up automatically by `gunicorn weather_management.asgi:application`.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 4)))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 20
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = 100
+accesslog = "-"
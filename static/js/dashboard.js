@@ -160,6 +160,66 @@ document.addEventListener('DOMContentLoaded', function() {
 
     createMobileToggle();
     window.addEventListener('resize', createMobileToggle);
+
+    // Fill [data-field] elements of a container from a weather payload.
+    const applyWeather = (container, data) => {
+        container.querySelectorAll('[data-field]').forEach(el => {
+            const value = data[el.dataset.field];
+            let text = value === null || value === undefined || value === '' ? '--' : String(value);
+            if (el.dataset.field === 'description') {
+                text = text.replace(/\b\w/g, c => c.toUpperCase());
+            }
+            el.textContent = text + (el.dataset.suffix || '').replace('{unit}', data.unit_symbol || '');
+        });
+        const icon = container.querySelector('.weather-icon-large img');
+        if (icon && data.icon) {
+            icon.src = `http://openweathermap.org/img/wn/${data.icon}@4x.png`;
+        }
+    };
+
+    // Live updates: one Server-Sent Events stream per page pushes new
+    // observations for the displayed city and saved locations.
+    const liveSource = document.querySelector('[data-live-url]');
+    if (liveSource && window.EventSource) {
+        const stream = new EventSource(liveSource.dataset.liveUrl);
+        stream.addEventListener('weather', event => {
+            const data = JSON.parse(event.data);
+            document.querySelectorAll('[data-live-city]').forEach(container => {
+                if (container.dataset.liveCity === data.query) {
+                    applyWeather(container, data);
+                }
+            });
+        });
+        return;
+    }
+
+    // Fallback: poll the JSON API. The ETag is sent back so an unchanged
+    // observation costs a bodiless 304 instead of a page reload.
+    const weatherDisplay = document.querySelector('.weather-display[data-weather-url]');
+    if (weatherDisplay) {
+        let etag = null;
+        const refreshWeather = () => {
+            const headers = { 'Accept': 'application/json' };
+            if (etag) {
+                headers['If-None-Match'] = etag;
+            }
+            fetch(weatherDisplay.dataset.weatherUrl, { headers: headers, cache: 'no-store' })
+                .then(response => {
+                    if (response.status !== 200) {
+                        return null;
+                    }
+                    etag = response.headers.get('ETag');
+                    return response.json();
+                })
+                .then(data => {
+                    if (data) {
+                        applyWeather(weatherDisplay, data);
+                    }
+                })
+                .catch(() => {});
+        };
+        setInterval(refreshWeather, 5 * 60 * 1000);
+    }
 });
 
 // Add floating animation keyframes
@@ -71,14 +71,32 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in request timing (see core/profiling.py)
+PERF_TIMING_ENABLED = os.getenv('PERF_TIMING_ENABLED', '0') == '1'
+PERF_TIMING_SAMPLE_RATE = float(os.getenv('PERF_TIMING_SAMPLE_RATE', '0.05'))
+PERF_PROFILE_SAMPLE_RATE = float(os.getenv('PERF_PROFILE_SAMPLE_RATE', '0'))
+PERF_PROFILE_DIR = os.getenv('PERF_PROFILE_DIR', str(BASE_DIR / 'profiles'))
+if PERF_TIMING_ENABLED:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'core.profiling.RequestProfilingMiddleware',
+    )
+
 ROOT_URLCONF = 'weather_management.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept in memory; in DEBUG the autoreloader
+            # clears them when a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -95,13 +113,64 @@ WSGI_APPLICATION = 'weather_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connections persist for DB_CONN_MAX_AGE seconds and are health-checked
+# before reuse. Under ASGI each request runs its ORM calls on its own thread,
+# so persistent connections are not shared between requests there; the web
+# service sets DB_CONN_MAX_AGE=0 and pooling belongs in PgBouncer
+# (DB_PGBOUNCER=1 for transaction pooling mode).
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', '0') == '1'
+# Server-wide statement timeout (PostgreSQL, 0 = none) and the tighter one
+# applied to the admin analytics queries (see core/db.py).
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+ANALYTICS_STATEMENT_TIMEOUT_MS = int(os.getenv('ANALYTICS_STATEMENT_TIMEOUT_MS', '5000'))
+
 DATABASES = {
     'default': dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=True,
     )
 }
 
+# Optional streaming replica for the read-only admin reporting views. Reads
+# fall back to the primary while the replica is more than
+# REPLICA_MAX_LAG_SECONDS behind or unreachable (see core/db.py).
+REPLICA_DATABASE_URL = (os.getenv('REPLICA_DATABASE_URL') or '').strip()
+REPLICA_MAX_LAG_SECONDS = int(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_LAG_CHECK_INTERVAL = 10
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    if DB_PGBOUNCER:
+        # Transaction pooling hands each transaction a different server
+        # connection: server-side cursors and startup options do not survive.
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+    elif DB_STATEMENT_TIMEOUT_MS:
+        database.setdefault('OPTIONS', {})['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+
+
+# Cache
+# A shared Redis cache lets the cron/warmer processes fill entries the web workers read.
+
+REDIS_URL = (os.getenv('REDIS_URL') or '').strip()
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -140,7 +209,27 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
-WHITENOISE_USE_FINDERS = True
+
+# Production serves the output of `collectstatic`: content-hashed filenames
+# (cached by WhiteNoise for a year, immutable) with gzip and brotli variants
+# written next to them, plus resized AVIF/WebP/JPEG variants of raster images
+# and minified SVGs (core/images.py). Development keeps serving straight from
+# the finders.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+            if DEBUG else
+            'core.storage.OptimizedStaticFilesStorage'
+        ),
+    },
+}
+WHITENOISE_USE_FINDERS = DEBUG
+
+# Widths (px) of the responsive variants generated for raster images; the
+# original width is always included and larger widths are skipped.
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
 
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
@@ -148,6 +237,70 @@ LOGOUT_REDIRECT_URL = 'login'
 
 OPENWEATHERMAP_API_KEY = (os.getenv('OPENWEATHERMAP_API_KEY') or '').strip()
 
+# Seconds a stored Observation is reused before the weather API is called again
+OBSERVATION_MAX_AGE = int(os.getenv('OBSERVATION_MAX_AGE', '600'))
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', '600'))
+FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', '1800'))
+# Per-process LRU in front of the shared cache for weather payloads (see
+# core/weather_cache.py): entries are served without any I/O for
+# WEATHER_L1_TTL seconds, then revalidated against their version in the
+# shared cache. 0 entries disables it.
+WEATHER_L1_MAX_ENTRIES = int(os.getenv('WEATHER_L1_MAX_ENTRIES', '512'))
+WEATHER_L1_TTL = int(os.getenv('WEATHER_L1_TTL', '30'))
+# zlib level for weather payloads in the shared cache (see core/codec.py); 0 stores them uncompressed.
+WEATHER_CACHE_COMPRESS_LEVEL = int(os.getenv('WEATHER_CACHE_COMPRESS_LEVEL', '6'))
+
+# Weather providers (see core/providers.py), as dotted class paths. A request
+# still pending after the primary's running p95 latency (but at least
+# WEATHER_HEDGE_MIN_DELAY_MS) is hedged with a second one to
+# WEATHER_HEDGE_PROVIDER, or to the primary again when that is empty.
+WEATHER_PROVIDER = os.getenv('WEATHER_PROVIDER', 'core.providers.OpenWeatherMapProvider')
+WEATHER_HEDGE_ENABLED = os.getenv('WEATHER_HEDGE_ENABLED', '1') == '1'
+WEATHER_HEDGE_PROVIDER = os.getenv('WEATHER_HEDGE_PROVIDER', '')
+WEATHER_HEDGE_MIN_DELAY_MS = int(os.getenv('WEATHER_HEDGE_MIN_DELAY_MS', '100'))
+WEATHER_UPSTREAM_TIMEOUT = float(os.getenv('WEATHER_UPSTREAM_TIMEOUT', '10'))
+# Fetch current weather and the forecast together with one coordinate-based
+# `onecall` request per city (OWM One Call 3.0, or Open-Meteo), cached as one
+# unit for WEATHER_CACHE_TTL. Needs a provider that supports it; with OWM, the
+# key must be subscribed to One Call 3.0.
+WEATHER_ONE_CALL = os.getenv('WEATHER_ONE_CALL', '0') == '1'
+
+OPEN_METEO_URL = os.getenv('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+OPEN_METEO_GEOCODING_URL = os.getenv('OPEN_METEO_GEOCODING_URL', 'https://geocoding-api.open-meteo.com/v1/search')
+
+# Seconds a per-user template fragment is cached; writes invalidate it sooner
+# (see core/fragments.py), this only bounds how stale "N minutes ago" can get.
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '300'))
+
+# Live dashboard updates over Server-Sent Events (see core/live.py)
+LIVE_POLL_INTERVAL = int(os.getenv('LIVE_POLL_INTERVAL', '30'))
+LIVE_KEEPALIVE = int(os.getenv('LIVE_KEEPALIVE', '15'))
+LIVE_STREAM_MAX_AGE = int(os.getenv('LIVE_STREAM_MAX_AGE', '300'))
+LIVE_RETRY_MS = int(os.getenv('LIVE_RETRY_MS', '5000'))
+
+# Adaptive alert checks (see `check_interval` in core/alert_engine.py). A
+# location is checked every run while near a threshold, backing off to at most
+# ALERT_CHECK_MAX_INTERVAL seconds; the minimum matches the cron schedule.
+ALERT_CHECK_MIN_INTERVAL = int(os.getenv('ALERT_CHECK_MIN_INTERVAL', '300'))
+ALERT_CHECK_MAX_INTERVAL = int(os.getenv('ALERT_CHECK_MAX_INTERVAL', '3600'))
+
+# Evaluate a location's alerts as soon as any request stores a new observation
+# for it (see core/alert_events.py), instead of waiting for the next cron run,
+# on up to ALERT_EVENTS_WORKERS threads per process.
+ALERT_EVENTS_ENABLED = os.getenv('ALERT_EVENTS_ENABLED', '1') == '1'
+ALERT_EVENTS_WORKERS = int(os.getenv('ALERT_EVENTS_WORKERS', '4'))
+
+# Chunked user deletion (see core/deletion.py). A running job whose progress
+# has not moved for DELETION_STALE_SECONDS is considered abandoned and may be
+# resumed by `manage.py cleanup_user --resume`.
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', '500'))
+DELETION_STALE_SECONDS = 300
+
+# Cache warming (see `manage.py warm_weather_cache`)
+WARM_CACHE_TOP_N = int(os.getenv('WARM_CACHE_TOP_N', '25'))
+WARM_CACHE_REQUEST_BUDGET = int(os.getenv('WARM_CACHE_REQUEST_BUDGET', '40'))
+WARM_CACHE_LEAD_SECONDS = int(os.getenv('WARM_CACHE_LEAD_SECONDS', '300'))
+
 # Alert allowlist (optional, comma-separated)
 ALERT_ALLOWED_USERNAMES = [u.strip() for u in os.getenv('ALERT_ALLOWED_USERNAMES', '').split(',') if u.strip()]
 ALERT_ALLOWED_EMAILS = [e.strip().lower() for e in os.getenv('ALERT_ALLOWED_EMAILS', '').split(',') if e.strip()]
@@ -163,6 +316,17 @@ EMAIL_HOST_PASSWORD = (os.getenv('EMAIL_HOST_PASSWORD') or '').strip()
 DEFAULT_FROM_EMAIL = (os.getenv('DEFAULT_FROM_EMAIL') or EMAIL_HOST_USER).strip()
 EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '10'))
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.getenv('CORE_LOG_LEVEL', 'INFO')},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 